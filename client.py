@@ -1,12 +1,24 @@
 import os
 from dotenv import load_dotenv
 from lib.game.client.game_client import GameClient
+from lib.tcp.transport import create_transport
 
 load_dotenv()
 
 host = os.environ['HOST']
 port = int(os.environ['PORT'])
 buffer_size = int(os.environ['BUFFER_SIZE'])
+# a Unix domain socket path replaces HOST and PORT for clients running on the same host
+socket_path = os.environ.get('SOCKET_PATH', '')
+# send the moves over the UDP channel of the server (DATAGRAM_PORT) instead of the TCP connection
+datagram_moves = os.environ.get('DATAGRAM_MOVES', '0') == '1'
 
-client = GameClient(host=host, port=port, buffer_size=buffer_size, name='Maze Runner Client')
+client = GameClient(
+    host=host,
+    port=port,
+    buffer_size=buffer_size,
+    name='Maze Runner Client',
+    transport=create_transport(host, port, socket_path),
+    datagram_moves=datagram_moves
+)
 client.run()
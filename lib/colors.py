@@ -0,0 +1,20 @@
+# termcolor is only needed for displaying output, so it is imported on the first colored message
+termcolor_colored = None
+
+
+def colored(text, color=None, on_color=None, attrs=None):
+    """
+    Lazily imported termcolor.colored
+    :param text: text to color
+    :param color: text color
+    :param on_color: background color
+    :param attrs: text attributes
+    :return: colored text
+    """
+    global termcolor_colored
+
+    if termcolor_colored is None:
+        from termcolor import colored as imported_colored
+        termcolor_colored = imported_colored
+
+    return termcolor_colored(text, color, on_color, attrs)
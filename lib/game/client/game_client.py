@@ -1,9 +1,14 @@
-from termcolor import colored
+from lib.colors import colored
 
 from lib.game.client.game_request import Request
-from lib.game.server.game_response import Response
+from lib.game.client.partial_map import PartialMap, PartialMapRenderer
+from lib.game.server.game_response import RESPONSE_TABLE, Response
+from lib.tcp.datagram import DatagramClient
 from lib.tcp.tcp_client import TcpClient
 
+# requests sent over the datagram channel when it is open
+DATAGRAM_REQUESTS = (Request.UP, Request.DOWN, Request.LEFT, Request.RIGHT)
+
 
 def show_menu():
     print(colored('1: Start game', 'yellow'))
@@ -24,14 +29,21 @@ class GameClient(TcpClient):
 
     Attributes:
         current_request (Request): current request to be sent to the server
-        partial_map (list): partial map of the maze from the client's perspective
+        partial_map (PartialMap): partial map of the maze from the client's perspective (None before a game starts)
+        map_renderer (PartialMapRenderer): draws the partial map, redrawing only the changed cells
         character_position (tuple): current position of the character on the map
         steps (int): number of steps taken by the character
+        datagram_moves (bool): whether the moves are sent over the UDP channel of the server
+        datagram_client (DatagramClient): the UDP channel (None until the first game starts in datagram mode)
     """
-    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, name='Game Client'):
-        super().__init__(host, port, buffer_size, name)
+    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, name='Game Client', transport=None,
+                 datagram_moves=False):
+        super().__init__(host, port, buffer_size, name, transport)
+        self.datagram_moves = datagram_moves
+        self.datagram_client = None
         self.current_request = None
-        self.partial_map = []
+        self.partial_map = None
+        self.map_renderer = PartialMapRenderer()
         self.character_position = None
         self.steps = 0
 
@@ -40,22 +52,34 @@ class GameClient(TcpClient):
         Receives a message from the server and maps it to the Response enum.
         :return: Response enum
         """
+        return RESPONSE_TABLE.lookup(self.receive_view(), Response.UNKNOWN)
+
+    def send_request(self, request):
+        """
+        Sends a request and receives its response (over the datagram channel for the moves if it is open)
+        :param request: Request enum
+        :return: Response enum
+        """
+        if self.datagram_client is not None and request in DATAGRAM_REQUESTS:
+            return RESPONSE_TABLE.lookup(self.datagram_client.request(request.encode()), Response.UNKNOWN)
+
+        self.send_message(request)
+        return self.receive_message()
+
+    def open_datagram_channel(self):
+        """
+        Asks the server for the token of the datagram channel of the session
+        """
+        self.send_message(Request.DATAGRAM)
+
         response = super().receive_message()
-        match response:
-            case 'GAME_STARTED':
-                return Response.GAME_STARTED
-            case 'GAME_WON':
-                return Response.GAME_WON
-            case 'GAME_OVER':
-                return Response.GAME_OVER
-            case 'WALL_COLLISION':
-                return Response.WALL_COLLISION
-            case 'OK':
-                return Response.OK
-            case 'ERROR':
-                return Response.ERROR
-            case _:
-                return Response.UNKNOWN
+        print(colored(f'Response: {response}', 'blue'))
+
+        (name, port, token) = response.split(' ')
+        if name != str(Response.DATAGRAM_TOKEN):
+            raise ValueError(f'The server has no datagram channel: {response}')
+
+        self.datagram_client = DatagramClient(self.host, int(port), token)
 
     def run(self):
         """
@@ -100,10 +124,8 @@ class GameClient(TcpClient):
 
                 # if the user input is a request, send it to the server
                 if self.current_request != Request.UNKNOWN and not execute_client_side_command:
-                    self.send_message(self.current_request)
-
-                    # receive the response from the server
-                    response = self.receive_message()
+                    # send the request and receive the response from the server
+                    response = self.send_request(self.current_request)
                     print(colored(f'Response: {response}', 'blue'))
 
                     # map the response to the Response enum
@@ -112,6 +134,9 @@ class GameClient(TcpClient):
                             # initialize the character's position and the partial map
                             self.init_character()
 
+                            if self.datagram_moves and self.datagram_client is None:
+                                self.open_datagram_channel()
+
                             print(colored('Game started! Now you can start controlling your character!', 'green'))
                         case Response.GAME_WON:
                             print(colored('You won! Congratulations!', 'green'))
@@ -146,6 +171,8 @@ class GameClient(TcpClient):
                             self.register_wall_position()
                         case Response.ERROR:
                             print(colored('Something went wrong! Try again!', 'red'))
+                        case Response.BUSY:
+                            print(colored('The server is busy! Wait a bit and try again!', 'red'))
                 # an unknown request was intercepted
                 elif self.current_request == Request.UNKNOWN and not execute_client_side_command:
                     print(colored('Unknown command! Try something else!', 'red'))
@@ -176,54 +203,42 @@ class GameClient(TcpClient):
         character_data = response.split(' ')
         self.character_position = (int(character_data[0]), int(character_data[1]))
 
-        # extract the partial map size and initialize the partial map
-        (map_width, map_height) = (int(character_data[2]), int(character_data[3]))
-        self.partial_map = [['?' for _ in range(map_width)] for _ in range(map_height)]
+        # extract the partial map size (rows, columns) and initialize the partial map
+        self.map_renderer.reset()
+        self.partial_map = PartialMap((int(character_data[2]), int(character_data[3])))
 
     def print_partial_map(self):
-        if len(self.partial_map) == 0:
+        if self.partial_map is None:
             print(colored('You don\'t have a map yet! '
                           'Please initiate a new game session with the server first of all!', 'red'))
             return
 
-        self.partial_map[self.character_position[0]][self.character_position[1]] = 'J'
-
-        for row in self.partial_map:
-            for cell in row:
-                match cell:
-                    case '?':
-                        print(colored(cell, 'yellow'), end=' ')
-                    case 'J':
-                        print(colored(cell, 'green'), end=' ')
-                    case '#':
-                        print(colored(cell, 'blue'), end=' ')
-                    case 'M':
-                        print(colored(cell, 'red'), end=' ')
-                    case 'E':
-                        print(colored(cell, 'cyan'), end=' ')
-                    case _:
-                        print(colored(cell, 'white'), end=' ')
-            print()
-
-        self.partial_map[self.character_position[0]][self.character_position[1]] = ' '
+        self.map_renderer.render(self.partial_map, self.character_position)
 
-    def update_character_position(self):
+    def get_target_position(self):
         """
-        Updates the character's position and the partial map based on the last move (stored in self.current_request).
+        Returns the position targeted by the last move (stored in self.current_request).
+        :return: tuple (row, column)
         """
 
-        self.steps += 1
-        self.partial_map[self.character_position[0]][self.character_position[1]] = ' '
-
         match self.current_request:
             case Request.UP:
-                self.character_position = (self.character_position[0] - 1, self.character_position[1])
+                return self.character_position[0] - 1, self.character_position[1]
             case Request.DOWN:
-                self.character_position = (self.character_position[0] + 1, self.character_position[1])
+                return self.character_position[0] + 1, self.character_position[1]
             case Request.LEFT:
-                self.character_position = (self.character_position[0], self.character_position[1] - 1)
+                return self.character_position[0], self.character_position[1] - 1
             case Request.RIGHT:
-                self.character_position = (self.character_position[0], self.character_position[1] + 1)
+                return self.character_position[0], self.character_position[1] + 1
+
+    def update_character_position(self):
+        """
+        Updates the character's position and the partial map based on the last move (stored in self.current_request).
+        """
+
+        self.steps += 1
+        self.partial_map.set_cell(self.character_position, ' ')
+        self.character_position = self.get_target_position()
 
     def register_wall_position(self):
         """
@@ -231,18 +246,11 @@ class GameClient(TcpClient):
         """
 
         self.steps += 1
-        match self.current_request:
-            case Request.UP:
-                self.partial_map[self.character_position[0] - 1][self.character_position[1]] = '#'
-            case Request.DOWN:
-                self.partial_map[self.character_position[0] + 1][self.character_position[1]] = '#'
-            case Request.LEFT:
-                self.partial_map[self.character_position[0]][self.character_position[1] - 1] = '#'
-            case Request.RIGHT:
-                self.partial_map[self.character_position[0]][self.character_position[1] + 1] = '#'
+        self.partial_map.set_cell(self.get_target_position(), '#')
 
     def clear_map_state(self):
-        self.partial_map = []
+        self.map_renderer.reset()
+        self.partial_map = None
         self.steps = 0
         self.character_position = None
 
@@ -251,27 +259,11 @@ class GameClient(TcpClient):
         Registers the position of a monster on the partial map based on the last move (stored in self.current_request).
         """
 
-        match self.current_request:
-            case Request.UP:
-                self.partial_map[self.character_position[0] - 1][self.character_position[1]] = 'M'
-            case Request.DOWN:
-                self.partial_map[self.character_position[0] + 1][self.character_position[1]] = 'M'
-            case Request.LEFT:
-                self.partial_map[self.character_position[0]][self.character_position[1] - 1] = 'M'
-            case Request.RIGHT:
-                self.partial_map[self.character_position[0]][self.character_position[1] + 1] = 'M'
+        self.partial_map.set_cell(self.get_target_position(), 'M')
 
     def register_exit_position(self):
         """
         Registers the position of the exit on the partial map based on the last move (stored in self.current_request).
         """
 
-        match self.current_request:
-            case Request.UP:
-                self.partial_map[self.character_position[0] - 1][self.character_position[1]] = 'E'
-            case Request.DOWN:
-                self.partial_map[self.character_position[0] + 1][self.character_position[1]] = 'E'
-            case Request.LEFT:
-                self.partial_map[self.character_position[0]][self.character_position[1] - 1] = 'E'
-            case Request.RIGHT:
-                self.partial_map[self.character_position[0]][self.character_position[1] + 1] = 'E'
+        self.partial_map.set_cell(self.get_target_position(), 'E')
@@ -1,17 +1,36 @@
 from enum import Enum
 
+from lib.tcp.fast_io import ByteTable
+
 class Request(Enum):
     """
-    Enum for representing game requests from client to server:
+    Enum for representing game requests from client to server
+    (a request prefixed with a tag, e.g. '@bot7 START 42', is handled by the game of that tag on the connection,
+    created on its first request, and its response gets the same prefix, e.g. '@bot7 GAME_STARTED';
+    '@bot7 STOP' only ends that game and is answered with OK; the tagged games cannot join rooms
+    or spectate, as their broadcasts are not tagged):
 
-    START - start the game
+    START - start the game (e.g. 'START 42' replays the game of the seed 42)
     STOP - stop the game
     UP - move the player up
     DOWN - move the player down
     LEFT - move the player left
     RIGHT - move the player right
-    SEND_PLAYER_DETAILS - send player details to client (player position, matrix size)
+    SEND_PLAYER_DETAILS - send player details to client (player position, matrix size, seed of the game)
     UNKNOWN - unknown request
+    JOIN_ROOM - join the room with the given name (e.g. 'JOIN_ROOM lobby'), sharing its map with other players
+    LEAVE_ROOM - leave the current room
+    PROFILE - admin request controlling the server profiler (e.g. 'PROFILE 30' captures cProfile for 30 seconds)
+    NAME - set the player name under which the won games are recorded in the leaderboard (e.g. 'NAME alice')
+    TOP - send the best players of the leaderboard (e.g. 'TOP 5', 10 players by default)
+    RANK - send the leaderboard rank of a player (e.g. 'RANK alice', the player of the session by default)
+    SPECTATE - stream the private games of another session (e.g. 'SPECTATE alice' or 'SPECTATE 127.0.0.1:50000'),
+        'SPECTATE' alone stops spectating (the games of chunked maps are too large for a snapshot and are not streamed)
+    MEMORY - admin request reporting the memory of the server: 'MEMORY' (totals by component and budget),
+        'MEMORY sessions' (largest sessions), 'MEMORY trace on' / 'MEMORY trace off' (tracemalloc),
+        'MEMORY snapshot' (traced memory by source file, compared to the previous snapshot)
+    DATAGRAM - open the UDP channel of the session: its moves can then be sent as 'token sequence UP' datagrams,
+        answered with 'sequence OK' datagrams (see DATAGRAM_TOKEN)
     """
 
     START = 1,
@@ -22,9 +41,22 @@ class Request(Enum):
     RIGHT = 6,
     SEND_PLAYER_DETAILS = 7,
     UNKNOWN = 8,
+    JOIN_ROOM = 9,
+    LEAVE_ROOM = 10,
+    PROFILE = 11,
+    NAME = 12,
+    TOP = 13,
+    RANK = 14,
+    SPECTATE = 15,
+    MEMORY = 16,
+    DATAGRAM = 17,
 
     def __str__(self):
         return self.name
 
-    def encode(self):
-        return self.name.encode()
+    def encode(self, framed=False):
+        return REQUEST_TABLE.encode(self, framed)
+
+
+# precomputed wire representation of every request
+REQUEST_TABLE = ByteTable(Request)
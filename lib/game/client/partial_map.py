@@ -0,0 +1,164 @@
+import shutil
+import sys
+
+from lib.colors import colored
+
+# colors of the cells of the partial map
+CELL_COLORS = {
+    '?': 'yellow',
+    'J': 'green',
+    '#': 'blue',
+    'M': 'red',
+    'E': 'cyan',
+    ' ': 'white',
+}
+
+UNKNOWN_CELL = ord('?')
+CHARACTER_CELL = ord('J')
+
+
+class PartialMap:
+    """
+    Client's knowledge of the maze, stored as a compact byte grid (one byte per cell, row-major)
+
+    Attributes:
+        map_size (tuple): the map size (rows, columns)
+        cells (bytearray): the known cells ('?' for unknown, '#' for walls, ' ' for visited cells, 'M', 'E')
+    """
+
+    def __init__(self, map_size):
+        self.map_size = map_size
+        self.cells = bytearray(b'?' * (map_size[0] * map_size[1]))
+
+    def set_cell(self, position, value):
+        """
+        :param position: tuple (row, column)
+        :param value: single-character string
+        """
+        self.cells[position[0] * self.map_size[1] + position[1]] = ord(value)
+
+    def get_cell(self, position):
+        return chr(self.cells[position[0] * self.map_size[1] + position[1]])
+
+    def get_frame(self, character_position):
+        """
+        Returns the cells with the character drawn on them
+        :param character_position: tuple (row, column)
+        :return: bytearray
+        """
+        frame = bytearray(self.cells)
+        frame[character_position[0] * self.map_size[1] + character_position[1]] = CHARACTER_CELL
+        return frame
+
+
+class PartialMapRenderer:
+    """
+    Incremental terminal renderer of the partial map
+
+    The first frame is drawn in full at the top of the screen and the rest of the output scrolls below it.
+    Every following frame only redraws the cells which changed since the last frame, moving the cursor
+    there with ANSI escapes. Outputs which are not terminals, and maps which do not fit on the terminal above
+    the scrolling output, get a full repaint every time.
+
+    Attributes:
+        output (file): the output stream
+        last_frame (bytearray): the last drawn frame (None if nothing is on the screen)
+        cell_sequences (dict): cell byte -> colored cell (filled on first use, so that termcolor is imported lazily)
+    """
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.last_frame = None
+        self.cell_sequences = {}
+
+    def get_cell_sequence(self, cell):
+        sequence = self.cell_sequences.get(cell)
+        if sequence is None:
+            sequence = colored(chr(cell), CELL_COLORS.get(chr(cell), 'white'))
+            self.cell_sequences[cell] = sequence
+        return sequence
+
+    def is_live(self):
+        return hasattr(self.output, 'isatty') and self.output.isatty()
+
+    @staticmethod
+    def fits_terminal(map_size):
+        """
+        Checks if the map fits on the terminal with at least one line of scrolling output below it
+        (a larger map would make the scroll region invalid and the cells unreachable by the cursor)
+        :param map_size: tuple (rows, columns)
+        :return: bool
+        """
+        terminal_size = shutil.get_terminal_size()
+        return map_size[0] + 2 <= terminal_size.lines and 2 * map_size[1] <= terminal_size.columns
+
+    def render(self, partial_map, character_position):
+        """
+        Draw the partial map, redrawing only the changed cells when possible
+        :param partial_map: PartialMap
+        :param character_position: tuple (row, column)
+        """
+        frame = partial_map.get_frame(character_position)
+
+        if not self.is_live() or not self.fits_terminal(partial_map.map_size):
+            # full repaint (giving the screen back to the scrolling output if the terminal was resized)
+            self.reset()
+            self.output.write(self.draw_rows(frame, partial_map.map_size))
+            self.output.flush()
+            return
+
+        if self.last_frame is None or len(self.last_frame) != len(frame):
+            self.output.write(self.draw_first_frame(frame, partial_map.map_size))
+        else:
+            self.output.write(self.draw_changes(frame, partial_map.map_size))
+
+        self.output.flush()
+        self.last_frame = frame
+
+    def draw_rows(self, frame, map_size):
+        (rows, cols) = map_size
+        lines = []
+
+        for row in range(rows):
+            cells = frame[row * cols:(row + 1) * cols]
+            lines.append(' '.join(self.get_cell_sequence(cell) for cell in cells) + ' \n')
+
+        return ''.join(lines)
+
+    def draw_first_frame(self, frame, map_size):
+        terminal_rows = shutil.get_terminal_size().lines
+
+        # clear the screen, draw the map at the top, then let the rest of the output scroll below it
+        return (
+            '\x1b[2J\x1b[H'
+            + self.draw_rows(frame, map_size)
+            + f'\x1b[{map_size[0] + 2};{terminal_rows}r'
+            + f'\x1b[{terminal_rows};1H'
+        )
+
+    def draw_changes(self, frame, map_size):
+        cols = map_size[1]
+        sequences = ['\x1b7']
+
+        for row in range(map_size[0]):
+            start = row * cols
+            # skip the unchanged rows with a single comparison
+            if frame[start:start + cols] == self.last_frame[start:start + cols]:
+                continue
+
+            for col in range(cols):
+                if frame[start + col] != self.last_frame[start + col]:
+                    sequences.append(f'\x1b[{row + 1};{2 * col + 1}H')
+                    sequences.append(self.get_cell_sequence(frame[start + col]))
+
+        sequences.append('\x1b8')
+        return ''.join(sequences)
+
+    def reset(self):
+        """
+        Forget the drawn frame and give the whole screen back to the scrolling output
+        """
+        if self.last_frame is not None and self.is_live():
+            self.output.write('\x1b[r')
+            self.output.flush()
+        self.last_frame = None
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """
+    Token bucket used for limiting the request rate of a single client
+
+    Attributes:
+        rate (float): number of tokens added to the bucket per second
+        capacity (float): maximum number of tokens the bucket can hold (burst size)
+        tokens (float): number of tokens currently available
+        last_refill (float): monotonic timestamp of the last refill
+    """
+
+    def __init__(self, rate=20.0, capacity=40.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+
+    def refill(self):
+        """
+        Add the tokens accumulated since the last refill, without exceeding the capacity
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def consume(self, tokens=1):
+        """
+        Try to consume tokens from the bucket
+        :param tokens: number of tokens to consume
+        :return: True if the tokens were available, False if the client must back off
+        """
+        self.refill()
+
+        if self.tokens < tokens:
+            return False
+
+        self.tokens -= tokens
+        return True
+
+    def resize(self, rate, capacity):
+        """
+        Grow the bucket by the budget of one more client sharing it (or shrink it, with negative values)
+        :param rate: tokens per second added to the rate
+        :param capacity: tokens added to the capacity (and to the available tokens when growing)
+        """
+        self.refill()
+
+        self.rate += rate
+        self.capacity += capacity
+        self.tokens = min(self.capacity, self.tokens + max(capacity, 0))
+
+
+class AdmissionController:
+    """
+    Admission controller which caps the number of clients served at the same time
+
+    Clients accepted while all slots are taken wait in a bounded pending queue and are admitted
+    (in FIFO order) as soon as a slot is released. When the pending queue is full as well, the
+    client must be rejected, and so must a pending client which waited longer than max_pending_wait.
+
+    Attributes:
+        max_clients (int): maximum number of clients served at the same time
+        max_pending (int): maximum number of accepted clients waiting for a slot
+        max_pending_wait (float): seconds a client can wait for a slot (0 to wait forever)
+        active_clients (int): number of clients currently served
+        pending_clients (deque): (client, time.monotonic() deadline) of the accepted clients waiting for a slot
+    """
+
+    def __init__(self, max_clients=64, max_pending=16, max_pending_wait=30.0):
+        self.max_clients = max_clients
+        self.max_pending = max_pending
+        self.max_pending_wait = max_pending_wait
+        self.active_clients = 0
+        self.pending_clients = deque()
+        self.mutex = threading.Lock()
+
+    def try_admit(self):
+        """
+        Try to take a slot for a newly accepted client
+        :return: True if the client was admitted, False if all slots are taken
+        """
+        with self.mutex:
+            # clients that are already waiting have priority over the new one
+            if self.active_clients >= self.max_clients or len(self.pending_clients) > 0:
+                return False
+
+            self.active_clients += 1
+            return True
+
+    def enqueue(self, client):
+        """
+        Put an accepted client in the pending queue
+        :param client: the pending client (e.g. a tuple of socket and address)
+        :return: True if the client was queued, False if the pending queue is full
+        """
+        with self.mutex:
+            if len(self.pending_clients) >= self.max_pending:
+                return False
+
+            deadline = time.monotonic() + self.max_pending_wait if self.max_pending_wait > 0 else float('inf')
+            self.pending_clients.append((client, deadline))
+            return True
+
+    def release(self):
+        """
+        Release the slot of a disposed client. If a client is pending, the slot is handed over to it.
+        :return: the pending client which was admitted, or None if the slot was freed
+        """
+        with self.mutex:
+            if len(self.pending_clients) > 0:
+                return self.pending_clients.popleft()[0]
+
+            self.active_clients = max(0, self.active_clients - 1)
+            return None
+
+    def expire(self, now):
+        """
+        Remove the pending clients whose wait is over
+        :param now: time.monotonic() value
+        :return: list of the expired clients (to be rejected)
+        """
+        expired = []
+        with self.mutex:
+            # the clients wait the same time, so the deadlines are in queue order
+            while len(self.pending_clients) > 0 and self.pending_clients[0][1] <= now:
+                expired.append(self.pending_clients.popleft()[0])
+
+        return expired
+
+    def get_stats(self):
+        """
+        :return: tuple of (active clients, pending clients)
+        """
+        with self.mutex:
+            return self.active_clients, len(self.pending_clients)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from lib.game.server.admission_control import TokenBucket
+from lib.tcp.fast_io import ReceiveBuffer
+
+
+class ClientSession:
+    """
+    Server-side state of a connected client, or of one of the games multiplexed over its connection
+    (the requests tagged '@tag REQUEST', see Request)
+
+    Attributes:
+        client_socket (socket): client socket (communication channel)
+        address (tuple): client address
+        game_map (Map): game map of the current game (None until the game is started)
+        rate_limiter (TokenBucket): limits the request rate of the client (the one of the connection is also charged
+            for the requests of its tagged games, and grows by the budget of each of them)
+        receive_buffer (ReceiveBuffer): preallocated receive buffer of the client connection
+        outbox (list): encoded responses waiting to be sent together
+        request_argument (str): argument of the last received request (None if it had no argument)
+        room (GameRoom): the room the client plays in (None for a private game)
+        needs_room_snapshot (bool): whether the next room broadcast must contain all the player positions
+        pending_broadcast (bytearray): rest of a partially sent room broadcast
+        send_lock (Lock): serializes the responses and the broadcasts sent to the client
+        move_lock (Lock): serializes the moves of the game, received over TCP or over the datagram channel
+        steps (int): number of moves requested in the current game
+        player_name (str): name under which the won games are recorded (None until the client sends NAME)
+        spectator_stream (SpectatorStream): stream of the games of the client (None until someone spectates them)
+        spectating (SpectatorStream): stream the client spectates (None if it does not spectate)
+        last_activity (float): time.monotonic() of the last request (or of the connection)
+        handshaken (bool): whether the client sent its first request
+        datagram_token (str): token of the UDP channel of the session (None until the client sends DATAGRAM)
+        connection (ClientSession): the session owning the connection (the session itself if it is not a tagged game)
+        tag (str): tag of the game on its connection (None for the session owning the connection)
+        tagged_sessions (dict): tag -> ClientSession of the games multiplexed over the connection
+        request_tag (str): tag of the last received request (None if it was not tagged)
+    """
+
+    def __init__(self, client_socket, address, rate_limit=20.0, rate_burst=40.0, buffer_size=1024,
+                 connection=None, tag=None):
+        self.client_socket = client_socket
+        self.address = address
+        self.game_map = None
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        # the tagged games share the buffers and the send lock of their connection
+        self.receive_buffer = connection.receive_buffer if connection is not None else ReceiveBuffer(buffer_size)
+        self.outbox = connection.outbox if connection is not None else []
+        self.request_argument = None
+        self.room = None
+        self.needs_room_snapshot = False
+        self.pending_broadcast = connection.pending_broadcast if connection is not None else bytearray()
+        self.send_lock = connection.send_lock if connection is not None else threading.Lock()
+        self.move_lock = threading.Lock()
+        self.steps = 0
+        self.player_name = None
+        self.spectator_stream = None
+        self.spectating = None
+        self.last_activity = time.monotonic()
+        self.handshaken = False
+        self.datagram_token = None
+        self.connection = connection or self
+        self.tag = tag
+        self.tagged_sessions = {}
+        self.request_tag = None
@@ -0,0 +1,136 @@
+import secrets
+import socket
+import threading
+from collections import OrderedDict
+
+from lib.colors import colored
+from lib.tcp.datagram import encode_datagram, parse_datagram
+
+
+class DatagramPeer:
+    """
+    Sequencing state of the datagram channel of one session
+
+    Attributes:
+        address (tuple): address of the TCP session the datagrams act on
+        peer_address (tuple): address the last valid datagram came from (the responses are sent there)
+        last_sequence (int): sequence number of the last applied request
+        pending (dict): sequence number -> request received ahead of a missing one
+        responses (OrderedDict): sequence number -> encoded response of the last applied requests
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.peer_address = None
+        self.last_sequence = 0
+        self.pending = {}
+        self.responses = OrderedDict()
+
+
+class DatagramChannel:
+    """
+    UDP channel carrying the moves of the sessions which opened it over TCP (DATAGRAM request)
+
+    Every datagram carries the session token and a sequence number. The requests are applied exactly once
+    and in sequence order: a retry of an applied request is answered from the recent responses without moving
+    again, and a request received ahead of a missing one waits (within a bounded window) until the client
+    retries the missing one. A lost datagram only delays the moves sent after it by one client retry interval.
+
+    Attributes:
+        handle_request (callable): applies a request of a session, (address, message) -> Response enum
+        window (int): maximum distance of a buffered request ahead of the last applied one
+        history (int): number of responses kept for answering the retries
+        peers (dict): token -> DatagramPeer
+        datagram_socket (socket): the bound UDP socket
+    """
+
+    def __init__(self, handle_request, host='127.0.0.1', port=0, window=32, history=64):
+        self.handle_request = handle_request
+        self.window = window
+        self.history = history
+        self.peers = {}
+        self.mutex = threading.Lock()
+        self.datagram_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.datagram_socket.bind((host, port))
+
+    def get_port(self):
+        return self.datagram_socket.getsockname()[1]
+
+    def register(self, address):
+        """
+        Open the channel for a session
+        :param address: address of the TCP session
+        :return: str (the token of the session)
+        """
+        token = secrets.token_hex(8)
+        with self.mutex:
+            self.peers[token] = DatagramPeer(address)
+
+        return token
+
+    def unregister(self, token):
+        with self.mutex:
+            self.peers.pop(token, None)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        print(colored(f'Datagram channel is listening on address: {self.datagram_socket.getsockname()}', 'green'))
+
+    def run(self):
+        """
+        Main loop of the channel thread
+        """
+        while True:
+            try:
+                (data, peer_address) = self.datagram_socket.recvfrom(65535)
+            except OSError:
+                # the channel was closed
+                return
+
+            try:
+                self.receive(data, peer_address)
+            except Exception as e:
+                print(colored(f'Error while handling a datagram from {peer_address}: {e}', 'red'))
+
+    def receive(self, data, peer_address):
+        """
+        Apply the requests of a datagram (and of the buffered ones it unblocks) and send their responses
+        :param data: bytes
+        :param peer_address: address of the sender
+        """
+        datagram = parse_datagram(data)
+        if datagram is None:
+            return
+
+        (token, sequence, message) = datagram
+        with self.mutex:
+            peer = self.peers.get(token)
+        if peer is None:
+            return
+
+        peer.peer_address = peer_address
+
+        if sequence <= peer.last_sequence:
+            # a retry: its response was lost, send it again (too old retries are dropped)
+            response = peer.responses.get(sequence)
+            if response is not None:
+                self.datagram_socket.sendto(response, peer_address)
+            return
+
+        if sequence > peer.last_sequence + self.window:
+            return
+
+        peer.pending[sequence] = message
+        while peer.last_sequence + 1 in peer.pending:
+            peer.last_sequence += 1
+            request = peer.pending.pop(peer.last_sequence)
+
+            response = encode_datagram(None, peer.last_sequence, self.handle_request(peer.address, request).encode())
+            peer.responses[peer.last_sequence] = response
+            if len(peer.responses) > self.history:
+                peer.responses.popitem(last=False)
+
+            self.datagram_socket.sendto(response, peer_address)
+
+    def close(self):
+        self.datagram_socket.close()
@@ -1,5 +1,7 @@
 from enum import Enum
 
+from lib.tcp.fast_io import ByteTable
+
 class Response(Enum):
     """
     Enum for representing game responses from server to client:
@@ -10,6 +12,19 @@ class Response(Enum):
     OK - the player can move
     UNKNOWN - unknown response
     WALL_COLLISION - the player hit a wall
+    BUSY - the server is overloaded or the client exceeded its request rate, the client should back off
+    PLAYER_COLLISION - the player hit another player of the room
+    ROOM_STATE - batched position updates of the players of a room (broadcast once per tick)
+    LEADERBOARD - leaderboard entries: 'LEADERBOARD rank name steps;rank name steps;...'
+    SPECTATE_SNAPSHOT - full state of a spectated game:
+        'SPECTATE_SNAPSHOT rows cols seed player_row player_col monster_row monster_col grid'
+        (grid: run-length encoded row-major cells, '#' wall, 'E' exit, '.' empty, e.g. '12#.E' for 12 walls)
+    SPECTATE_DELTA - event of a spectated game: 'SPECTATE_DELTA P row col' (player moved),
+        'SPECTATE_DELTA M row col' (monster moved), 'SPECTATE_DELTA GAME_WON', 'SPECTATE_DELTA GAME_OVER'
+        or 'SPECTATE_DELTA END' (the spectated session left its private game or disconnected)
+    MEMORY_REPORT - estimated memory of the server (admin): 'MEMORY_REPORT name bytes;name bytes;...'
+        (see MEMORY for the reported entries)
+    DATAGRAM_TOKEN - the UDP channel of the session is open: 'DATAGRAM_TOKEN port token'
     """
 
     OK = 1,
@@ -19,9 +34,21 @@ class Response(Enum):
     GAME_OVER = 5,
     ERROR = 6,
     UNKNOWN = 7,
+    BUSY = 8,
+    PLAYER_COLLISION = 9,
+    ROOM_STATE = 10,
+    LEADERBOARD = 11,
+    SPECTATE_SNAPSHOT = 12,
+    SPECTATE_DELTA = 13,
+    MEMORY_REPORT = 14,
+    DATAGRAM_TOKEN = 15,
 
     def __str__(self):
         return self.name
 
-    def encode(self):
-        return self.name.encode()
\ No newline at end of file
+    def encode(self, framed=False):
+        return RESPONSE_TABLE.encode(self, framed)
+
+
+# precomputed wire representation of every response
+RESPONSE_TABLE = ByteTable(Response)
@@ -0,0 +1,219 @@
+import random
+import socket
+import threading
+
+from lib.game.server.game_response import Response
+from lib.map.map_entity import MapEntity
+
+
+def get_player_id(address):
+    """
+    Returns the id of a player used in room state updates
+    :param address: client address ('host:port'), or client address and tag of a multiplexed game ('host:port@tag')
+    :return: str
+    """
+    if isinstance(address, tuple) and len(address) > 2:
+        return f'{address[0]}:{address[1]}@{address[2]}'
+    if isinstance(address, tuple):
+        return f'{address[0]}:{address[1]}'
+    return str(address)
+
+
+class OccupancyGrid:
+    """
+    Set of the cells taken by the players of a room, stored as one byte per cell of the map (row-major)
+
+    Attributes:
+        cols (int): number of columns of the map
+        cells (bytearray): 1 for every cell taken by a player
+    """
+
+    def __init__(self, map_size):
+        self.cols = map_size[1]
+        self.cells = bytearray(map_size[0] * map_size[1])
+
+    def __contains__(self, position):
+        return self.cells[position[0] * self.cols + position[1]] != 0
+
+    def add(self, position):
+        self.cells[position[0] * self.cols + position[1]] = 1
+
+    def discard(self, position):
+        self.cells[position[0] * self.cols + position[1]] = 0
+
+
+class GameRoom:
+    """
+    Game room in which many players share one map instance
+
+    Moves are checked against the shared map and against an occupancy grid, so two players can never stand
+    on the same cell. Position changes are collected and sent to the room members in one batched
+    ROOM_STATE message per tick, encoded once and written to every member.
+
+    Attributes:
+        name (str): room name
+        game_map (Map): the shared game map
+        occupancy (OccupancyGrid or set): positions taken by a player (a set for a chunked map, whose grid
+            would not fit in memory)
+        positions (dict): addr -> position of the player
+        members (dict): addr -> ClientSession
+        changes (dict): addr -> new position (None if the player left) since the last broadcast
+        spawn_positions (list): positions where players can be spawned
+        rng (Random): chooses the spawn positions, seeded with the seed of the map
+    """
+
+    def __init__(self, name, game_map):
+        self.name = name
+        self.game_map = game_map
+        self.occupancy = set() if game_map.chunked else OccupancyGrid(game_map.map_size)
+        self.positions = {}
+        self.members = {}
+        self.changes = {}
+        self.spawn_positions = game_map.get_player_valid_positions()
+        self.rng = random.Random(game_map.seed)
+        self.mutex = threading.Lock()
+
+    def is_empty(self):
+        return len(self.members) == 0
+
+    def join(self, session):
+        """
+        Spawn the player of the session on a free cell of the shared map
+        :param session: ClientSession
+        :return: the player position
+        """
+        with self.mutex:
+            free_positions = [
+                position for position in self.spawn_positions
+                if position not in self.occupancy
+                and self.game_map.get_value_at(position) != MapEntity.MONSTER
+            ]
+            if len(free_positions) == 0:
+                raise ValueError(f'Room {self.name} is full')
+
+            position = self.rng.choice(free_positions)
+            self.occupancy.add(position)
+            self.positions[session.address] = position
+            self.members[session.address] = session
+            # the new member needs the positions of all the players, not only the changed ones
+            session.needs_room_snapshot = True
+            self.changes[session.address] = position
+
+            return position
+
+    def leave(self, address):
+        """
+        Remove the player from the room
+        :param address: client address
+        """
+        with self.mutex:
+            position = self.positions.pop(address, None)
+            self.members.pop(address, None)
+
+            if position is not None:
+                self.occupancy.discard(position)
+                self.changes[address] = None
+
+    def get_player_details(self, address):
+        return self.positions[address], self.game_map.map_size, self.game_map.seed
+
+    def try_to_move(self, address, dx, dy):
+        """
+        Try to move the player in the given direction on the shared map
+        :param address: client address
+        :param dx: x direction
+        :param dy: y direction
+        :return: Response enum
+        """
+        with self.mutex:
+            (row, col) = self.positions[address]
+            next_position = (row + dx, col + dy)
+
+            if not self.game_map.is_in_matrix(*next_position):
+                return Response.ERROR
+
+            match self.game_map.get_value_at(next_position):
+                case MapEntity.WALL:
+                    return Response.WALL_COLLISION
+                case MapEntity.EXIT:
+                    return Response.GAME_WON
+                case MapEntity.MONSTER:
+                    return Response.GAME_OVER
+
+            if next_position in self.occupancy:
+                return Response.PLAYER_COLLISION
+
+            self.occupancy.discard((row, col))
+            self.occupancy.add(next_position)
+            self.positions[address] = next_position
+            self.changes[address] = next_position
+
+            return Response.OK
+
+    def encode_state(self, positions):
+        """
+        Encode player positions as one ROOM_STATE message: 'ROOM_STATE id row col;id row col;...'
+        (a player who left the room has the position -1 -1)
+        :param positions: dict of addr -> position or None
+        :return: bytes
+        """
+        entries = ';'.join(
+            f'{get_player_id(address)} {position[0]} {position[1]}' if position is not None
+            else f'{get_player_id(address)} -1 -1'
+            for address, position in positions.items()
+        )
+        return f'{Response.ROOM_STATE} {entries}\n'.encode()
+
+    def broadcast(self):
+        """
+        Send the position changes since the last tick to all the members, as one batched message
+        """
+        with self.mutex:
+            if len(self.changes) == 0:
+                return
+
+            changes_payload = self.encode_state(self.changes)
+            snapshot_payload = None
+            self.changes = {}
+            members = list(self.members.values())
+
+            for member in members:
+                if member.needs_room_snapshot:
+                    if snapshot_payload is None:
+                        snapshot_payload = self.encode_state(self.positions)
+                    member.needs_room_snapshot = not send_nowait(member, snapshot_payload)
+                elif not send_nowait(member, changes_payload):
+                    # the member missed an update, so it gets all the positions on the next tick
+                    member.needs_room_snapshot = True
+
+
+def send_nowait(session, payload, broadcast=True):
+    """
+    Send a broadcast payload to a session without blocking on a slow client.
+    Only clients which frame their messages with new lines can tell broadcasts apart from responses.
+    :param session: ClientSession
+    :param payload: bytes
+    :param broadcast: whether the payload is a broadcast (False for a response, sent to every client)
+    :return: True if the payload was sent (or queued behind a partially sent one), False if it was dropped
+    """
+    if broadcast and not session.receive_buffer.framed:
+        return True
+
+    if not session.send_lock.acquire(blocking=False):
+        return False
+
+    try:
+        if len(session.pending_broadcast) > 0:
+            sent = session.client_socket.send(session.pending_broadcast, socket.MSG_DONTWAIT)
+            del session.pending_broadcast[:sent]
+            if len(session.pending_broadcast) > 0:
+                return False
+
+        sent = session.client_socket.send(payload, socket.MSG_DONTWAIT)
+        # keep the rest of a partially sent message, so that the next message is not interleaved with it
+        session.pending_broadcast += payload[sent:]
+        return True
+    except (BlockingIOError, OSError):
+        return False
+    finally:
+        session.send_lock.release()
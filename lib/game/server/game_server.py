@@ -1,36 +1,61 @@
-from termcolor import colored
+import sys
 
-from lib.game.client.game_request import Request
+from lib.colors import colored
+
+from lib.game.client.game_request import REQUEST_TABLE, Request
 from lib.game.server.game_response import Response
+from lib.game.server.game_room import get_player_id
+from lib.game.server.memory_accounting import MemoryTracer, encode_report, get_socket_buffer_size
+from lib.game.server.profiler import Profiler, profiled
 from lib.map.map_entity import MapEntity
 from lib.map.random_generator import get_random_map
 from lib.tcp.tcp_server import TcpServer
 
 
-def map_request_to_enum(request):
+def parse_request(message):
     """
-    Map request to Request enum
-    :param request:
-    :return: Request enum
+    Map received message to Request enum and its argument (e.g. 'JOIN_ROOM lobby').
+    Requests without an argument are mapped without decoding the message.
+    :param message: bytes-like object
+    :return: tuple of (Request enum, argument string or None)
     """
-    match request:
-        case 'START':
-            return Request.START
-        case 'STOP':
-            return Request.STOP
-        case 'UP':
-            return Request.UP
-        case 'DOWN':
-            return Request.DOWN
-        case 'LEFT':
-            return Request.LEFT
-        case 'RIGHT':
-            return Request.RIGHT
-        case 'SEND_PLAYER_DETAILS':
-            return Request.SEND_PLAYER_DETAILS
-        case value:
-            print(colored(f'Unknown request: {value}', 'red'))
-            return Request.UNKNOWN
+    request = REQUEST_TABLE.lookup(message)
+    if request is not None:
+        return request, None
+
+    (name, _, argument) = str(message, 'utf-8', 'replace').partition(' ')
+    request = REQUEST_TABLE.lookup(name.encode())
+
+    if request is None or argument == '':
+        print(colored(f'Unknown request: {str(message, "utf-8", "replace")}', 'red'))
+        return Request.UNKNOWN, None
+
+    return request, argument.strip()
+
+
+def parse_seed(argument):
+    """
+    Parse the seed of a 'START <seed>' request
+    :param argument: request argument
+    :return: int seed, None if the request has no seed
+    :raise ValueError: if the argument is not a non-negative integer
+    """
+    if argument is None:
+        return None
+
+    if not argument.isdigit():
+        raise ValueError(f'Invalid seed: {argument}')
+
+    return int(argument)
+
+
+def format_player_details(player_details):
+    """
+    :param player_details: tuple of (player position, map size, seed)
+    :return: 'row col rows cols seed'
+    """
+    ((row, col), (rows, cols), seed) = player_details
+    return f'{row} {col} {rows} {cols} {seed}'
 
 
 class GameServer(TcpServer):
@@ -41,21 +66,38 @@ class GameServer(TcpServer):
 
     Attributes:
         game_map (Map): game map
+        request_argument (str): argument of the last received request (None if it had no argument)
+        profiler (Profiler): profiler of the request handling (configured by the PROFILE* environment variables)
+        admin_hosts (tuple): hosts allowed to send admin requests (e.g. PROFILE), 'unix' for Unix domain socket clients
+        memory_tracer (MemoryTracer): tracemalloc snapshots taken by the MEMORY admin requests
     """
-    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, max_connections=3, name='Game Server'):
-        super().__init__(host, port, buffer_size, max_connections, name)
+    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, max_connections=3, name='Game Server',
+                 profiler=None, admin_hosts=('127.0.0.1', '::1', 'unix'), transport=None):
+        super().__init__(host, port, buffer_size, max_connections, name, transport)
         self.game_map = None
+        self.request_argument = None
+        self.profiler = profiler or Profiler.from_env()
+        self.admin_hosts = admin_hosts
+        self.memory_tracer = MemoryTracer()
 
     def receive_message(self):
         """
         Receive message from client, decode it and map it to Request enum
         :return: Request enum
         """
-        request = super().receive_message()
+        message = self.receive_view()
+
+        # a zero-byte read: the client closed the connection, so the game is over
+        if self.receive_buffer.closed:
+            print(colored('Client disconnected', 'yellow'))
+            return Request.STOP
+
+        (request, self.request_argument) = parse_request(message)
         print(colored(f'Request received from client: {request}', 'blue'))
 
-        return map_request_to_enum(request)
+        return request
 
+    @profiled('send')
     def send_message(self, message):
         """
         log message and send it to client
@@ -73,47 +115,142 @@ class GameServer(TcpServer):
         self.accept_client()
 
         while True:
-            try:
-                # receive request from client
-                request = self.receive_message()
-
-                # handle request
-                match request:
-                    case Request.START:
-                        # initialize game map and print it on the server terminal
-                        self.init_game_map()
-                        self.game_map.print_map()
-
-                        self.send_message(Response.GAME_STARTED)
-                    case Request.STOP:
-                        # stop the game
-                        break
-                    case Request.SEND_PLAYER_DETAILS:
-                        # send player details to client
-                        player_details = self.game_map.get_player_details()
-                        player_details = f"{player_details[0][0]} {player_details[0][1]} {player_details[1][0]} {player_details[1][1]}"
-                        self.send_message(player_details)
-                    case Request.UP:
-                        self.try_to_move_player(-1, 0)
-                    case Request.DOWN:
-                        self.try_to_move_player(1, 0)
-                    case Request.LEFT:
-                        self.try_to_move_player(0, -1)
-                    case Request.RIGHT:
-                        self.try_to_move_player(0, 1)
-                    case Request.UNKNOWN:
-                        self.send_message(Response.ERROR)
-
-            except Exception as e:
-                print(colored(f'Error: {e}', 'red'))
-                self.send_message(Response.ERROR)
-
-    def init_game_map(self):
+            with self.profiler.request():
+                try:
+                    # receive request from client
+                    with self.profiler.span('receive'):
+                        request = self.receive_message()
+
+                    # handle request
+                    with self.profiler.span('dispatch'):
+                        match request:
+                            case Request.START:
+                                # initialize game map (from the seed of 'START <seed>') and print it on the server terminal
+                                self.init_game_map(parse_seed(self.request_argument))
+                                self.game_map.print_map()
+
+                                self.send_message(Response.GAME_STARTED)
+                            case Request.STOP:
+                                # stop the game
+                                break
+                            case Request.SEND_PLAYER_DETAILS:
+                                # send player details to client
+                                self.send_message(format_player_details(self.game_map.get_player_details()))
+                            case Request.UP:
+                                self.try_to_move_player(-1, 0)
+                            case Request.DOWN:
+                                self.try_to_move_player(1, 0)
+                            case Request.LEFT:
+                                self.try_to_move_player(0, -1)
+                            case Request.RIGHT:
+                                self.try_to_move_player(0, 1)
+                            case Request.PROFILE:
+                                self.send_message(self.handle_profile_request(self.client_address, self.request_argument))
+                            case Request.MEMORY:
+                                self.send_message(self.handle_memory_request(self.client_address, self.request_argument))
+                            case Request.UNKNOWN:
+                                self.send_message(Response.ERROR)
+
+                except Exception as e:
+                    print(colored(f'Error: {e}', 'red'))
+                    self.send_message(Response.ERROR)
+
+    def handle_profile_request(self, address, argument):
+        """
+        Handle an admin PROFILE request:
+        'PROFILE on' / 'PROFILE off' - enable / disable the sampled timing spans
+        'PROFILE dump' - write the recorded spans (collapsed-stack format), responds with the file path
+        'PROFILE <seconds>' - run every request of the next seconds under cProfile (written as pstats and as a table
+            of call edges)
+        :param address: client address
+        :param argument: request argument
+        :return: response message
+        """
+        if not self.is_admin(address):
+            return Response.ERROR
+
+        match argument:
+            case 'on':
+                self.profiler.set_enabled(True)
+            case 'off':
+                self.profiler.set_enabled(False)
+            case 'dump':
+                return self.profiler.dump_spans()
+            case value if value is not None and value.isdigit():
+                if not self.profiler.capture(int(value)):
+                    return Response.BUSY
+            case _:
+                return Response.ERROR
+
+        return Response.OK
+
+    def handle_memory_request(self, address, argument):
+        """
+        Handle an admin MEMORY request:
+        'MEMORY' - estimated memory by component (private maps, room maps, buffers, queued socket bytes, thread stacks)
+        'MEMORY sessions' - the largest sessions, 'player_id bytes'
+        'MEMORY trace on' / 'MEMORY trace off' - start / stop tracing the allocations with tracemalloc
+        'MEMORY snapshot' - traced memory by source file, 'file bytes bytes_since_previous_snapshot blocks'
+        :param address: client address
+        :param argument: request argument
+        :return: response message
+        """
+        if not self.is_admin(address):
+            return Response.ERROR
+
+        match argument:
+            case None:
+                usage = self.get_memory_usage()
+                return encode_report([*usage.items(), ('total', sum(usage.values()))])
+            case 'sessions':
+                return encode_report(self.get_largest_sessions())
+            case 'trace on':
+                self.memory_tracer.start()
+            case 'trace off':
+                self.memory_tracer.stop()
+            case 'snapshot':
+                statistics = self.memory_tracer.take()
+                return encode_report(statistics) if statistics is not None else Response.ERROR
+            case _:
+                return Response.ERROR
+
+        return Response.OK
+
+    def is_admin(self, address):
+        if address is None or address[0] not in self.admin_hosts:
+            print(colored(f'Admin request refused for client {address}', 'red'))
+            return False
+
+        return True
+
+    def get_memory_usage(self):
+        """
+        Estimates the memory used by the game and the connection of the client
+        :return: dict of component -> bytes
+        """
+        return {
+            'map': self.game_map.get_memory_size() if self.game_map is not None else 0,
+            'buffers': sys.getsizeof(self.receive_buffer.buffer) if self.receive_buffer is not None else 0,
+            'socket': get_socket_buffer_size(self.client_socket) if self.client_socket is not None else 0,
+        }
+
+    def get_largest_sessions(self, limit=10):
+        """
+        :param limit: number of sessions reported
+        :return: list of (player id, bytes), the largest first
+        """
+        return [(get_player_id(self.client_address), sum(self.get_memory_usage().values()))]
+
+    @profiled('init_game_map')
+    def init_game_map(self, seed=None):
         """
         Initialize game map with random map
+        :param seed: seed of the map (a new random seed if None)
         """
-        self.game_map = get_random_map()
+        self.game_map = get_random_map(seed)
+        print(colored(f'Game started with seed {self.game_map.seed}', 'green'))
 
+    @profiled('try_to_move_player')
     def try_to_move_player(self, dx, dy):
         """
         Try to move player in given direction and send response to client
@@ -0,0 +1,279 @@
+import os
+import struct
+import threading
+import time
+
+from lib.colors import colored
+from lib.game.server.game_response import Response
+
+# snapshot header: magic, format version, number of players, number of recorded games
+SNAPSHOT_HEADER = struct.Struct('<4sHIQ')
+SNAPSHOT_MAGIC = b'MRLB'
+SNAPSHOT_VERSION = 1
+
+# snapshot entry: steps, length of the utf-8 name (followed by the name)
+SNAPSHOT_ENTRY = struct.Struct('<IB')
+
+MAX_NAME_LENGTH = 32
+
+
+def is_valid_player_name(name):
+    """
+    Player names are sent in space and ';' separated leaderboard messages
+    :param name: str
+    :return: bool
+    """
+    return name is not None and 0 < len(name.encode()) <= MAX_NAME_LENGTH \
+        and not any(character.isspace() or character == ';' for character in name)
+
+
+def encode_entries(entries):
+    """
+    Encode leaderboard entries as one LEADERBOARD message: 'LEADERBOARD rank name steps;rank name steps;...'
+    :param entries: list of (rank, name, steps)
+    :return: str
+    """
+    return f"{Response.LEADERBOARD} {';'.join(f'{rank} {name} {steps}' for rank, name, steps in entries)}".rstrip()
+
+
+class FenwickTree:
+    """
+    Binary indexed tree of counts: O(log n) updates, prefix sums and order statistics
+
+    Attributes:
+        tree (list): the tree, 1-based
+    """
+
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    @staticmethod
+    def from_counts(counts):
+        """
+        Build the tree of the given counts in O(n)
+        :param counts: list of int
+        :return: FenwickTree
+        """
+        fenwick_tree = FenwickTree(len(counts))
+        tree = fenwick_tree.tree
+        tree[1:] = counts
+
+        for index in range(1, len(tree)):
+            parent = index + (index & -index)
+            if parent < len(tree):
+                tree[parent] += tree[index]
+
+        return fenwick_tree
+
+    def add(self, index, delta):
+        """
+        :param index: 0-based index
+        :param delta: value added to the count of the index
+        """
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """
+        :param index: 0-based index (-1 for an empty prefix)
+        :return: sum of the counts of the indexes 0..index
+        """
+        total = 0
+        index += 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, k):
+        """
+        :param k: 1-based order
+        :return: the smallest 0-based index whose prefix sum is at least k
+        """
+        position = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+
+        while step > 0:
+            if position + step < len(self.tree) and self.tree[position + step] < k:
+                position += step
+                k -= self.tree[position]
+            step >>= 1
+
+        return position
+
+
+class Leaderboard:
+    """
+    Index of the best result (fewest steps to an exit) of every named player
+
+    A Fenwick tree counts the players by their best number of steps, so recording a game, the rank of a player
+    and the top-k players all take O(log n) operations (plus k for the top-k), however many games were recorded.
+    Players with the same number of steps share their rank and are listed in the order they reached it.
+
+    Attributes:
+        max_steps (int): results above max_steps steps are recorded as max_steps
+        best_steps (dict): player name -> best number of steps
+        buckets (dict): number of steps -> dict of the player names with that best result (in insertion order)
+        games (int): number of recorded games
+        dirty (bool): whether the leaderboard changed since the last snapshot
+    """
+
+    def __init__(self, max_steps=65535):
+        self.max_steps = max_steps
+        self.tree = FenwickTree(max_steps + 1)
+        self.best_steps = {}
+        self.buckets = {}
+        self.games = 0
+        self.dirty = False
+        self.mutex = threading.Lock()
+
+    def record(self, name, steps):
+        """
+        Record a won game of a player
+        :param name: player name
+        :param steps: number of steps of the game
+        :return: True if the game is the best result of the player
+        """
+        steps = min(steps, self.max_steps)
+
+        with self.mutex:
+            self.games += 1
+            self.dirty = True
+
+            best_steps = self.best_steps.get(name)
+            if best_steps is not None and best_steps <= steps:
+                return False
+
+            if best_steps is not None:
+                self.remove_from_bucket(name, best_steps)
+                self.tree.add(best_steps, -1)
+
+            self.best_steps[name] = steps
+            self.buckets.setdefault(steps, {})[name] = None
+            self.tree.add(steps, 1)
+
+            return True
+
+    def remove_from_bucket(self, name, steps):
+        bucket = self.buckets[steps]
+        del bucket[name]
+        if len(bucket) == 0:
+            del self.buckets[steps]
+
+    def get_rank(self, name):
+        """
+        :param name: player name
+        :return: tuple of (rank, best number of steps), None if the player has no recorded win
+        """
+        with self.mutex:
+            steps = self.best_steps.get(name)
+            if steps is None:
+                return None
+
+            return self.tree.prefix_sum(steps - 1) + 1, steps
+
+    def get_top(self, k):
+        """
+        :param k: number of players
+        :return: list of (rank, name, steps) of the k best players
+        """
+        top = []
+
+        with self.mutex:
+            k = min(k, len(self.best_steps))
+            while len(top) < k:
+                # the next bucket is the one holding the (len(top) + 1)-th player
+                steps = self.tree.find(len(top) + 1)
+                rank = len(top) + 1
+
+                for name in self.buckets[steps]:
+                    if len(top) == k:
+                        break
+                    top.append((rank, name, steps))
+
+        return top
+
+    def save(self, path):
+        """
+        Write a compact snapshot of the leaderboard, atomically replacing the previous one
+        :param path: snapshot file path
+        """
+        with self.mutex:
+            entries = [(steps, list(bucket)) for steps, bucket in sorted(self.buckets.items())]
+            players = len(self.best_steps)
+            games = self.games
+            self.dirty = False
+
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, players, games))
+            for steps, names in entries:
+                chunk = bytearray()
+                for name in names:
+                    encoded_name = name.encode()
+                    chunk += SNAPSHOT_ENTRY.pack(steps, len(encoded_name))
+                    chunk += encoded_name
+                file.write(chunk)
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, path)
+
+    def load(self, path):
+        """
+        Replace the leaderboard with a snapshot
+        :param path: snapshot file path
+        :return: False if there is no snapshot
+        """
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return False
+
+        (magic, version, players, games) = SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f'{path} is not a leaderboard snapshot')
+
+        best_steps = {}
+        buckets = {}
+        counts = [0] * (self.max_steps + 1)
+        offset = SNAPSHOT_HEADER.size
+
+        for _ in range(players):
+            (steps, name_length) = SNAPSHOT_ENTRY.unpack_from(data, offset)
+            offset += SNAPSHOT_ENTRY.size
+            name = data[offset:offset + name_length].decode()
+            offset += name_length
+
+            steps = min(steps, self.max_steps)
+            best_steps[name] = steps
+            buckets.setdefault(steps, {})[name] = None
+            counts[steps] += 1
+
+        with self.mutex:
+            self.best_steps = best_steps
+            self.buckets = buckets
+            self.tree = FenwickTree.from_counts(counts)
+            self.games = games
+            self.dirty = False
+
+        return True
+
+    def run_snapshots(self, path, interval):
+        """
+        Snapshot loop: write a snapshot every interval seconds if the leaderboard changed
+        :param path: snapshot file path
+        :param interval: seconds between two snapshots
+        """
+        while True:
+            time.sleep(interval)
+
+            if self.dirty:
+                try:
+                    self.save(path)
+                except OSError as e:
+                    print(colored(f'Leaderboard snapshot failed: {e}', 'red'))
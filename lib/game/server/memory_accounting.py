@@ -0,0 +1,214 @@
+import struct
+import sys
+import threading
+import tracemalloc
+
+from lib.game.server.game_response import Response
+
+try:
+    # POSIX only, the socket queues are not counted on the other platforms
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = termios = None
+
+# resident part of the stack of a thread serving a client: the threads reserve RLIMIT_STACK (8 MiB by default)
+# of virtual memory, but only the few pages the request handlers touch are actually allocated
+DEFAULT_THREAD_STACK_ESTIMATE = 64 * 1024
+
+# ioctl requests returning the bytes waiting in the receive queue and the send queue of a socket
+QUEUED_BYTES_REQUESTS = tuple(
+    getattr(termios, name) for name in ('FIONREAD', 'TIOCOUTQ') if hasattr(termios, name)
+)
+QUEUED_BYTES = struct.Struct('i')
+
+
+def get_thread_stack_size(estimate=DEFAULT_THREAD_STACK_ESTIMATE):
+    """
+    Returns the memory charged for the stack of every new thread
+    :param estimate: bytes charged when no stack size was set with threading.stack_size()
+    :return: int (bytes)
+    """
+    size = threading.stack_size()
+    return size if size > 0 else estimate
+
+
+def get_socket_buffer_size(client_socket):
+    """
+    Returns the number of bytes queued in the kernel receive and send buffers of a socket
+    (SO_RCVBUF and SO_SNDBUF are only the autotuning caps, the kernel allocates the buffers as the data is queued)
+    :param client_socket: socket
+    :return: int (bytes, 0 for a closed socket or if the platform cannot tell)
+    """
+    size = 0
+    for request in QUEUED_BYTES_REQUESTS:
+        try:
+            size += QUEUED_BYTES.unpack(fcntl.ioctl(client_socket.fileno(), request, bytes(QUEUED_BYTES.size)))[0]
+        except (OSError, ValueError):
+            pass
+
+    return size
+
+
+def get_session_memory(session, thread_stack_size=0):
+    """
+    Estimates the footprint of a session
+    :param session: ClientSession
+    :param thread_stack_size: stack of the thread serving the session (0 if it is served by a worker pool)
+    :return: dict of component -> bytes: 'map' (its private game, the maps of the rooms are counted apart),
+        'buffers' (receive buffer and unsent responses), 'socket' (bytes queued in the kernel), 'stack'
+    """
+    game_map = session.game_map if session.room is None else None
+    if session.connection is not session:
+        # a game multiplexed over a connection only owns its map, the connection is counted with its own session
+        return {'map': game_map.get_memory_size() if game_map is not None else 0, 'buffers': 0, 'socket': 0, 'stack': 0}
+
+    return {
+        'map': game_map.get_memory_size() if game_map is not None else 0,
+        'buffers': sys.getsizeof(session.receive_buffer.buffer) + len(session.pending_broadcast)
+        + sum(len(payload) for payload in session.outbox),
+        'socket': get_socket_buffer_size(session.client_socket),
+        'stack': thread_stack_size,
+    }
+
+
+def encode_report(entries):
+    """
+    Encode a memory report as one MEMORY_REPORT message: 'MEMORY_REPORT name value;name value;...'
+    :param entries: list of (name, value) or of tuples of values
+    :return: str
+    """
+    return f"{Response.MEMORY_REPORT} {';'.join(' '.join(map(str, entry)) for entry in entries)}".rstrip()
+
+
+class MemoryBudget:
+    """
+    Global budget of the estimated memory of the sessions
+
+    Attributes:
+        limit (int): bytes the sessions may use (0 for no budget)
+        policy (str): 'refuse' (the new games are refused with BUSY) or 'evict' (the idle sessions are closed first)
+        min_idle (float): seconds without a request before a session can be evicted
+        refused (int): number of games refused since the start
+        evicted (int): number of sessions evicted since the start
+        sample_interval (float): seconds between two estimates of all the footprints (the socket queues change
+            without any session or game being created or disposed)
+        footprints (dict): key (session address, room, ...) -> last estimated bytes
+        usage (int): running total of the footprints, so checking the budget never walks the sessions
+    """
+
+    def __init__(self, limit=0, policy='refuse', min_idle=30.0, sample_interval=5.0):
+        if policy not in ('refuse', 'evict'):
+            raise ValueError(f'Invalid memory policy: {policy}')
+
+        self.limit = limit
+        self.policy = policy
+        self.min_idle = min_idle
+        self.refused = 0
+        self.evicted = 0
+        self.sample_interval = sample_interval
+        self.footprints = {}
+        self.usage = 0
+        self.mutex = threading.Lock()
+
+    def is_exceeded(self, usage):
+        return 0 < self.limit <= usage
+
+    def update(self, key, size):
+        """
+        Replace the footprint of a key in the running total
+        :param key: hashable (e.g. a client address)
+        :param size: estimated bytes
+        """
+        with self.mutex:
+            self.usage += size - self.footprints.get(key, 0)
+            self.footprints[key] = size
+
+    def remove(self, key):
+        with self.mutex:
+            self.usage -= self.footprints.pop(key, 0)
+
+    def get_footprints(self):
+        """
+        :return: list of (key, estimated bytes)
+        """
+        with self.mutex:
+            return list(self.footprints.items())
+
+    def choose_evictions(self, footprints, usage, now):
+        """
+        Chooses the idle sessions to close to get back under the budget, the longest idle ones first
+        :param footprints: list of (ClientSession, bytes)
+        :param usage: bytes used by all the sessions
+        :param now: time.monotonic() value
+        :return: list of ClientSession (empty if closing every idle session would not be enough)
+        """
+        if self.policy != 'evict':
+            return []
+
+        idle = sorted(
+            (footprint for footprint in footprints if now - footprint[0].last_activity >= self.min_idle),
+            key=lambda footprint: footprint[0].last_activity
+        )
+
+        evictions = []
+        for (session, size) in idle:
+            if not self.is_exceeded(usage):
+                break
+            evictions.append(session)
+            usage -= size
+
+        return evictions if not self.is_exceeded(usage) else []
+
+
+class MemoryTracer:
+    """
+    On-demand tracemalloc snapshots aggregated by source file (tracing slows every allocation down,
+    so it only runs between 'MEMORY trace on' and 'MEMORY trace off')
+
+    Attributes:
+        frames (int): number of frames stored for every traced allocation
+        previous (Snapshot): last snapshot taken, the next one is compared to it
+    """
+
+    def __init__(self, frames=1):
+        self.frames = frames
+        self.previous = None
+        self.mutex = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        with self.mutex:
+            self.previous = None
+        tracemalloc.stop()
+
+    def take(self, limit=10):
+        """
+        Takes a snapshot of the traced allocations
+        :param limit: number of source files reported
+        :return: list of (file, bytes, bytes allocated since the previous snapshot, blocks), None if not tracing
+        """
+        if not tracemalloc.is_tracing():
+            return None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+        with self.mutex:
+            previous = self.previous
+            self.previous = snapshot
+
+        if previous is None:
+            statistics = [(stat, stat.size) for stat in snapshot.statistics('filename')]
+        else:
+            statistics = [(stat, stat.size_diff) for stat in snapshot.compare_to(previous, 'filename')]
+
+        return [
+            (stat.traceback[0].filename, stat.size, size_diff, stat.count)
+            for (stat, size_diff) in statistics[:limit]
+        ]
@@ -0,0 +1,423 @@
+import threading
+import time
+from collections import deque
+from functools import partial
+
+import numpy as np
+
+from lib.colors import colored
+from lib.map.map_catalog import map_catalog
+from lib.map.map_entity import MapEntity
+
+# distance used for unreachable cells and for invalid moves
+UNREACHABLE = np.iinfo(np.int16).max
+
+# monster moves: UP, DOWN, LEFT, RIGHT
+MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def is_current_version(key):
+    """
+    Checks if a map version is the one of the current map catalog
+    :param key: tuple of (map file path, version)
+    :return: bool
+    """
+    snapshot = map_catalog.snapshot
+    return snapshot is None or snapshot.versions.get(key[0]) == key[1]
+
+
+class MapField:
+    """
+    Precomputed movement data of one map template, shared by all the sessions playing on it
+
+    Attributes:
+        key (tuple): (map file path, version) of the map the field was built from
+        map_size (tuple): the map size
+        neighbors (ndarray): cells x 4 array of the cells the monster can move to (-1 for walls, exits, outside)
+        passable (list): whether every cell can be walked through
+        distances (ndarray): cells x cells array of shortest path distances (None until it is built in the background,
+            or if the map is too large)
+        sessions (int): number of simulated sessions playing on the field
+    """
+
+    def __init__(self, game_map):
+        self.key = (game_map.map_file_path, game_map.version)
+        self.map_size = game_map.map_size
+        self.sessions = 0
+        (rows, cols) = self.map_size
+        cells = rows * cols
+
+        self.neighbors = np.full((cells, len(MOVES)), -1, dtype=np.int32)
+        self.passable = passable = [False] * cells
+
+        for row in range(rows):
+            for col in range(cols):
+                passable[row * cols + col] = game_map.entity_map[row][col] != MapEntity.WALL
+
+                for index, (dx, dy) in enumerate(MOVES):
+                    if game_map.is_in_matrix(row + dx, col + dy) \
+                            and game_map.entity_map[row + dx][col + dy] != MapEntity.WALL \
+                            and game_map.entity_map[row + dx][col + dy] != MapEntity.EXIT:
+                        self.neighbors[row * cols + col, index] = (row + dx) * cols + col + dy
+
+        self.distances = None
+
+    def compute_distances(self):
+        """
+        BFS from every passable cell (the player can also stand on cells the monster cannot enter)
+        :return: ndarray
+        """
+        passable = self.passable
+        (rows, cols) = self.map_size
+        cells = rows * cols
+        distances = np.full((cells, cells), UNREACHABLE, dtype=np.int16)
+
+        for source in np.flatnonzero(passable).tolist():
+            source_distances = [UNREACHABLE] * cells
+            source_distances[source] = 0
+            bfs_queue = deque([source])
+
+            while len(bfs_queue) > 0:
+                current = bfs_queue.popleft()
+                (row, col) = divmod(current, cols)
+
+                for (dx, dy) in MOVES:
+                    next_row, next_col = row + dx, col + dy
+                    next_cell = next_row * cols + next_col
+                    if 0 <= next_row < rows and 0 <= next_col < cols and passable[next_cell] \
+                            and source_distances[next_cell] == UNREACHABLE:
+                        source_distances[next_cell] = source_distances[current] + 1
+                        bfs_queue.append(next_cell)
+
+            distances[source] = source_distances
+
+        return distances
+
+
+class MonsterSimulation:
+    """
+    Server-side simulation which moves the monster of every active session one step toward its player on a fixed tick
+
+    The state of all the sessions lives in arrays indexed by a session slot, so one tick is a handful of array
+    operations over all the sessions: the monster's candidate cells are gathered from the concatenated neighbor
+    tables of the maps and their distances to the player from the concatenated distance fields (Manhattan distance
+    for maps too large for a distance field). Only the monsters which actually moved are written back to their maps,
+    each with the move lock of its session held.
+
+    The all-pairs distance field of a new map version is built on a background thread, so a START never waits for it
+    and the ticks go on meanwhile: the monsters of that version chase their players by Manhattan distance until
+    the field is ready.
+
+    Attributes:
+        tick (float): seconds between two simulation steps
+        report_interval (float): seconds between two tick duration reports
+        max_field_cells (int): maximum number of cells of a map with a precomputed distance field
+        fields (dict): (map file path, version) -> index of its MapField in field_list (the fields of the versions
+            replaced by a reload of the map catalog are evicted once no session plays on them)
+        maps (list): slot -> simulated Map (None for a free slot)
+        move_locks (list): slot -> move lock of the session playing the simulated Map (None for a free slot)
+        last_tick_duration (float): duration of the last tick in seconds
+    """
+
+    def __init__(self, tick=0.5, report_interval=10.0, max_field_cells=2500):
+        self.tick = tick
+        self.report_interval = report_interval
+        self.max_field_cells = max_field_cells
+        self.mutex = threading.Lock()
+
+        self.fields = {}
+        self.field_list = []
+        self.maps = []
+        self.move_locks = []
+        self.slots = {}
+        self.free_slots = []
+
+        # per-slot session state
+        self.active = np.zeros(0, dtype=bool)
+        self.field_index = np.zeros(0, dtype=np.int32)
+        self.monster_cell = np.zeros(0, dtype=np.int32)
+        self.player_cell = np.zeros(0, dtype=np.int32)
+
+        # per-field data, concatenated over all the fields
+        self.cell_offsets = np.zeros(0, dtype=np.int64)
+        self.distance_offsets = np.zeros(0, dtype=np.int64)
+        self.cell_counts = np.zeros(0, dtype=np.int64)
+        self.col_counts = np.zeros(0, dtype=np.int64)
+        self.has_distances = np.zeros(0, dtype=bool)
+        self.all_neighbors = np.zeros((0, len(MOVES)), dtype=np.int32)
+        self.all_distances = np.zeros(0, dtype=np.int16)
+
+        self.last_tick_duration = 0.0
+        self.ticks = 0
+        self.total_tick_duration = 0.0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        print(colored(f'Monster simulation started (tick: {self.tick}s)', 'green'))
+
+    def get_field_index(self, game_map):
+        """
+        Returns the index of the field of the map, building the field on its first use
+        :param game_map:
+        :return: int
+        """
+        field_index = self.fields.get((game_map.map_file_path, game_map.version))
+        if field_index is not None:
+            return field_index
+
+        # a new version of a map is the time to drop the unused fields of the replaced versions
+        self.evict_fields([
+            field for field in self.field_list if field.sessions == 0 and not is_current_version(field.key)
+        ])
+
+        field = MapField(game_map)
+        field_index = len(self.field_list)
+        self.field_list.append(field)
+        self.fields[field.key] = field_index
+        self.append_field_data(field)
+
+        if len(field.passable) <= self.max_field_cells:
+            threading.Thread(target=self.build_distances, args=(field,), daemon=True).start()
+
+        return field_index
+
+    def build_distances(self, field):
+        """
+        Compute the distance field of a map (outside of the mutex, so the ticks go on) and start using it
+        :param field: MapField
+        """
+        started = time.perf_counter()
+        try:
+            distances = field.compute_distances()
+        except Exception as e:
+            print(colored(f'Error while building the distance field of {field.key[0]}: {e}', 'red'))
+            return
+
+        with self.mutex:
+            field_index = self.fields.get(field.key)
+            if field_index is None or self.field_list[field_index] is not field:
+                # the field was evicted meanwhile
+                return
+
+            field.distances = distances
+            self.distance_offsets[field_index] = len(self.all_distances)
+            self.all_distances = np.concatenate((self.all_distances, distances.ravel()))
+            self.has_distances[field_index] = True
+
+        print(colored(
+            f'Monster simulation: distance field of {field.key[0]} built in {time.perf_counter() - started:.3f} s',
+            'cyan'
+        ))
+
+    def append_field_data(self, field):
+        (rows, cols) = field.map_size
+        self.cell_offsets = np.append(self.cell_offsets, len(self.all_neighbors))
+        self.distance_offsets = np.append(self.distance_offsets, len(self.all_distances))
+        self.cell_counts = np.append(self.cell_counts, rows * cols)
+        self.col_counts = np.append(self.col_counts, cols)
+        self.has_distances = np.append(self.has_distances, field.distances is not None)
+        self.all_neighbors = np.concatenate((self.all_neighbors, field.neighbors))
+        if field.distances is not None:
+            self.all_distances = np.concatenate((self.all_distances, field.distances.ravel()))
+
+    def evict_fields(self, evicted_fields):
+        """
+        Remove unused fields and rebuild the concatenated per-field data without them
+        :param evicted_fields: list of MapField played by no session
+        """
+        if len(evicted_fields) == 0:
+            return
+
+        old_field_indexes = [self.fields[field.key] for field in self.field_list if field not in evicted_fields]
+        self.field_list = [self.field_list[field_index] for field_index in old_field_indexes]
+        self.fields = {field.key: field_index for field_index, field in enumerate(self.field_list)}
+
+        # the active slots point to the new indexes of their fields
+        new_field_indexes = np.zeros(max(old_field_indexes, default=0) + 1, dtype=np.int32)
+        new_field_indexes[old_field_indexes] = np.arange(len(old_field_indexes), dtype=np.int32)
+        active_slots = np.flatnonzero(self.active)
+        self.field_index[active_slots] = new_field_indexes[self.field_index[active_slots]]
+
+        self.cell_offsets = np.zeros(0, dtype=np.int64)
+        self.distance_offsets = np.zeros(0, dtype=np.int64)
+        self.cell_counts = np.zeros(0, dtype=np.int64)
+        self.col_counts = np.zeros(0, dtype=np.int64)
+        self.has_distances = np.zeros(0, dtype=bool)
+        self.all_neighbors = np.zeros((0, len(MOVES)), dtype=np.int32)
+        self.all_distances = np.zeros(0, dtype=np.int16)
+        for field in self.field_list:
+            self.append_field_data(field)
+
+        print(colored(
+            f'Monster simulation: evicted the fields of {len(evicted_fields)} replaced map versions', 'yellow'
+        ))
+
+    def grow(self):
+        capacity = max(16, 2 * len(self.active))
+        extra = capacity - len(self.active)
+
+        self.active = np.concatenate((self.active, np.zeros(extra, dtype=bool)))
+        self.field_index = np.concatenate((self.field_index, np.zeros(extra, dtype=np.int32)))
+        self.monster_cell = np.concatenate((self.monster_cell, np.zeros(extra, dtype=np.int32)))
+        self.player_cell = np.concatenate((self.player_cell, np.zeros(extra, dtype=np.int32)))
+        self.maps.extend([None] * extra)
+        self.move_locks.extend([None] * extra)
+        self.free_slots.extend(range(capacity - 1, capacity - extra - 1, -1))
+
+    def register(self, game_map, move_lock):
+        """
+        Start simulating the monster of a game map
+        :param game_map: Map with player and monster positions
+        :param move_lock: Lock serializing the moves of the session playing the map
+        """
+        if game_map.chunked:
+            # the movement data would cover the whole map
+            print(colored(f'The monster of the chunked map {game_map.map_file_path} is not simulated', 'yellow'))
+            return
+
+        with self.mutex:
+            if len(self.free_slots) == 0:
+                self.grow()
+
+            slot = self.free_slots.pop()
+            cols = game_map.map_size[1]
+
+            self.field_index[slot] = self.get_field_index(game_map)
+            self.field_list[self.field_index[slot]].sessions += 1
+            self.monster_cell[slot] = game_map.monster_position[0] * cols + game_map.monster_position[1]
+            self.player_cell[slot] = game_map.player_position[0] * cols + game_map.player_position[1]
+            self.active[slot] = True
+            self.maps[slot] = game_map
+            self.move_locks[slot] = move_lock
+            self.slots[game_map] = slot
+
+            game_map.player_moved_listener = partial(self.update_player_position, slot, cols)
+
+    def unregister(self, game_map):
+        """
+        Stop simulating the monster of a game map
+        :param game_map:
+        """
+        with self.mutex:
+            slot = self.slots.pop(game_map, None)
+            if slot is None:
+                return
+
+            game_map.player_moved_listener = None
+            self.active[slot] = False
+            self.maps[slot] = None
+            self.move_locks[slot] = None
+            self.free_slots.append(slot)
+
+            field = self.field_list[self.field_index[slot]]
+            field.sessions -= 1
+            if field.sessions == 0 and not is_current_version(field.key):
+                self.evict_fields([field])
+
+    def update_player_position(self, slot, cols, position):
+        self.player_cell[slot] = position[0] * cols + position[1]
+
+    def step(self):
+        """
+        Move every monster one step toward its player
+        :return: number of simulated sessions
+        """
+        moves = []
+        with self.mutex:
+            slots = np.flatnonzero(self.active)
+            if len(slots) == 0:
+                return 0
+
+            fields = self.field_index[slots]
+            monsters = self.monster_cell[slots]
+            players = self.player_cell[slots]
+            has_distances = self.has_distances[fields]
+
+            # candidate cells (staying in place for invalid moves)
+            candidates = self.all_neighbors[self.cell_offsets[fields] + monsters]
+            valid = candidates >= 0
+            candidates = np.where(valid, candidates, monsters[:, None])
+
+            # gather the distances from the distance fields (0 for maps without a field, replaced below)
+            cell_counts = self.cell_counts[fields]
+            distance_offsets = np.where(has_distances, self.distance_offsets[fields], 0)
+            distance_players = np.where(has_distances, players, 0)
+            candidate_rows = np.where(has_distances[:, None], candidates, 0)
+            monster_rows = np.where(has_distances, monsters, 0)
+
+            candidate_distances = self.all_distances[
+                distance_offsets[:, None] + candidate_rows * cell_counts[:, None] + distance_players[:, None]
+            ] if len(self.all_distances) > 0 else np.zeros(candidates.shape, dtype=np.int16)
+            current_distances = self.all_distances[
+                distance_offsets + monster_rows * cell_counts + distance_players
+            ] if len(self.all_distances) > 0 else np.zeros(monsters.shape, dtype=np.int16)
+
+            # Manhattan distance for maps without a distance field
+            cols = self.col_counts[fields]
+            candidate_distances = np.where(
+                has_distances[:, None],
+                candidate_distances,
+                np.abs(candidates // cols[:, None] - (players // cols)[:, None])
+                + np.abs(candidates % cols[:, None] - (players % cols)[:, None])
+            )
+            current_distances = np.where(
+                has_distances,
+                current_distances,
+                np.abs(monsters // cols - players // cols) + np.abs(monsters % cols - players % cols)
+            )
+            candidate_distances = np.where(valid, candidate_distances, UNREACHABLE)
+
+            best_moves = np.argmin(candidate_distances, axis=1)
+            rows = np.arange(len(slots))
+            moved = candidate_distances[rows, best_moves] < current_distances
+            new_monsters = candidates[rows, best_moves]
+
+            self.monster_cell[slots[moved]] = new_monsters[moved]
+
+            for slot, cell in zip(slots[moved].tolist(), new_monsters[moved].tolist()):
+                moves.append((self.maps[slot], self.move_locks[slot], cell))
+
+        # write the new positions back to the maps of the monsters which moved, each under the move lock
+        # of its session (taken after releasing the mutex, so a player move never waits for the other sessions)
+        for (game_map, move_lock, cell) in moves:
+            position = divmod(cell, game_map.map_size[1])
+
+            with move_lock:
+                game_map.set_entity_position(game_map.monster_position, MapEntity.EMPTY_CELL)
+                game_map.set_entity_position(position, MapEntity.MONSTER)
+                game_map.set_monster_position(position)
+
+        return len(slots)
+
+    def run(self):
+        """
+        Main loop of the simulation
+        """
+        next_report = time.monotonic() + self.report_interval
+
+        while True:
+            started = time.perf_counter()
+            try:
+                sessions = self.step()
+            except Exception as e:
+                # a failing tick must not stop the monsters of all the other sessions
+                print(colored(f'Error in the monster simulation tick: {e}', 'red'))
+                sessions = 0
+            self.last_tick_duration = time.perf_counter() - started
+            self.ticks += 1
+            self.total_tick_duration += self.last_tick_duration
+
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + self.report_interval
+                self.report(sessions)
+
+            time.sleep(max(0.0, self.tick - self.last_tick_duration))
+
+    def report(self, sessions):
+        average_duration = self.total_tick_duration / max(1, self.ticks)
+        sessions_per_ms = sessions / max(self.last_tick_duration * 1000, 1e-6)
+        print(colored(
+            f'Monster simulation: {sessions} sessions, last tick {self.last_tick_duration * 1000:.3f} ms '
+            f'(average {average_duration * 1000:.3f} ms, {sessions_per_ms:.0f} sessions/ms)',
+            'cyan'
+        ))
@@ -1,11 +1,33 @@
-from termcolor import colored
+import socket
 import threading as th
+import time
 
-from lib.game.client.game_request import Request
+from lib.colors import colored
+from lib.game.client.game_request import REQUEST_TABLE, Request
+from lib.game.server.admission_control import AdmissionController
+from lib.game.server.client_session import ClientSession
+from lib.game.server.datagram_channel import DatagramChannel
 from lib.game.server.game_response import Response
-from lib.game.server.game_server import GameServer, map_request_to_enum
+from lib.game.server.game_room import GameRoom, get_player_id, send_nowait
+from lib.game.server.game_server import GameServer, format_player_details, parse_request, parse_seed
+from lib.game.server.leaderboard import Leaderboard, encode_entries, is_valid_player_name
+from lib.game.server.memory_accounting import DEFAULT_THREAD_STACK_ESTIMATE, MemoryBudget, get_session_memory, \
+    get_thread_stack_size
+from lib.game.server.profiler import profiled
+from lib.game.server.spawn_pool import SpawnPool
+from lib.game.server.spectators import SpectatorHub, SpectatorStream
+from lib.game.server.worker_pool import WorkerPool
 from lib.map.map_entity import MapEntity
 from lib.map.random_generator import get_random_map
+from lib.tcp.fast_io import encode_message, send_all, send_coalesced
+from lib.tcp.timer_wheel import TimerWheel
+from lib.tcp.transport import enable_keepalive
+
+# maximum length of the tag of a game multiplexed over a connection ('@tag REQUEST')
+MAX_TAG_LENGTH = 32
+
+# requests accepted over the datagram channel -> (dx, dy)
+DATAGRAM_MOVES = {Request.UP: (-1, 0), Request.DOWN: (1, 0), Request.LEFT: (0, -1), Request.RIGHT: (0, 1)}
 
 
 class MultiplexingGameServer(GameServer):
@@ -13,34 +35,221 @@ class MultiplexingGameServer(GameServer):
     Multiplexing Game Server handles multiple clients
 
     Attributes:
-        client_sessions: dictionary of addr: (socket, game_map)
+        client_sessions: dictionary of addr: ClientSession
+        admission_control (AdmissionController): caps the number of clients served at the same time (the queued
+            clients are answered BUSY and closed by the reaper after max_pending_wait seconds)
+        rate_limit (float): number of requests per second allowed for each client
+        rate_burst (float): number of requests a client can send in a burst
+        dispatch_mode (str): 'thread' (one thread per client) or 'pool' (fixed-size worker pool for all clients)
+        worker_pool (WorkerPool): worker pool serving the clients (None in 'thread' dispatch mode)
+        coalesce_responses (bool): whether the responses to pipelined requests are sent together
+        rooms: dictionary of room name: GameRoom
+        room_tick (float): seconds between two room state broadcasts
+        monster_simulation (MonsterSimulation): moves the monsters toward the players (None if disabled)
+        leaderboard (Leaderboard): best results of the named players
+        leaderboard_path (str): leaderboard snapshot file (None if the leaderboard is not persisted)
+        snapshot_interval (float): seconds between two leaderboard snapshots
+        spawn_pool (SpawnPool): worker processes searching the spawn positions of new games (None if disabled)
+        spectator_hub (SpectatorHub): writer thread sending the spectated games to their spectators
+        handshake_timeout (float): seconds a new client has to send its first request (0 to wait forever)
+        idle_timeout (float): seconds a client can stay without sending a request (0 to wait forever)
+        keepalive_idle (float): seconds without traffic before the TCP keepalive probes start (0 to disable them)
+        connection_timers (TimerWheel): handshake and idle timers of the clients, checked by a single reaper thread
+        memory_budget (MemoryBudget): cap of the estimated memory of the sessions, checked before every new game
+            against a running total (updated as the sessions and the games come and go, and sampled by the reaper)
+        thread_stack_size (int): memory charged for the stack of every thread serving the clients (the stack size set
+            with thread_stack_size, otherwise the thread_stack_estimate of its resident part)
+        datagram_channel (DatagramChannel): UDP channel carrying the moves of the sessions (None if disabled)
+        max_connection_games (int): maximum number of tagged games multiplexed over one connection
     """
 
-    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, max_connections=3, name='Multi Client Game Server'):
-        super().__init__(host, port, buffer_size, max_connections, name)
-        # dictionary of addr: (socket, game_map)
+    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, max_connections=3, name='Multi Client Game Server',
+                 max_clients=64, max_pending=16, rate_limit=20.0, rate_burst=40.0,
+                 dispatch_mode='thread', pool_size=8, queue_depth=256, fairness=1, coalesce_responses=False,
+                 room_tick=0.1, simulation_tick=0.0, profiler=None, admin_hosts=('127.0.0.1', '::1', 'unix'),
+                 transport=None, leaderboard_path=None, snapshot_interval=60.0, spawn_workers=0,
+                 handshake_timeout=10.0, idle_timeout=300.0, keepalive_idle=0,
+                 memory_budget=0, memory_policy='refuse', memory_min_idle=30.0, thread_stack_size=0,
+                 datagram_port=None, max_connection_games=1024, memory_sample_interval=5.0,
+                 thread_stack_estimate=DEFAULT_THREAD_STACK_ESTIMATE, max_pending_wait=30.0):
+        super().__init__(host, port, buffer_size, max_connections, name, profiler, admin_hosts, transport)
+        # dictionary of addr: ClientSession
         self.client_sessions = {}
+        self.admission_control = AdmissionController(max_clients, max_pending, max_pending_wait)
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.dispatch_mode = dispatch_mode
+        self.worker_pool = None
+        self.coalesce_responses = coalesce_responses
+        self.rooms = {}
+        self.rooms_mutex = th.Lock()
+        self.room_tick = room_tick
+        self.monster_simulation = None
+        self.leaderboard = Leaderboard()
+        self.leaderboard_path = leaderboard_path
+        self.snapshot_interval = snapshot_interval
+        self.spawn_pool = None
+        self.spectator_hub = SpectatorHub()
+        self.handshake_timeout = handshake_timeout
+        self.idle_timeout = idle_timeout
+        self.keepalive_idle = keepalive_idle
+        self.connection_timers = TimerWheel(tick=0.25, now=time.monotonic())
+        self.memory_budget = MemoryBudget(memory_budget, memory_policy, memory_min_idle, memory_sample_interval)
+
+        if thread_stack_size > 0:
+            # applies to the threads started from now on (client handlers, worker pool, background threads)
+            th.stack_size(thread_stack_size)
+        self.thread_stack_size = get_thread_stack_size(thread_stack_estimate)
+        self.datagram_channel = None
+        self.max_connection_games = max_connection_games
+
+        if datagram_port is not None:
+            self.datagram_channel = DatagramChannel(self.handle_datagram_request, host, datagram_port)
+
+        if leaderboard_path is not None and self.leaderboard.load(leaderboard_path):
+            print(colored(f'Leaderboard loaded from {leaderboard_path} '
+                          f'({len(self.leaderboard.best_steps)} players, {self.leaderboard.games} games)', 'green'))
+
+        if simulation_tick > 0:
+            # numpy is only needed when the simulation is enabled
+            from lib.game.server.monster_simulation import MonsterSimulation
+            self.monster_simulation = MonsterSimulation(simulation_tick)
+
+        if spawn_workers > 0:
+            self.spawn_pool = SpawnPool(spawn_workers)
+
+        if dispatch_mode == 'pool':
+            self.worker_pool = WorkerPool(
+                self.handle_request,
+                self.reject_request,
+                self.has_pending_request,
+                pool_size,
+                queue_depth,
+                fairness
+            )
+            self.memory_budget.update('worker_pool', pool_size * self.thread_stack_size)
+        elif dispatch_mode != 'thread':
+            raise ValueError(f'Invalid dispatch mode: {dispatch_mode}')
 
     def accept_client(self):
         """
-        Accept client connection, create a new thread for it and add it to client_sessions
+        Accept client connection and admit it if there is a free slot, otherwise queue or reject it
         """
-        client_socket, address = self.server_socket.accept()
+        client_socket, address = self.transport.accept(self.server_socket)
         print(colored(f'Connection from {address}', 'green'))
-        self.client_sessions[address] = (client_socket, None)
-        th.Thread(target=self.handle_client, args=(client_socket, address)).start()
+
+        if self.admission_control.try_admit():
+            self.start_client_session(client_socket, address)
+        elif self.admission_control.enqueue((client_socket, address)):
+            print(colored(f'Server is full, client {address} is waiting for a free slot', 'yellow'))
+        else:
+            print(colored(f'Server is busy, client {address} is rejected', 'red'))
+            self.reject_client(client_socket)
+
+    def start_client_session(self, client_socket, address):
+        """
+        Add the admitted client to client_sessions and create a new thread for it
+        (or hand it over to the worker pool in 'pool' dispatch mode)
+        :param client_socket:
+        :param address:
+        """
+        self.client_sessions[address] = ClientSession(
+            client_socket,
+            address,
+            self.rate_limit,
+            self.rate_burst,
+            self.buffer_size
+        )
+        self.schedule_timeout_for(self.client_sessions[address])
+        self.update_footprint_for(self.client_sessions[address])
+
+        if self.keepalive_idle > 0:
+            enable_keepalive(client_socket, self.keepalive_idle)
+
+        if self.worker_pool is not None:
+            self.worker_pool.register(client_socket, address)
+        else:
+            th.Thread(target=self.handle_client, args=(client_socket, address)).start()
+
+    def reject_client(self, client_socket):
+        """
+        Tell the client that the server is busy and close its socket
+        :param client_socket:
+        """
+        try:
+            client_socket.send(Response.BUSY.encode())
+        except OSError:
+            pass
+        client_socket.close()
+
+    def reject_request(self, client_socket, address):
+        """
+        Consume a buffered request of the client without handling it and tell the client to back off
+        (called by the selector thread of the worker pool, so it never waits for the client)
+        :param client_socket:
+        :param address:
+        """
+        try:
+            if self.receive_message_from(client_socket, address) is not None:
+                session = self.client_sessions[address]
+                response = Response.BUSY if session.request_tag is None else f'@{session.request_tag} {Response.BUSY}'
+                # dropped if the socket buffer of the client is full, the client does not read its responses anyway
+                send_nowait(session, encode_message(response, session.receive_buffer.framed), broadcast=False)
+        except OSError as e:
+            print(colored(f'Error: {e}', 'red'))
 
     def receive_message_from(self, client_socket, address):
         # check if client socket is not closed
-        if client_socket.fileno() == -1:
+        session = self.client_sessions.get(address)
+        if session is None or client_socket.fileno() == -1:
             self.dispose_client_session(address)
             return
 
-        request = client_socket.recv(self.buffer_size).decode()
+        try:
+            message = session.receive_buffer.read_message(client_socket)
+        except OSError as e:
+            # e.g. the connection was reset by the peer
+            print(colored(f'Connection of client {address} lost: {e}', 'yellow'))
+            self.dispose_client_session(address)
+            return
+
+        # a zero-byte read: the client closed the connection (or it was shut down by the reaper)
+        if len(message) == 0 and session.receive_buffer.closed:
+            print(colored(f'Client {address} disconnected', 'yellow'))
+            self.dispose_client_session(address)
+            return
+
+        # '@tag REQUEST' is a request of the game of that tag on the connection
+        session.request_tag = None
+        if message[:1] == b'@':
+            (tag, _, message) = bytes(message).partition(b' ')
+            session.request_tag = tag[1:].decode('utf-8', 'replace')
+            if not 0 < len(session.request_tag) <= MAX_TAG_LENGTH:
+                (session.request_tag, message) = (None, b'')
+
+        (request, session.request_argument) = parse_request(message)
         print(colored(f'Request received from client {address}: {request}', 'blue'))
 
-        return map_request_to_enum(request)
+        session.last_activity = time.monotonic()
+        if not session.handshaken:
+            # the idle timer is only rescheduled when it expires, so a request costs no timer operation
+            session.handshaken = True
+            self.schedule_timeout_for(session)
+
+        return request
 
+    def has_pending_request(self, client_socket, address):
+        """
+        Receives without blocking what the socket of the client holds and checks if a complete request is buffered
+        (a disconnection or a disposed session count as a request, so that their handler cleans them up)
+        :param client_socket:
+        :param address:
+        :return: bool
+        """
+        session = self.client_sessions.get(address)
+        return session is None or session.receive_buffer.receive_available(client_socket)
+
+    @profiled('send')
     def send_message_to(self, client_socket, address, message):
         """
         log message and send it to client
@@ -48,19 +257,343 @@ class MultiplexingGameServer(GameServer):
         :param client_socket:
         :param message: message to send
         """
-        if client_socket.fileno() == -1:
+        session = self.client_sessions.get(address)
+        if session is None or client_socket.fileno() == -1:
             self.dispose_client_session(address)
             return
 
         print(colored(f'Sending message to client {address}: {message}', 'green'))
-        client_socket.send(message.encode())
+        payload = encode_message(message, session.receive_buffer.framed)
+        if session.tag is not None:
+            payload = f'@{session.tag} '.encode() + payload
+
+        with session.send_lock:
+            # finish a partially sent room broadcast first, so that the messages are not interleaved
+            if len(session.pending_broadcast) > 0:
+                send_all(client_socket, session.pending_broadcast)
+                session.pending_broadcast.clear()
+
+            # hold the response back while more pipelined requests are buffered, then send all of them at once
+            if self.coalesce_responses and session.receive_buffer.has_message():
+                session.outbox.append(payload)
+            elif len(session.outbox) > 0:
+                session.outbox.append(payload)
+                send_coalesced(client_socket, session.outbox)
+                session.outbox.clear()
+            else:
+                send_all(client_socket, payload)
 
     def get_map_for(self, address):
-        return self.client_sessions[address][1]
+        return self.client_sessions[address].game_map
+
+    @profiled('init_game_map_for')
+    def init_game_map_for(self, address, seed=None):
+        session = self.client_sessions[address]
+        self.stop_simulation_for(session)
+        session.game_map = get_random_map(seed, self.spawn_pool)
+        session.steps = 0
+        print(colored(f'Game started for client {address} with seed {session.game_map.seed}', 'green'))
+
+        if session.spectator_stream is not None:
+            session.spectator_stream.reset(session.game_map)
+
+        if self.monster_simulation is not None:
+            self.monster_simulation.register(session.game_map, session.move_lock)
+
+        self.update_footprint_for(session)
+
+    def stop_simulation_for(self, session):
+        if self.monster_simulation is not None and session.game_map is not None and session.room is None:
+            self.monster_simulation.unregister(session.game_map)
+
+    def get_player_details_for(self, address):
+        session = self.client_sessions[address]
+
+        if session.room is not None:
+            return session.room.get_player_details(address)
+        return session.game_map.get_player_details()
+
+    def join_room_for(self, address, room_name):
+        """
+        Add the client to the room with the given name, creating the room (and its shared map) if needed
+        :param address:
+        :param room_name:
+        """
+        session = self.client_sessions[address]
+        self.leave_room_for(address)
+
+        # the games of a room are not spectated
+        if session.spectator_stream is not None:
+            session.spectator_stream.reset(None)
+
+        with self.rooms_mutex:
+            room = self.rooms.get(room_name)
+            if room is None:
+                room = GameRoom(room_name, get_random_map(spawn_pool=self.spawn_pool))
+                self.rooms[room_name] = room
+                print(colored(f'Room {room_name} created with seed {room.game_map.seed}', 'green'))
+                self.update_footprint_for(room)
+
+            room.join(session)
+
+        session.room = room
+        session.game_map = room.game_map
+        session.steps = 0
+        self.update_footprint_for(session)
+
+    def leave_room_for(self, address):
+        """
+        Remove the client from its room (if any), disposing the room when it becomes empty
+        :param address:
+        """
+        session = self.client_sessions.get(address)
+        if session is None or session.room is None:
+            return
+
+        room = session.room
+        session.room = None
+        session.game_map = None
+
+        with self.rooms_mutex:
+            room.leave(address)
+            if room.is_empty() and self.rooms.get(room.name) is room:
+                self.rooms.pop(room.name)
+                self.memory_budget.remove(room)
+                print(colored(f'Room {room.name} disposed', 'yellow'))
+
+        self.update_footprint_for(session)
+
+    def schedule_timeout_for(self, session):
+        """
+        Schedule the handshake timeout of a new client, or the idle timeout of a client which sent a request
+        :param session: ClientSession
+        """
+        timeout = self.idle_timeout if session.handshaken else self.handshake_timeout
+        if timeout > 0:
+            self.connection_timers.schedule(session.address, timeout)
+        else:
+            self.connection_timers.cancel(session.address)
+
+    def check_timeout_for(self, address, now):
+        """
+        Close the connection of a client whose timer expired if it is still silent,
+        otherwise schedule the timer again for the rest of its idle timeout
+        :param address:
+        :param now: time.monotonic() value
+        """
+        session = self.client_sessions.get(address)
+        if session is None:
+            return
+
+        if not session.handshaken:
+            reason = f'no request within {self.handshake_timeout:g} s'
+        elif session.spectating is not None or now - session.last_activity < self.idle_timeout:
+            # spectators only receive, they are never idle
+            remaining = self.idle_timeout - (now - session.last_activity)
+            self.connection_timers.schedule(address, remaining if session.spectating is None else self.idle_timeout)
+            return
+        else:
+            reason = f'idle for {now - session.last_activity:.0f} s'
+
+        print(colored(f'Client {address} timed out ({reason})', 'yellow'))
+        self.close_client_session(session)
+
+    def get_tagged_session(self, connection, tag):
+        """
+        Returns the game of a connection targeted by the requests tagged '@tag', creating it on its first request
+        (the games of a connection are capped by max_connection_games, the connection holds the admission slot)
+        :param connection: ClientSession owning the connection
+        :param tag: str
+        :return: ClientSession, None if the connection already carries max_connection_games games
+        """
+        session = connection.tagged_sessions.get(tag)
+        if session is None:
+            if len(connection.tagged_sessions) >= self.max_connection_games:
+                return None
+
+            session = ClientSession(
+                connection.client_socket,
+                (*connection.address, tag),
+                self.rate_limit,
+                self.rate_burst,
+                connection=connection,
+                tag=tag
+            )
+            session.handshaken = True
+            connection.tagged_sessions[tag] = session
+            # every game brings its own rate budget to the bucket of the connection
+            connection.rate_limiter.resize(self.rate_limit, self.rate_burst)
+            self.client_sessions[session.address] = session
+            self.update_footprint_for(session)
+
+        session.last_activity = connection.last_activity
+        return session
+
+    def close_client_session(self, session):
+        """
+        Close the connection of a client from another thread than the one serving it
+        (only the game is disposed for a game multiplexed over a connection)
+        :param session: ClientSession
+        """
+        if session.connection is not session:
+            self.dispose_client_session(session.address)
+            return
+
+        try:
+            # wakes the handler blocked in recv (or the selector) up with a zero-byte read, which disposes the session
+            session.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            self.dispose_client_session(session.address)
+
+    def reap_connections(self):
+        """
+        Main loop of the reaper thread: process the expired timers of the timer wheel
+        and reject the pending clients which waited too long for a slot
+        """
+        next_sample = time.monotonic() + self.memory_budget.sample_interval
+
+        while True:
+            time.sleep(self.connection_timers.tick)
+
+            now = time.monotonic()
+            for address in self.connection_timers.advance(now):
+                self.check_timeout_for(address, now)
+
+            for (client_socket, address) in self.admission_control.expire(now):
+                print(colored(f'Client {address} waited too long for a free slot, it is rejected', 'red'))
+                self.reject_client(client_socket)
+
+            if self.memory_budget.limit > 0 and now >= next_sample:
+                next_sample = now + self.memory_budget.sample_interval
+                self.sample_memory()
+
+    def get_session_stack_size(self):
+        # the clients served by the worker pool have no thread of their own
+        return self.thread_stack_size if self.worker_pool is None else 0
+
+    def get_session_footprints(self):
+        """
+        :return: list of (ClientSession, estimated bytes)
+        """
+        stack_size = self.get_session_stack_size()
+        return [
+            (session, sum(get_session_memory(session, stack_size).values()))
+            for session in list(self.client_sessions.values())
+        ]
+
+    def update_footprint_for(self, owner):
+        """
+        Estimate the footprint of a session or a room again in the running total of the memory budget
+        (nothing is tracked without a budget)
+        :param owner: ClientSession or GameRoom
+        """
+        if self.memory_budget.limit <= 0:
+            return
+
+        if isinstance(owner, GameRoom):
+            self.memory_budget.update(owner, owner.game_map.get_memory_size())
+        elif self.client_sessions.get(owner.address) is owner:
+            self.memory_budget.update(
+                owner.address,
+                sum(get_session_memory(owner, self.get_session_stack_size()).values())
+            )
+
+    def sample_memory(self):
+        """
+        Estimate every footprint again (run periodically by the reaper thread, the socket queues of the sessions
+        and the maps of their games change without any session or game being created or disposed)
+        """
+        for session in list(self.client_sessions.values()):
+            self.update_footprint_for(session)
+
+        with self.rooms_mutex:
+            rooms = list(self.rooms.values())
+        for room in rooms:
+            self.update_footprint_for(room)
+
+    def get_memory_usage(self):
+        """
+        Estimates the memory used by the sessions, the rooms and the worker pool
+        :return: dict of component -> bytes
+        """
+        stack_size = self.get_session_stack_size()
+        usage = {'map': 0, 'rooms': 0, 'buffers': 0, 'socket': 0, 'stack': 0}
+        for session in list(self.client_sessions.values()):
+            for (component, size) in get_session_memory(session, stack_size).items():
+                usage[component] += size
+
+        with self.rooms_mutex:
+            rooms = list(self.rooms.values())
+        usage['rooms'] = sum(room.game_map.get_memory_size() for room in rooms)
+
+        if self.worker_pool is not None:
+            usage['stack'] = len(self.worker_pool.threads) * self.thread_stack_size
 
-    def init_game_map_for(self, address):
-        self.client_sessions[address] = (self.client_sessions[address][0], get_random_map())
+        return usage
 
+    def get_largest_sessions(self, limit=10):
+        footprints = sorted(self.get_session_footprints(), key=lambda footprint: footprint[1], reverse=True)
+        return [(get_player_id(session.address), size) for (session, size) in footprints[:limit]]
+
+    def handle_memory_request(self, address, argument):
+        """
+        Handle an admin MEMORY request (see GameServer.handle_memory_request),
+        'MEMORY' also reports the budget: 'budget bytes;refused games;evicted sessions'
+        """
+        response = super().handle_memory_request(address, argument)
+        if argument is None and response != Response.ERROR:
+            budget = self.memory_budget
+            response += f';budget {budget.limit};refused {budget.refused};evicted {budget.evicted}'
+
+        return response
+
+    def has_memory_for(self, session):
+        """
+        Checks the memory budget before a new game, evicting the longest idle sessions if the policy allows it
+        :param session: ClientSession starting the game
+        :return: False if the game must be refused
+        """
+        if self.memory_budget.limit <= 0:
+            return True
+
+        usage = self.memory_budget.usage
+        if not self.memory_budget.is_exceeded(usage):
+            return True
+
+        # the footprints of the running total (the rooms and the worker pool are not sessions, they are never evicted)
+        footprints = [(self.client_sessions.get(key), size) for (key, size) in self.memory_budget.get_footprints()]
+        evictions = self.memory_budget.choose_evictions(
+            [footprint for footprint in footprints if footprint[0] is not None and footprint[0] is not session],
+            usage,
+            time.monotonic()
+        )
+        if len(evictions) == 0:
+            self.memory_budget.refused += 1
+            print(colored(f'Memory budget exceeded ({usage} / {self.memory_budget.limit} bytes), '
+                          f'game of client {session.address} refused', 'red'))
+            return False
+
+        for evicted in evictions:
+            print(colored(f'Memory budget exceeded, idle client {evicted.address} evicted', 'yellow'))
+            self.memory_budget.evicted += 1
+            self.close_client_session(evicted)
+
+        return True
+
+    def broadcast_rooms(self):
+        """
+        Main loop of the room ticker: one batched state broadcast per room and tick
+        """
+        while True:
+            time.sleep(self.room_tick)
+
+            with self.rooms_mutex:
+                rooms = list(self.rooms.values())
+
+            for room in rooms:
+                room.broadcast()
+
+    @profiled('try_to_move_player_for')
     def try_to_move_player_for(self, client_socket, address, dx, dy):
         """
         Try to move player in given direction and send response to client
@@ -69,9 +602,46 @@ class MultiplexingGameServer(GameServer):
         :param dx: x direction
         :param dy: y direction
         """
+        self.send_message_to(client_socket, address, self.move_player_for(address, dx, dy))
+
+    def move_player_for(self, address, dx, dy):
+        """
+        Try to move player in given direction
+        :param address:
+        :param dx: x direction
+        :param dy: y direction
+        :return: Response enum
+        """
+        session = self.client_sessions[address]
+
+        # the handler of the TCP requests and the datagram thread can move the same player at the same time
+        with session.move_lock:
+            return self.apply_move_for(session, address, dx, dy)
+
+    def apply_move_for(self, session, address, dx, dy):
+        """
+        Move the player of a session (see move_player_for), called with the move lock of the session held
+        :return: Response enum
+        """
+        session.steps += 1
+
+        # room players move on the shared map
+        if session.room is not None:
+            response = session.room.try_to_move(address, dx, dy)
+            if response == Response.GAME_WON:
+                self.record_game_for(session)
+            if response == Response.GAME_WON or response == Response.GAME_OVER:
+                self.leave_room_for(address)
+
+            return response
 
         game_map = self.get_map_for(address)
 
+        # the monster caught the player
+        if game_map.monster_position == game_map.player_position:
+            self.publish_result_for(session, Response.GAME_OVER)
+            return Response.GAME_OVER
+
         # if the move is possible
         if game_map.is_move_possible(dx, dy):
             # move player
@@ -81,8 +651,7 @@ class MultiplexingGameServer(GameServer):
                     game_map.player_position[1] + dy
                 )
             )
-            # send ok response to client
-            self.send_message_to(client_socket, address, Response.OK)
+            return Response.OK
 
         # if the next position is blocked
         elif game_map.is_in_matrix(
@@ -97,58 +666,324 @@ class MultiplexingGameServer(GameServer):
                 )
             )
 
-            # send response to client based on entity type
+            # respond based on entity type
             match value:
                 case MapEntity.WALL:
-                    self.send_message_to(client_socket, address, Response.WALL_COLLISION)
+                    return Response.WALL_COLLISION
                 case MapEntity.EXIT:
-                    self.send_message_to(client_socket, address, Response.GAME_WON)
+                    self.record_game_for(session)
+                    self.publish_result_for(session, Response.GAME_WON)
+                    return Response.GAME_WON
                 case MapEntity.MONSTER:
-                    self.send_message_to(client_socket, address, Response.GAME_OVER)
-                case _:
-                    self.send_message_to(client_socket, address, Response.ERROR)
+                    self.publish_result_for(session, Response.GAME_OVER)
+                    return Response.GAME_OVER
+
         # invalid game state reached
-        else:
-            self.send_message_to(client_socket, address, Response.ERROR)
+        return Response.ERROR
+
+    def open_datagram_channel_for(self, session):
+        """
+        :param session: ClientSession
+        :return: DATAGRAM_TOKEN message or Response.ERROR if the server has no datagram channel
+        """
+        if self.datagram_channel is None:
+            return Response.ERROR
+
+        # a new token restarts the sequence numbers
+        if session.datagram_token is not None:
+            self.datagram_channel.unregister(session.datagram_token)
+        session.datagram_token = self.datagram_channel.register(session.address)
+
+        return f'{Response.DATAGRAM_TOKEN} {self.datagram_channel.get_port()} {session.datagram_token}'
+
+    def handle_datagram_request(self, address, message):
+        """
+        Apply a move received over the datagram channel (every other request goes over TCP)
+        :param address: address of the TCP session
+        :param message: bytes
+        :return: Response enum
+        """
+        session = self.client_sessions.get(address)
+        request = REQUEST_TABLE.lookup(message)
+        if session is None or session.game_map is None or request not in DATAGRAM_MOVES:
+            return Response.ERROR
+
+        if not self.consume_rate_for(session):
+            return Response.BUSY
+
+        session.last_activity = time.monotonic()
+        (dx, dy) = DATAGRAM_MOVES[request]
+        return self.move_player_for(address, dx, dy)
+
+    def record_game_for(self, session):
+        """
+        Record a won game in the leaderboard (the games of the sessions without a player name are not ranked)
+        :param session: ClientSession
+        """
+        if session.player_name is None:
+            return
+
+        if self.leaderboard.record(session.player_name, session.steps):
+            print(colored(f'New best result of {session.player_name}: {session.steps} steps', 'cyan'))
+
+    def publish_result_for(self, session, response):
+        if session.spectator_stream is not None:
+            session.spectator_stream.publish_result(response)
+
+    def find_session(self, argument):
+        """
+        :param argument: player id ('host:port') or player name
+        :return: ClientSession or None
+        """
+        for session in list(self.client_sessions.values()):
+            if get_player_id(session.address) == argument or session.player_name == argument:
+                return session
+
+        return None
+
+    def spectate_for(self, session, argument):
+        """
+        Subscribe the client to the games of another session (or unsubscribe it if the argument is missing);
+        the snapshot and the events are sent by the spectator hub
+        :param session: ClientSession
+        :param argument: player id or player name of the spectated session
+        :return: Response.OK or Response.ERROR
+        """
+        self.stop_spectating_for(session)
+        if argument is None:
+            return Response.OK
+
+        # the events are pushed between the responses, only the clients framing their messages can tell them apart
+        target = self.find_session(argument)
+        if target is None or target is session or not session.receive_buffer.framed:
+            return Response.ERROR
+        if target.game_map is not None and target.game_map.chunked:
+            # a chunked map is too large for a snapshot
+            return Response.ERROR
+
+        if target.spectator_stream is None:
+            target.spectator_stream = SpectatorStream(self.spectator_hub, target.address)
+            if target.room is None:
+                target.spectator_stream.reset(target.game_map)
+
+        session.spectating = target.spectator_stream
+        print(colored(f'Client {session.address} spectates client {target.address}', 'green'))
+        return Response.OK
+
+    def stop_spectating_for(self, session):
+        if session.spectating is not None:
+            session.spectating.unsubscribe(session.address)
+            session.spectating = None
+
+    def get_top_players(self, argument):
+        """
+        :param argument: number of players (10 if missing, at most 100)
+        :return: LEADERBOARD message or Response.ERROR
+        """
+        if argument is not None and not argument.isdigit():
+            return Response.ERROR
+
+        return encode_entries(self.leaderboard.get_top(min(int(argument or 10), 100)))
+
+    def get_rank_of(self, session, argument):
+        """
+        :param session: ClientSession
+        :param argument: player name (the player of the session if missing)
+        :return: LEADERBOARD message or Response.ERROR
+        """
+        name = argument or session.player_name
+        rank = self.leaderboard.get_rank(name) if name is not None else None
+        if rank is None:
+            return Response.ERROR
+
+        return encode_entries([(rank[0], name, rank[1])])
+
+    def save_leaderboard(self):
+        """
+        Main loop of the leaderboard snapshots
+        """
+        self.leaderboard.run_snapshots(self.leaderboard_path, self.snapshot_interval)
 
     def handle_client(self, client_socket, address):
-        while True:
+        """
+        Serve all the requests of a client (used by the thread per client dispatch mode)
+        :param client_socket:
+        :param address:
+        """
+        while self.handle_request(client_socket, address):
+            pass
+
+    def consume_rate_for(self, session):
+        """
+        Charge a request to the rate limiter of the connection (which grows with its tagged games),
+        then to the one of the tagged game it targets
+        :param session: ClientSession
+        :return: True if the request can be handled, False if the client must back off
+        """
+        if not session.connection.rate_limiter.consume():
+            return False
+
+        return session.connection is session or session.rate_limiter.consume()
+
+    def handle_request(self, client_socket, address):
+        """
+        Receive and handle a single request of a client
+        :param client_socket:
+        :param address:
+        :return: False if the client session is over, True otherwise
+        """
+        # the session the request is handled for (the connection's own or one of its tagged games)
+        target = address
+
+        with self.profiler.request():
             try:
                 # receive request from client
-                request = self.receive_message_from(client_socket, address)
-
-                # handle request
-                match request:
-                    case Request.START:
-                        # initialize game map and print it on the server terminal
-                        self.init_game_map_for(address)
-                        self.get_map_for(address).print_map()
-
-                        self.send_message_to(client_socket, address, Response.GAME_STARTED)
-                    case Request.STOP:
-                        self.dispose_client_session(address)
-                        break
-                    case Request.SEND_PLAYER_DETAILS:
-                        # send player details to client
-                        player_details = self.get_map_for(address).get_player_details()
-                        player_details = f"{player_details[0][0]} {player_details[0][1]} {player_details[1][0]} {player_details[1][1]}"
-                        self.send_message_to(client_socket, address, player_details)
-                    case Request.UP:
-                        self.try_to_move_player_for(client_socket, address, -1, 0)
-                    case Request.DOWN:
-                        self.try_to_move_player_for(client_socket, address, 1, 0)
-                    case Request.LEFT:
-                        self.try_to_move_player_for(client_socket, address, 0, -1)
-                    case Request.RIGHT:
-                        self.try_to_move_player_for(client_socket, address, 0, 1)
-                    case Request.UNKNOWN:
-                        self.send_message_to(client_socket, address, Response.ERROR)
+                with self.profiler.span('receive'):
+                    request = self.receive_message_from(client_socket, address)
+
+                # the client session was disposed
+                if request is None:
+                    return False
 
+                # demultiplex the tagged requests onto the games of the connection
+                session = self.client_sessions.get(address)
+                if session is not None and session.request_tag is not None:
+                    if request == Request.UNKNOWN and session.request_tag not in session.tagged_sessions:
+                        # e.g. a bare '@tag', it does not open a game
+                        self.send_message_to(client_socket, address, f'@{session.request_tag} {Response.ERROR}')
+                        return True
+
+                    tagged_session = self.get_tagged_session(session, session.request_tag)
+                    if tagged_session is None:
+                        self.send_message_to(client_socket, address, f'@{session.request_tag} {Response.BUSY}')
+                        return True
+
+                    tagged_session.request_argument = session.request_argument
+                    (session, target) = (tagged_session, tagged_session.address)
+
+                # ask the client to back off if it exceeded its request rate (STOP is always allowed)
+                if request != Request.STOP and session is not None and not self.consume_rate_for(session):
+                    self.send_message_to(client_socket, target, Response.BUSY)
+                    return True
+
+                # handle request (the connection goes on when a tagged game is over)
+                with self.profiler.span('dispatch'):
+                    return self.dispatch_request(client_socket, target, session, request) or target != address
+
+            except OSError as e:
+                # the response could not be sent, the connection is broken
+                print(colored(f'Connection of client {address} lost: {e}', 'yellow'))
+                self.dispose_client_session(address)
+                return False
             except Exception as e:
                 print(colored(f'Error: {e}', 'red'))
+                try:
+                    self.send_message_to(client_socket, target, Response.ERROR)
+                except OSError as e:
+                    # the error could not be reported either, release the slot of the client
+                    print(colored(f'Connection of client {address} lost: {e}', 'yellow'))
+                    self.dispose_client_session(address)
+                    return False
+
+        return True
+
+    def dispatch_request(self, client_socket, address, session, request):
+        """
+        Handle a received request of a client
+        :param client_socket:
+        :param address:
+        :param session: ClientSession
+        :param request: Request enum
+        :return: False if the client session is over, True otherwise
+        """
+        match request:
+            case Request.START if not self.has_memory_for(session):
+                self.send_message_to(client_socket, address, Response.BUSY)
+            case Request.START:
+                # initialize game map (from the seed of 'START <seed>') and print it on the server terminal
+                seed = parse_seed(session.request_argument)
+                self.leave_room_for(address)
+                self.init_game_map_for(address, seed)
+                self.get_map_for(address).print_map()
+
+                self.send_message_to(client_socket, address, Response.GAME_STARTED)
+            case Request.STOP if session.tag is not None:
+                self.send_message_to(client_socket, address, Response.OK)
+                self.dispose_client_session(address)
+            case Request.STOP:
+                self.dispose_client_session(address)
+                return False
+            case Request.SEND_PLAYER_DETAILS:
+                # send player details to client
+                self.send_message_to(client_socket, address, format_player_details(self.get_player_details_for(address)))
+            case Request.UP:
+                self.try_to_move_player_for(client_socket, address, -1, 0)
+            case Request.DOWN:
+                self.try_to_move_player_for(client_socket, address, 1, 0)
+            case Request.LEFT:
+                self.try_to_move_player_for(client_socket, address, 0, -1)
+            case Request.RIGHT:
+                self.try_to_move_player_for(client_socket, address, 0, 1)
+            case Request.JOIN_ROOM | Request.SPECTATE if session.tag is not None:
+                # the broadcasts of the rooms and the spectated games are not tagged
+                self.send_message_to(client_socket, address, Response.ERROR)
+            case Request.JOIN_ROOM if session.request_argument is None:
+                # the room name is missing
+                self.send_message_to(client_socket, address, Response.ERROR)
+            case Request.JOIN_ROOM if not self.has_memory_for(session):
+                self.send_message_to(client_socket, address, Response.BUSY)
+            case Request.JOIN_ROOM:
+                self.join_room_for(address, session.request_argument)
+                self.send_message_to(client_socket, address, Response.GAME_STARTED)
+            case Request.LEAVE_ROOM:
+                self.leave_room_for(address)
+                self.send_message_to(client_socket, address, Response.OK)
+            case Request.PROFILE:
+                response = self.handle_profile_request(address, session.request_argument)
+                self.send_message_to(client_socket, address, response)
+            case Request.MEMORY:
+                response = self.handle_memory_request(address, session.request_argument)
+                self.send_message_to(client_socket, address, response)
+            case Request.DATAGRAM:
+                self.send_message_to(client_socket, address, self.open_datagram_channel_for(session))
+            case Request.NAME if not is_valid_player_name(session.request_argument):
+                self.send_message_to(client_socket, address, Response.ERROR)
+            case Request.NAME:
+                session.player_name = session.request_argument
+                self.send_message_to(client_socket, address, Response.OK)
+            case Request.TOP:
+                self.send_message_to(client_socket, address, self.get_top_players(session.request_argument))
+            case Request.RANK:
+                self.send_message_to(client_socket, address, self.get_rank_of(session, session.request_argument))
+            case Request.SPECTATE:
+                self.send_message_to(client_socket, address, self.spectate_for(session, session.request_argument))
+                # subscribed after the response, so that the snapshot follows it
+                if session.spectating is not None:
+                    session.spectating.subscribe(session)
+            case Request.UNKNOWN:
                 self.send_message_to(client_socket, address, Response.ERROR)
 
+        return True
+
     def run(self):
+        if self.worker_pool is not None:
+            self.worker_pool.start()
+
+        th.Thread(target=self.broadcast_rooms, daemon=True).start()
+        self.spectator_hub.start()
+
+        if self.datagram_channel is not None:
+            self.datagram_channel.start()
+
+        if self.handshake_timeout > 0 or self.idle_timeout > 0 or self.admission_control.max_pending_wait > 0:
+            th.Thread(target=self.reap_connections, daemon=True).start()
+
+        if self.leaderboard_path is not None:
+            th.Thread(target=self.save_leaderboard, daemon=True).start()
+
+        if self.monster_simulation is not None:
+            self.monster_simulation.start()
+
         # accept client connections
         while True:
             self.accept_client()
@@ -156,9 +991,43 @@ class MultiplexingGameServer(GameServer):
     def __del__(self):
         # close all client sockets and server socket
         super().__del__()
-        for client_session in self.client_sessions.values():
-            client_session[0].close()
+        if self.spawn_pool is not None:
+            self.spawn_pool.shutdown()
+        if self.datagram_channel is not None:
+            self.datagram_channel.close()
+        for client_session in list(self.client_sessions.values()):
+            client_session.client_socket.close()
 
     def dispose_client_session(self, address):
         # remove client session from client_sessions
-        self.client_sessions.pop(address)
+        self.leave_room_for(address)
+        session = self.client_sessions.pop(address, None)
+        if session is None:
+            return
+
+        self.connection_timers.cancel(address)
+        self.memory_budget.remove(address)
+        if session.datagram_token is not None:
+            self.datagram_channel.unregister(session.datagram_token)
+        self.stop_simulation_for(session)
+        self.stop_spectating_for(session)
+        if session.spectator_stream is not None:
+            session.spectator_stream.close()
+
+        if session.connection is not session:
+            # a game multiplexed over a connection, the connection goes on
+            session.connection.tagged_sessions.pop(session.tag, None)
+            session.connection.rate_limiter.resize(-self.rate_limit, -self.rate_burst)
+            return
+
+        for tagged_session in list(session.tagged_sessions.values()):
+            self.dispose_client_session(tagged_session.address)
+
+        if self.worker_pool is not None:
+            self.worker_pool.unregister(session.client_socket)
+        session.client_socket.close()
+
+        # hand the released slot over to the next pending client (if any)
+        pending_client = self.admission_control.release()
+        if pending_client is not None:
+            self.start_client_session(*pending_client)
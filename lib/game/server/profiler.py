@@ -0,0 +1,342 @@
+import contextlib
+import functools
+import os
+import random
+import sys
+import threading
+import time
+
+from lib.colors import colored
+
+# shared no-op context manager returned for the requests which are not sampled
+NULL_SPAN = contextlib.nullcontext()
+
+# since Python 3.12 cProfile is built on sys.monitoring, which allows a single active profiler per process
+# and traces every thread with it: a capture then runs one profile for the whole process instead of one per thread
+PROCESS_WIDE_CAPTURE = sys.version_info >= (3, 12)
+
+
+class Span:
+    """
+    Timing span of a sampled request, recorded with its self time under its full stack of span names
+    """
+    __slots__ = ('profiler', 'state', 'name', 'started')
+
+    def __init__(self, profiler, state, name):
+        self.profiler = profiler
+        self.state = state
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.state.stack.append(self.name)
+        self.state.children_time.append(0.0)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        elapsed = time.perf_counter() - self.started
+        children_time = self.state.children_time.pop()
+        stack = ';'.join(self.state.stack)
+        self.state.stack.pop()
+
+        if len(self.state.children_time) > 0:
+            self.state.children_time[-1] += elapsed
+        else:
+            self.state.sampled = False
+
+        self.profiler.record(stack, elapsed - children_time)
+        return False
+
+
+class CaptureRequest:
+    """
+    Root context of a request: decides if its spans are sampled and runs the request under cProfile during a capture
+    """
+    __slots__ = ('profiler', 'name', 'root', 'profile')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.root = None
+        self.profile = None
+
+    def __enter__(self):
+        self.root = self.profiler.begin_request(self.name)
+        if self.root is not None:
+            self.root.__enter__()
+
+        self.profile = self.profiler.get_capture_profile()
+        if self.profile is not None:
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exception):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.root is not None:
+            self.root.__exit__(*exception)
+        return False
+
+
+class Profiler:
+    """
+    Built-in profiler of the game servers
+
+    Sampled requests record timing spans (receive, dispatch, handlers, send) aggregated by their stack of span names,
+    written in the collapsed-stack format ('frame;frame;frame value' lines) understood by flamegraph tools.
+    On demand, every request handled in the next N seconds also runs under cProfile. cProfile only records
+    caller -> callee edges, not stacks, so a capture is written as pstats and as a call-edge table
+    (not as collapsed stacks: a flame graph drawn from edges would merge unrelated call paths).
+    In the thread per client dispatch mode the receive span also covers the time spent waiting for the client.
+    On Python 3.12+ a capture profiles the whole process (see PROCESS_WIDE_CAPTURE), idle threads included.
+
+    Attributes:
+        enabled (bool): whether timing spans are recorded
+        sample_rate (float): fraction of the requests whose spans are recorded
+        output_dir (str): directory of the profiling outputs
+        span_totals (dict): collapsed stack -> total self time in microseconds
+        capture_profiles (list): cProfile profiles of the running capture (one per thread, or a single one for the
+            whole process), None if no capture runs
+    """
+
+    def __init__(self, enabled=False, sample_rate=0.01, output_dir='profiles'):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.span_totals = {}
+        self.capture_profiles = None
+        self.capture_id = 0
+        self.mutex = threading.Lock()
+        self.local = threading.local()
+
+    @staticmethod
+    def from_env():
+        """
+        Create a profiler configured by the PROFILE, PROFILE_SAMPLE_RATE and PROFILE_DIR environment variables
+        :return: Profiler
+        """
+        return Profiler(
+            enabled=os.environ.get('PROFILE', '0') == '1',
+            sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01)),
+            output_dir=os.environ.get('PROFILE_DIR', 'profiles')
+        )
+
+    def get_state(self):
+        """
+        :return: the profiling state of the current thread
+        """
+        state = self.local
+        if not hasattr(state, 'stack'):
+            state.stack = []
+            state.children_time = []
+            state.sampled = False
+            state.capture_id = -1
+            state.profile = None
+        return state
+
+    def request(self, name='handle_request'):
+        """
+        Context manager around the handling of one request
+        :param name: name of the root span
+        """
+        if not self.enabled and self.capture_profiles is None:
+            return NULL_SPAN
+
+        return CaptureRequest(self, name)
+
+    def begin_request(self, name):
+        """
+        Decide if the request is sampled
+        :param name: name of the root span
+        :return: the root span of a sampled request, None otherwise
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+
+        state = self.get_state()
+        state.sampled = True
+        return Span(self, state, name)
+
+    def span(self, name):
+        """
+        Context manager timing a part of the request (a no-op unless the request is sampled)
+        :param name: span name
+        """
+        if not self.enabled:
+            return NULL_SPAN
+
+        state = self.get_state()
+        if not state.sampled:
+            return NULL_SPAN
+
+        return Span(self, state, name)
+
+    def record(self, stack, duration):
+        with self.mutex:
+            self.span_totals[stack] = self.span_totals.get(stack, 0) + int(duration * 1_000_000)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        print(colored(f'Profiling spans {"enabled" if enabled else "disabled"}', 'yellow'))
+
+    def get_output_path(self, kind, extension):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f'{kind}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.{extension}')
+
+    def dump_spans(self):
+        """
+        Write the recorded spans in collapsed-stack format (values in microseconds) and reset them
+        :return: path of the written file
+        """
+        with self.mutex:
+            span_totals = self.span_totals
+            self.span_totals = {}
+
+        path = self.get_output_path('spans', 'folded')
+        with open(path, 'w') as file:
+            for stack, total in sorted(span_totals.items()):
+                file.write(f'{stack} {total}\n')
+
+        print(colored(f'Profiling spans written to {path}', 'yellow'))
+        return path
+
+    def capture(self, seconds):
+        """
+        Run every request handled in the next seconds under cProfile
+        :param seconds: capture duration
+        :return: False if a capture is already running (or, on Python 3.12+, another profiler is active)
+        """
+        with self.mutex:
+            if self.capture_profiles is not None:
+                return False
+
+            self.capture_id += 1
+            self.capture_profiles = []
+
+            if PROCESS_WIDE_CAPTURE:
+                import cProfile
+
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # another profiler (e.g. a debugger) is already active in the process
+                    self.capture_profiles = None
+                    return False
+                self.capture_profiles.append(profile)
+
+        timer = threading.Timer(seconds, self.finish_capture)
+        timer.daemon = True
+        timer.start()
+
+        print(colored(f'cProfile capture started for {seconds} seconds', 'yellow'))
+        return True
+
+    def get_capture_profile(self):
+        """
+        :return: the cProfile profile of the current thread for the running capture, None if no capture runs
+        """
+        if self.capture_profiles is None or PROCESS_WIDE_CAPTURE:
+            return None
+
+        state = self.get_state()
+        if state.capture_id != self.capture_id:
+            # cProfile is only imported when a capture is requested
+            import cProfile
+
+            state.capture_id = self.capture_id
+            state.profile = cProfile.Profile()
+            with self.mutex:
+                if self.capture_profiles is None:
+                    return None
+                self.capture_profiles.append(state.profile)
+
+        return state.profile
+
+    def finish_capture(self):
+        """
+        Merge the profiles of all the threads and write them as pstats and as a call-edge table
+        """
+        import pstats
+
+        with self.mutex:
+            profiles = self.capture_profiles
+            self.capture_profiles = None
+
+        if PROCESS_WIDE_CAPTURE:
+            profiles[0].disable()
+
+        stats = None
+        for profile in profiles:
+            try:
+                profile.create_stats()
+            except TypeError:
+                continue
+            if len(profile.stats) == 0:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+        if stats is None:
+            print(colored('cProfile capture finished without any handled request', 'yellow'))
+            return
+
+        stats_path = self.get_output_path('cprofile', 'pstats')
+        stats.dump_stats(stats_path)
+
+        edges_path = self.get_output_path('cprofile-edges', 'tsv')
+        with open(edges_path, 'w') as file:
+            for line in to_call_edges(stats):
+                file.write(line + '\n')
+
+        print(colored(f'cProfile capture written to {stats_path} and {edges_path}', 'yellow'))
+
+
+def profiled(name):
+    """
+    Decorator timing a method of a game server (which has a profiler attribute) as a span
+    :param name: span name
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.span(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_frame_name(function):
+    (file_name, line, function_name) = function
+    return f'{function_name} ({os.path.basename(file_name)}:{line})'.replace('\t', ' ')
+
+
+def to_call_edges(stats):
+    """
+    Convert cProfile statistics to a call-edge table: one 'caller<TAB>callee<TAB>microseconds' line per edge,
+    weighted by the callee's own time spent for that caller (the caller is empty for the root functions).
+    The edges cannot be chained into stacks: a function's time is not split by the callers of its caller.
+    :param stats: pstats.Stats
+    :return: list of lines
+    """
+    lines = []
+
+    for function, (_, _, own_time, _, callers) in stats.stats.items():
+        callee = get_frame_name(function)
+
+        if len(callers) == 0:
+            if int(own_time * 1_000_000) > 0:
+                lines.append(f'\t{callee}\t{int(own_time * 1_000_000)}')
+            continue
+
+        for caller, caller_stats in callers.items():
+            caller_own_time = int(caller_stats[2] * 1_000_000)
+            if caller_own_time > 0:
+                lines.append(f'{get_frame_name(caller)}\t{callee}\t{caller_own_time}')
+
+    return lines
@@ -0,0 +1,58 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lib.colors import colored
+from lib.map.random_generator import generate_spawn, read_spawn
+
+
+class SpawnPool:
+    """
+    Pool of worker processes searching the spawn positions of the new games
+
+    The searches are CPU-bound and would hold the GIL on the handler thread of the client starting the game,
+    stalling the moves of every other client; in a worker process they run on another core while the handler
+    thread only waits for the result (a 16-byte record, see SPAWN_RECORD). The workers are forked when the pool
+    is created, so they inherit the maps already loaded by the server process.
+
+    Attributes:
+        max_workers (int): number of worker processes
+        timeout (float): seconds to wait for a spawn before searching it on the handler thread instead
+        executor (ProcessPoolExecutor): the worker processes (None once the pool is broken)
+    """
+
+    def __init__(self, max_workers=2, timeout=5.0):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('fork'))
+
+        # fork the workers now, while the server process has no other threads
+        self.executor.submit(int).result()
+        print(colored(f'Spawn pool started with {max_workers} worker processes', 'green'))
+
+    def get_spawn(self, seed, map_file_path, version):
+        """
+        Searches the spawn positions of a game in a worker process
+        :param seed: int
+        :param map_file_path: str (the map of the game)
+        :param version: int (the version of the map, a worker holding another version reloads it)
+        :return: tuple of (player position, monster position), None if the pool failed to search them
+        """
+        executor = self.executor
+        if executor is None:
+            return None
+
+        try:
+            return read_spawn(executor.submit(generate_spawn, seed, map_file_path, version).result(self.timeout))
+        except BrokenProcessPool:
+            print(colored('Spawn pool is broken, spawns are searched on the handler threads', 'red'))
+            self.executor = None
+        except Exception as e:
+            print(colored(f'Spawn pool failed to search the spawn of seed {seed}: {e}', 'red'))
+
+        return None
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
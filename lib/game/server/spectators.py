@@ -0,0 +1,306 @@
+import threading
+from collections import OrderedDict, deque
+from itertools import groupby, islice
+
+from lib.colors import colored
+from lib.game.server.game_response import Response
+from lib.game.server.game_room import send_nowait
+from lib.map.map_entity import MapEntity
+
+# cells of the static grid sent to the spectators (the player and the monster are sent as positions)
+GRID_CHARACTERS = {MapEntity.WALL: '#', MapEntity.EXIT: 'E'}
+
+# encoded grids of the most recently spectated map templates: (map file path, version) -> str
+# (keyed by version rather than by template, so a reloaded template is not kept alive by the cache)
+template_grids = OrderedDict()
+MAX_TEMPLATE_GRIDS = 64
+template_grids_mutex = threading.Lock()
+
+
+def encode_runs(characters):
+    """
+    Run-length encode a string of cells: '3#.2E' is '###.EE' (the count of a single cell is omitted)
+    :param characters: str
+    :return: str
+    """
+    return ''.join(
+        f'{length}{character}' if length > 1 else character
+        for character, length in ((character, len(list(run))) for character, run in groupby(characters))
+    )
+
+
+def encode_template_grid(template):
+    """
+    Run-length encoded static grid of a map template, encoded once for all the games played on it
+    :param template: MapTemplate or SharedMapTemplate
+    :return: str
+    """
+    key = (template.map_file_path, template.version)
+    with template_grids_mutex:
+        grid = template_grids.get(key)
+        if grid is not None:
+            template_grids.move_to_end(key)
+            return grid
+
+    grid = encode_grid(template.create_map().entity_map)
+
+    with template_grids_mutex:
+        template_grids[key] = grid
+        if len(template_grids) > MAX_TEMPLATE_GRIDS:
+            template_grids.popitem(last=False)
+
+    return grid
+
+
+def encode_grid(entity_map):
+    return encode_runs(''.join(GRID_CHARACTERS.get(cell, '.') for row in entity_map for cell in row))
+
+
+def encode_snapshot(game_map):
+    """
+    Encode the full state of a game:
+    'SPECTATE_SNAPSHOT rows cols seed player_row player_col monster_row monster_col grid'
+    :param game_map: Map object
+    :return: bytes
+    """
+    if game_map.template is not None:
+        grid = encode_template_grid(game_map.template)
+    else:
+        grid = encode_grid(game_map.entity_map)
+
+    (rows, cols) = game_map.map_size
+    (player_row, player_col) = game_map.player_position or (-1, -1)
+    (monster_row, monster_col) = game_map.monster_position or (-1, -1)
+    return (
+        f'{Response.SPECTATE_SNAPSHOT} {rows} {cols} {game_map.seed} '
+        f'{player_row} {player_col} {monster_row} {monster_col} {grid}\n'
+    ).encode()
+
+
+class Subscriber:
+    """
+    Delivery state of one spectator of a stream
+
+    Attributes:
+        session (ClientSession): the spectator's session
+        cursor (int): sequence number of the next event to send
+        needs_snapshot (bool): whether the next message must be a full snapshot
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.cursor = 0
+        self.needs_snapshot = True
+
+
+class SpectatorStream:
+    """
+    Live events of the games of one session, sent to its spectators by the writer thread of the SpectatorHub
+
+    A move only appends one encoded event to a bounded log, whatever the number of spectators. Every spectator
+    has a cursor in the log and gets the events it has not received yet in one write, without blocking: a slow
+    spectator stays behind (the rest of a partially sent write waits in its pending broadcast buffer) and gets
+    a new snapshot instead of the events once its cursor falls out of the log.
+
+    Attributes:
+        hub (SpectatorHub): the hub flushing the stream
+        target (tuple): address of the spectated session
+        game_map (Map): the spectated game (None between two games)
+        events (deque): encoded events, the oldest one has the sequence number first_sequence
+        first_sequence (int): sequence number of the oldest event of the log
+        next_sequence (int): sequence number of the next event
+        max_events (int): maximum number of events kept in the log
+        subscribers (dict): addr -> Subscriber
+        resets (int): number of games followed by the stream (a flush never overwrites the cursors of a newer game)
+        closed (bool): whether the spectated session is over
+    """
+
+    def __init__(self, hub, target, max_events=1024):
+        self.hub = hub
+        self.target = target
+        self.game_map = None
+        self.events = deque()
+        self.first_sequence = 0
+        self.next_sequence = 0
+        self.max_events = max_events
+        self.subscribers = {}
+        self.resets = 0
+        self.closed = False
+        self.mutex = threading.Lock()
+
+    def publish(self, kind, position):
+        """
+        Add a position change to the log: 'SPECTATE_DELTA kind row col' (P for the player, M for the monster)
+        :param kind: str
+        :param position: tuple
+        """
+        self.append(f'{Response.SPECTATE_DELTA} {kind} {position[0]} {position[1]}\n'.encode())
+
+    def publish_result(self, response):
+        """
+        Add the end of a game to the log: 'SPECTATE_DELTA GAME_WON' or 'SPECTATE_DELTA GAME_OVER'
+        :param response: Response enum
+        """
+        self.append(f'{Response.SPECTATE_DELTA} {response}\n'.encode())
+
+    def append(self, payload):
+        with self.mutex:
+            self.events.append(payload)
+            self.next_sequence += 1
+            if len(self.events) > self.max_events:
+                self.events.popleft()
+                self.first_sequence += 1
+
+        self.hub.notify(self)
+
+    def reset(self, game_map):
+        """
+        Follow a new game of the session: the spectators get its snapshot
+        (or 'SPECTATE_DELTA END' if the session is not playing a private game anymore)
+        :param game_map: Map object or None
+        """
+        if game_map is not None and game_map.chunked:
+            # a chunked map is too large for a snapshot, so its games are not spectated
+            game_map = None
+
+        with self.mutex:
+            if self.game_map is not None and self.game_map is not game_map:
+                self.game_map.spectator_stream = None
+            self.game_map = game_map
+            if game_map is not None:
+                game_map.spectator_stream = self
+
+            self.events.clear()
+            self.first_sequence = self.next_sequence
+            self.resets += 1
+            for subscriber in self.subscribers.values():
+                subscriber.cursor = self.first_sequence
+                subscriber.needs_snapshot = game_map is not None
+
+        if game_map is None:
+            self.append(f'{Response.SPECTATE_DELTA} END\n'.encode())
+        else:
+            self.hub.notify(self)
+
+    def subscribe(self, session):
+        with self.mutex:
+            self.subscribers[session.address] = Subscriber(session)
+
+        self.hub.notify(self)
+
+    def unsubscribe(self, address):
+        with self.mutex:
+            self.subscribers.pop(address, None)
+
+    def close(self):
+        """
+        End the stream (the spectated session is over): the spectators get 'SPECTATE_DELTA END'
+        """
+        # END is in the log before the stream is closed, so a flush which sees it closed also sends END
+        self.reset(None)
+        with self.mutex:
+            self.closed = True
+        self.hub.notify(self)
+
+    def flush(self):
+        """
+        Send every spectator the events it has not received yet (or a snapshot), without blocking
+        :return: True if some spectators are still behind (their sockets or send locks were busy)
+        """
+        with self.mutex:
+            snapshot = None
+            first_sequence = self.first_sequence
+            next_sequence = self.next_sequence
+            resets = self.resets
+            # a closed stream already has its END event in the log, so it is in the events copied here
+            closed = self.closed
+            subscribers = list(self.subscribers.values())
+            cursors = [
+                subscriber.cursor for subscriber in subscribers
+                if not subscriber.needs_snapshot and subscriber.cursor >= first_sequence
+            ]
+            # only the events some spectator has not received yet are copied
+            events = list(islice(self.events, min(cursors, default=next_sequence) - first_sequence, None))
+            first_sequence = next_sequence - len(events)
+
+            if self.game_map is not None and len(cursors) < len(subscribers):
+                # encoded once for all the spectators which need it
+                snapshot = encode_snapshot(self.game_map)
+
+        behind = False
+        sent = []
+        for subscriber in subscribers:
+            if subscriber.needs_snapshot or subscriber.cursor < first_sequence:
+                if snapshot is None:
+                    continue
+                payload = snapshot
+            else:
+                payload = b''.join(events[subscriber.cursor - first_sequence:])
+
+            if len(payload) == 0:
+                continue
+
+            if send_nowait(subscriber.session, payload):
+                sent.append(subscriber)
+            else:
+                behind = True
+
+        with self.mutex:
+            if self.resets == resets:
+                for subscriber in sent:
+                    subscriber.cursor = next_sequence
+                    subscriber.needs_snapshot = False
+
+        if closed and not behind:
+            with self.mutex:
+                for subscriber in self.subscribers.values():
+                    if subscriber.session.spectating is self:
+                        subscriber.session.spectating = None
+                self.subscribers.clear()
+
+        return behind
+
+
+class SpectatorHub:
+    """
+    Writer thread sending the spectator streams, so that the handler threads of the players never write
+    to the spectators' sockets
+
+    Attributes:
+        retry_interval (float): seconds before retrying the spectators which could not be written to
+        dirty (set): streams with events to send
+    """
+
+    def __init__(self, retry_interval=0.05):
+        self.retry_interval = retry_interval
+        self.dirty = set()
+        self.condition = threading.Condition()
+
+    def notify(self, stream):
+        with self.condition:
+            self.dirty.add(stream)
+            self.condition.notify()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        """
+        Main loop of the writer thread
+        """
+        behind = set()
+
+        while True:
+            with self.condition:
+                if len(self.dirty) == 0:
+                    self.condition.wait(self.retry_interval if len(behind) > 0 else None)
+                streams = self.dirty | behind
+                self.dirty = set()
+
+            behind = set()
+            for stream in streams:
+                try:
+                    if stream.flush():
+                        behind.add(stream)
+                except Exception as e:
+                    print(colored(f'Error while sending the spectators of {stream.target}: {e}', 'red'))
@@ -0,0 +1,52 @@
+import atexit
+import os
+import time
+
+from lib.map.chunked_map import chunk_cache
+from lib.map.map_catalog import map_catalog
+from lib.map.map_repository import map_repository
+
+
+def warm_up(started_at):
+    """
+    Startup phase of a server process: loads and indexes every map before any connection is accepted
+    (or attaches to the maps shared by the other server processes of the host if SHARED_MAPS is set),
+    then reports the readiness of the process (in the log and, if READY_FILE is set, in a readiness file).
+    The messages of this phase are plain, so the display dependencies (termcolor) are only imported once it is over
+    :param started_at: time.perf_counter() value taken when the process started
+    :return: startup duration in seconds
+    """
+    # map files above CHUNKED_MAP_BYTES are loaded chunk by chunk within the budget of the chunk cache
+    map_repository.chunked_map_bytes = int(os.environ.get('CHUNKED_MAP_BYTES', map_repository.chunked_map_bytes))
+    chunk_cache.chunk_size = int(os.environ.get('MAP_CHUNK_SIZE', chunk_cache.chunk_size))
+    chunk_cache.max_chunks = int(os.environ.get('MAP_CHUNK_CACHE', chunk_cache.max_chunks))
+
+    shared_maps = os.environ.get('SHARED_MAPS')
+    if shared_maps:
+        # the store is only imported when the maps are shared between the processes of the host
+        from lib.map.shared_map_store import SharedMapStore
+
+        store = SharedMapStore(shared_maps)
+        (maps_count, maps_duration) = map_repository.load_shared(store)
+        atexit.register(store.close)
+        print(
+            f'{"Published" if store.owner else "Attached to"} {maps_count} shared maps ({shared_maps}) '
+            f'in {maps_duration * 1000:.1f} ms'
+        )
+    else:
+        (maps_count, maps_duration) = map_repository.preload()
+        print(f'Loaded and indexed {maps_count} maps in {maps_duration * 1000:.1f} ms')
+
+    # the catalog adopts the loaded templates (the chunked maps are only discovered)
+    map_catalog.refresh()
+    print(f'Map catalog has {len(map_catalog.snapshot.map_paths)} maps')
+
+    startup_duration = time.perf_counter() - started_at
+    print(f'Server is ready, startup took {startup_duration * 1000:.1f} ms')
+
+    ready_file = os.environ.get('READY_FILE')
+    if ready_file:
+        with open(ready_file, 'w') as file:
+            file.write(f'maps={maps_count}\nstartup_ms={startup_duration * 1000:.1f}\n')
+
+    return startup_duration
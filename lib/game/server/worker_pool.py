@@ -0,0 +1,189 @@
+import queue
+import selectors
+import socket
+import threading
+from collections import deque
+
+from lib.colors import colored
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of worker threads serving the requests of many client connections
+
+    A selector thread waits for client sockets to become readable, receives what they hold without blocking
+    and puts them in a bounded work queue once a complete request is buffered, so a slow or stalled client never
+    holds a worker. A socket is taken out of the selector while it is queued or served, so at most one worker
+    handles a connection at a time and every ready connection gets exactly one place in the queue (FIFO fairness).
+
+    Attributes:
+        handle_request (callable): handles one request of a client, returns False when the session is over
+        reject_request (callable): consumes one buffered request of a client and tells it to back off without
+            blocking (queue is full)
+        has_pending_request (callable): receives without blocking and checks if a complete request of a client
+            (or its disconnection) is buffered
+        pool_size (int): number of worker threads
+        queue_depth (int): maximum number of ready connections waiting for a worker
+        fairness (int): maximum number of requests served for one connection before it goes back to the selector
+    """
+
+    def __init__(self, handle_request, reject_request, has_pending_request=None, pool_size=8, queue_depth=256,
+                 fairness=1):
+        self.handle_request = handle_request
+        self.reject_request = reject_request
+        self.has_pending_request = has_pending_request or (lambda client_socket, _address: has_pending_data(client_socket))
+        self.pool_size = pool_size
+        self.queue_depth = queue_depth
+        self.fairness = max(1, fairness)
+
+        self.selector = selectors.DefaultSelector()
+        self.work_queue = queue.Queue(maxsize=queue_depth)
+        # selector changes requested by other threads, applied by the selector thread
+        self.pending_changes = deque()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.threads = []
+        self.running = False
+
+    def start(self):
+        """
+        Start the selector thread and the worker threads
+        """
+        self.running = True
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+
+        self.threads.append(start_thread(self.select_loop, 'selector'))
+        for index in range(self.pool_size):
+            self.threads.append(start_thread(self.work_loop, f'worker-{index}'))
+
+        print(colored(f'Worker pool started with {self.pool_size} workers (queue depth: {self.queue_depth})', 'green'))
+
+    def stop(self):
+        """
+        Stop the selector thread and the worker threads
+        """
+        self.running = False
+        self.wake_up()
+        for _ in range(self.pool_size):
+            self.work_queue.put(None)
+
+    def register(self, client_socket, address):
+        """
+        Start watching a client socket for incoming requests
+        :param client_socket:
+        :param address:
+        """
+        self.pending_changes.append((True, client_socket, address))
+        self.wake_up()
+
+    def unregister(self, client_socket):
+        """
+        Stop watching a client socket (e.g. because its session was disposed)
+        :param client_socket:
+        """
+        self.pending_changes.append((False, client_socket, None))
+        self.wake_up()
+
+    def wake_up(self):
+        """
+        Interrupt the selector so that it applies the pending changes
+        """
+        try:
+            self.wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def apply_pending_changes(self):
+        while len(self.pending_changes) > 0:
+            (is_register, client_socket, address) = self.pending_changes.popleft()
+            try:
+                if is_register:
+                    self.selector.register(client_socket, selectors.EVENT_READ, address)
+                else:
+                    self.selector.unregister(client_socket)
+            except (KeyError, ValueError, OSError):
+                # the socket was closed or is not watched anymore
+                pass
+
+    def select_loop(self):
+        """
+        Main loop of the selector thread
+        """
+        while self.running:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.wakeup_reader:
+                    try:
+                        while self.wakeup_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+
+                client_socket, address = key.fileobj, key.data
+                # a closed socket is unregistered by its session, a partial request stays watched until it is complete
+                if client_socket.fileno() == -1 or not self.has_pending_request(client_socket, address):
+                    continue
+
+                # the socket is served by a single worker, so it leaves the selector until the worker is done
+                self.selector.unregister(client_socket)
+
+                try:
+                    self.work_queue.put_nowait((client_socket, address))
+                except queue.Full:
+                    # all workers are busy and the queue is full, so the client has to back off
+                    self.reject_request(client_socket, address)
+                    self.register(client_socket, address)
+
+            self.apply_pending_changes()
+
+    def work_loop(self):
+        """
+        Main loop of a worker thread
+        """
+        while True:
+            work = self.work_queue.get()
+            if work is None:
+                break
+
+            (client_socket, address) = work
+            served_requests = 0
+            keep_session = True
+
+            # serve up to `fairness` requests which are already available, then give other connections a turn
+            while keep_session and served_requests < self.fairness:
+                keep_session = self.handle_request(client_socket, address)
+                served_requests += 1
+
+                if not keep_session or not self.has_pending_request(client_socket, address):
+                    break
+
+            # requests which were already received do not wake the selector up, so the connection goes back to the queue
+            # (or is served right away if the queue is full)
+            requeued = False
+            while keep_session and not requeued and self.has_pending_request(client_socket, address):
+                try:
+                    self.work_queue.put_nowait((client_socket, address))
+                    requeued = True
+                except queue.Full:
+                    keep_session = self.handle_request(client_socket, address)
+
+            if keep_session and not requeued and client_socket.fileno() != -1:
+                self.register(client_socket, address)
+
+
+def start_thread(target, name):
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def has_pending_data(client_socket):
+    """
+    Checks (without blocking) if a socket has data waiting to be received
+    :param client_socket:
+    :return: bool
+    """
+    try:
+        return len(client_socket.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)) > 0
+    except (BlockingIOError, OSError):
+        return False
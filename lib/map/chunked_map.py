@@ -0,0 +1,450 @@
+import os
+import random
+import sys
+import threading
+from collections import OrderedDict, deque
+
+from lib.colors import colored
+from lib.map.map import MONSTER_OFFSETS, Map
+from lib.map.map_entity import MapEntity, to_map_entity
+
+# map file characters -> map entities
+CELL_ENTITIES = {ord(value): to_map_entity(value) for value in '.#JME'}
+EMPTY_CODE = ord('.')
+EXIT_CODE = ord('E')
+
+
+class ChunkCache:
+    """
+    Class for keeping the most recently used chunks of the chunked maps within a fixed memory budget
+
+    Attributes
+    ----------
+    chunk_size : int (the chunks are chunk_size x chunk_size cells, one byte per cell)
+    max_chunks : int (the maximum number of chunks in memory, the least recently used one is evicted first)
+    chunks : OrderedDict (((map file path, version), chunk row, chunk column) -> (chunk width, chunk cells))
+    files : dict ((map file path, version) -> ChunkedMapFile opened by the maps of that version)
+    loads : int (the number of chunks read from disk)
+    evictions : int (the number of evicted chunks)
+    """
+
+    def __init__(self, chunk_size=64, max_chunks=1024):
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+        self.files = {}
+        self.loads = 0
+        self.evictions = 0
+        self.mutex = threading.Lock()
+
+    def get(self, key, load_chunk):
+        """
+        Returns a chunk, loading it on a miss
+        :param key: tuple of ((map file path, version), chunk row, chunk column)
+        :param load_chunk: function loading the chunk from disk
+        :return: tuple of (chunk width, chunk cells)
+        """
+        with self.mutex:
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                self.chunks.move_to_end(key)
+                return chunk
+
+        chunk = load_chunk(key[1], key[2])
+
+        with self.mutex:
+            self.chunks[key] = chunk
+            self.loads += 1
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+                self.evictions += 1
+
+        return chunk
+
+    def get_budget(self):
+        """
+        Returns the memory budget of the cached cells in bytes
+        :return: int
+        """
+        return self.chunk_size * self.chunk_size * self.max_chunks
+
+    def open_file(self, map_file_path):
+        """
+        Returns the open file of the current version of a map, opening it if no map of that version uses it yet
+        :param map_file_path: map file path
+        :return: ChunkedMapFile (to be closed with close_file)
+        """
+        version = os.stat(map_file_path).st_mtime_ns
+
+        with self.mutex:
+            map_file = self.files.get((map_file_path, version))
+            if map_file is None:
+                map_file = ChunkedMapFile(map_file_path)
+                # the file may have been replaced since it was checked, the open file has the final say
+                self.files[(map_file_path, map_file.version)] = map_file
+
+            map_file.references += 1
+            return map_file
+
+    def close_file(self, map_file):
+        """
+        Release a file returned by open_file, closing it when no map uses it anymore
+        :param map_file: ChunkedMapFile
+        """
+        with self.mutex:
+            map_file.references -= 1
+            if map_file.references > 0:
+                return
+
+            if self.files.get((map_file.map_file_path, map_file.version)) is map_file:
+                del self.files[(map_file.map_file_path, map_file.version)]
+
+        map_file.close()
+
+    def get_stats(self):
+        with self.mutex:
+            return {
+                'chunks': len(self.chunks),
+                'files': len(self.files),
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
+
+
+class ChunkedMapFile:
+    """
+    Class for an open map file, shared by all the chunked maps of the same file version
+
+    The chunks are read with positional reads, so the maps read the file concurrently without seeking it.
+
+    Attributes
+    ----------
+    map_file_path : str (the map file path)
+    file : file (the open map file; a replaced map file gets a new one, this one keeps reading the old file)
+    version : int (the modification time of the open file, in ns)
+    row_stride : int (the number of bytes of a row, line break included)
+    map_size : tuple (the map size)
+    references : int (the number of maps using the file)
+    """
+
+    def __init__(self, map_file_path):
+        self.map_file_path = map_file_path
+        self.file = open(map_file_path, 'rb')
+        status = os.fstat(self.file.fileno())
+        self.version = status.st_mtime_ns
+
+        first_line = self.file.readline()
+        self.row_stride = len(first_line)
+        self.map_size = (-(-status.st_size // self.row_stride), len(first_line.rstrip(b'\r\n')))
+        self.references = 0
+
+    def read(self, offset, size):
+        return os.pread(self.file.fileno(), size, offset)
+
+    def close(self):
+        self.file.close()
+
+
+# chunks shared by all the chunked maps of the process
+chunk_cache = ChunkCache()
+
+
+class ChunkedGrid:
+    """
+    Class for accessing the cells of a chunked map as grid[row][col], like the entity map of a Map
+    """
+
+    def __init__(self, game_map):
+        self.game_map = game_map
+
+    def __len__(self):
+        return self.game_map.map_size[0]
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.game_map.map_size[0]
+        return ChunkedRow(self.game_map, row)
+
+
+class ChunkedRow:
+    """
+    Class for accessing one row of a chunked map without loading the whole row
+    """
+
+    def __init__(self, game_map, row):
+        self.game_map = game_map
+        self.row = row
+
+    def __len__(self):
+        return self.game_map.map_size[1]
+
+    def __getitem__(self, col):
+        return self.game_map.get_value_at((self.row, col))
+
+    def __setitem__(self, col, value):
+        self.game_map.set_entity_position((self.row, col), value)
+
+
+class ChunkedMap(Map):
+    """
+    Class for representing a Game Map too large to be parsed into memory
+
+    The map file is split into fixed-size chunks which are read from disk when a move or a search reaches them
+    and are kept in a shared LRU chunk cache, so hosting many huge maps stays within the budget of the cache.
+    The games of the same map file version share one open file, held by the cache.
+    The cells changed by the game (player and monster positions) are kept in a small overlay.
+    The searches of the spawn positions are bounded by max_search_cells: a region which is still growing when
+    the bound is reached is assumed to lead to an exit (only small enclosed regions are rejected).
+
+    Attributes
+    ----------
+    chunk_cache : ChunkCache (the cache of the loaded chunks)
+    map_file : ChunkedMapFile (the open map file, shared through the chunk cache)
+    overlay : dict (position -> entity of the cells changed by the game)
+    max_search_cells : int (the maximum number of cells visited by a search)
+    spawn_samples : int (the number of player spawn positions sampled for the map)
+    """
+
+    # the whole map is never in memory
+    chunked = True
+
+    def __init__(self, map_file_path, chunk_cache=chunk_cache, max_search_cells=4096, spawn_samples=4):
+        self.chunk_cache = chunk_cache
+        self.overlay = {}
+        self.max_search_cells = max_search_cells
+        self.spawn_samples = spawn_samples
+        self.player_valid_positions = None
+        self.map_file = None
+        self.last_chunk = (None, None)
+
+        super().__init__(map_file_path)
+
+    def read_map(self):
+        """
+        Reads the size of the map, the cells are read chunk by chunk when they are needed
+        """
+        self.map_file = self.chunk_cache.open_file(self.map_file_path)
+        # a replaced map file gets other chunks, the open file keeps reading the old one
+        self.version = self.map_file.version
+        self.map_size = self.map_file.map_size
+        self.entity_map = ChunkedGrid(self)
+
+    def mark_exit_positions(self):
+        # the exits are marked when the chunks on the edges of the map are loaded
+        pass
+
+    def load_chunk(self, chunk_row, chunk_col):
+        """
+        Reads a chunk from the map file and marks the exits on its edge cells
+        :return: tuple of (chunk width, chunk cells)
+        """
+        chunk_size = self.chunk_cache.chunk_size
+        (rows, cols) = self.map_size
+        (first_row, first_col) = (chunk_row * chunk_size, chunk_col * chunk_size)
+        width = min(chunk_size, cols - first_col)
+        row_stride = self.map_file.row_stride
+        cells = bytearray()
+
+        for row in range(first_row, min(first_row + chunk_size, rows)):
+            cells += self.map_file.read(row * row_stride + first_col, width)
+
+        # only the chunks on the edges of the map have exits
+        height = len(cells) // width
+        edge_indexes = set()
+        if first_row == 0:
+            edge_indexes.update(range(width))
+        if first_row + height == rows:
+            edge_indexes.update(range((height - 1) * width, height * width))
+        if first_col == 0:
+            edge_indexes.update(range(0, height * width, width))
+        if first_col + width == cols:
+            edge_indexes.update(range(width - 1, height * width, width))
+
+        for index in edge_indexes:
+            if cells[index] == EMPTY_CODE:
+                cells[index] = EXIT_CODE
+
+        return width, bytes(cells)
+
+    def get_value_at(self, position):
+        value = self.overlay.get(position)
+        if value is not None:
+            return value
+
+        (row, col) = position
+        chunk_size = self.chunk_cache.chunk_size
+        key = ((self.map_file_path, self.version), row // chunk_size, col // chunk_size)
+
+        # consecutive accesses mostly hit the same chunk
+        (last_key, chunk) = self.last_chunk
+        if last_key != key:
+            chunk = self.chunk_cache.get(key, self.load_chunk)
+            self.last_chunk = (key, chunk)
+
+        (width, cells) = chunk
+        return CELL_ENTITIES[cells[(row % chunk_size) * width + col % chunk_size]]
+
+    def set_entity_position(self, position, value=MapEntity.EMPTY_CELL):
+        self.overlay.pop(position, None)
+        if self.get_value_at(position) != value:
+            self.overlay[position] = value
+
+    def get_next_positions(self, current_position):
+        (row, col) = current_position
+        return [
+            (row + dx, col + dy) for (dx, dy) in ((-1, 0), (1, 0), (0, -1), (0, 1))
+            if self.is_in_matrix(row + dx, col + dy) and self.get_value_at((row + dx, col + dy)) != MapEntity.WALL
+        ]
+
+    def is_move_possible(self, dx, dy):
+        (row, col) = self.player_position
+        return self.is_in_matrix(row + dx, col + dy) \
+            and self.get_value_at((row + dx, col + dy)) in (MapEntity.EMPTY_CELL, MapEntity.PLAYER)
+
+    def search_exit(self, start, blocked=None):
+        """
+        Bounded BFS from a position to the closest exit
+        :param start: tuple
+        :param blocked: position treated as a wall (e.g. the monster)
+        :return: distance to the closest exit, -1 if the search bound was reached, None if no exit is reachable
+        """
+        distances = {start: 0}
+        bfs_queue = deque([start])
+
+        while len(bfs_queue) > 0:
+            current_position = bfs_queue.popleft()
+            if self.get_value_at(current_position) == MapEntity.EXIT:
+                return distances[current_position]
+
+            if len(distances) >= self.max_search_cells:
+                return -1
+
+            for next_position in self.get_next_positions(current_position):
+                if next_position not in distances and next_position != blocked:
+                    distances[next_position] = distances[current_position] + 1
+                    bfs_queue.append(next_position)
+
+        return None
+
+    def is_player_valid_position(self, position):
+        """
+        Checks if a position is empty and more than 2 moves away from the closest exit
+        :param position: tuple
+        :return: bool
+        """
+        if self.get_value_at(position) != MapEntity.EMPTY_CELL:
+            return False
+
+        distance = self.search_exit(position)
+        return distance is not None and (distance == -1 or distance > 2)
+
+    def get_player_valid_positions(self):
+        """
+        Returns a sample of the valid player positions, drawn with the seed of the map
+        (the map is scanned if the random sample found none)
+        :return: list of tuples (empty only if the map has no valid player position)
+        """
+        if self.player_valid_positions is not None:
+            return self.player_valid_positions
+
+        rng = random.Random(self.seed)
+        (rows, cols) = self.map_size
+        positions = []
+
+        for _ in range(self.spawn_samples * 16):
+            position = (rng.randrange(rows), rng.randrange(cols))
+            if self.is_player_valid_position(position):
+                positions.append(position)
+                if len(positions) == self.spawn_samples:
+                    break
+
+        if len(positions) == 0:
+            # an unlucky sample, or a map with few cells far enough from the exits
+            positions = self.scan_player_valid_positions(rng.randrange(rows))
+
+        self.player_valid_positions = positions
+        return positions
+
+    def scan_player_valid_positions(self, first_row):
+        """
+        Scans the map row by row for valid player positions, from a row on and wrapping around
+        :param first_row: int
+        :return: list of up to spawn_samples tuples
+        """
+        (rows, cols) = self.map_size
+        positions = []
+
+        for index in range(rows):
+            row = (first_row + index) % rows
+            for col in range(cols):
+                if self.is_player_valid_position((row, col)):
+                    positions.append((row, col))
+                    if len(positions) == self.spawn_samples:
+                        return positions
+
+        return positions
+
+    def get_monster_valid_positions(self):
+        """
+        Returns the empty positions at a Manhattan distance of 3 from the player which lead to an exit
+        and do not cut the player off from the exits
+        :return: list of tuples
+        """
+        (row, col) = self.player_position
+        valid_positions = [
+            (row + dx, col + dy) for (dx, dy) in MONSTER_OFFSETS
+            if self.is_in_matrix(row + dx, col + dy)
+            and self.get_value_at((row + dx, col + dy)) == MapEntity.EMPTY_CELL
+        ]
+
+        return [
+            position for position in valid_positions
+            if self.search_exit(position) is not None
+            and self.is_exit_reachable_with_monster(position)
+        ]
+
+    def is_exit_reachable_with_monster(self, monster_position):
+        return self.search_exit(self.player_position, blocked=monster_position) is not None
+
+    def get_memory_size(self):
+        """
+        Returns the estimated size of the data owned by this game in bytes (the chunks are shared by all the games)
+        :return: int
+        """
+        return sys.getsizeof(self.overlay) + sys.getsizeof(self.player_valid_positions or [])
+
+    def get_all_positions(self):
+        """
+        Returns all the positions of the map, lazily (a list of them would not fit in memory)
+        :return: iterator of tuples
+        """
+        (rows, cols) = self.map_size
+        return ((row, col) for row in range(rows) for col in range(cols))
+
+    def print_map(self, radius=10):
+        """
+        Prints the part of the map around the player
+        :param radius: number of rows and columns printed on each side of the player
+        """
+        (row, col) = self.player_position or (0, 0)
+        print(colored(f'Chunked map {self.map_file_path} {self.map_size}, around {self.player_position}:', 'yellow'))
+
+        for current_row in range(max(0, row - radius), min(self.map_size[0], row + radius + 1)):
+            for current_col in range(max(0, col - radius), min(self.map_size[1], col + radius + 1)):
+                match self.get_value_at((current_row, current_col)):
+                    case MapEntity.EMPTY_CELL:
+                        print(' ', end='')
+                    case MapEntity.WALL:
+                        print(colored('#', 'yellow'), end='')
+                    case MapEntity.PLAYER:
+                        print(colored('J', 'green'), end='')
+                    case MapEntity.MONSTER:
+                        print(colored('M', 'red'), end='')
+                    case MapEntity.EXIT:
+                        print(colored('E', 'blue'), end='')
+            print()
+
+    def __del__(self):
+        if self.map_file is not None:
+            self.chunk_cache.close_file(self.map_file)
+            self.map_file = None
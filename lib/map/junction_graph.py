@@ -0,0 +1,363 @@
+import heapq
+from array import array
+
+
+class JunctionGraph:
+    """
+    Class for representing a map graph with its corridors collapsed, with a hierarchical index for pathfinding
+
+    The nodes are the junctions of the map (the cells with other than 2 neighbors, i.e. crossings and dead ends)
+    and the exits. Every corridor (chain of cells with exactly 2 neighbors) between two nodes is collapsed into
+    one edge weighted by its length, and every corridor cell keeps its edge and its offset on the edge,
+    so the searches from a cell start at the ends of its corridor and only visit nodes.
+    The distance of every node to the closest exit is precomputed, so the exit distance of any cell
+    is read from the two ends of its corridor.
+
+    For the shortest path queries the nodes are grouped into square clusters of cells (HPA*-style): the nodes
+    with an edge to another cluster are the entrances of their cluster, and the distances between the entrances
+    of every cluster are precomputed. A query searches the clusters of its two ends, then the abstract graph
+    of the entrances only.
+
+    Attributes
+    ----------
+    map_size : tuple (the map size)
+    cluster_size : int (the clusters are cluster_size x cluster_size cells)
+    node_cells : array (the cell id of every node)
+    node_of : array (the node id of every cell, -1 for walls and corridor cells)
+    edge_of : array (the edge id of every corridor cell, -1 for the other cells)
+    offset_of : array (the distance of every corridor cell from the first node of its edge)
+    edge_nodes : array (the two node ids of every edge)
+    edge_lengths : array (the length of every edge in moves)
+    node_offsets : array (nodes + 1 offsets into node_edges)
+    node_edges : array (the edge ids of every node)
+    exit_distances : array (the distance of every node to the closest exit, -1 if no exit is reachable)
+    components : array (the connected component of every node)
+    entrances : dict (node id -> list of (node id, distance) edges of the abstract graph)
+    cluster_entrances : dict (cluster id -> list of the entrance node ids of the cluster)
+    """
+
+    def __init__(self, graph, cluster_size=16):
+        (rows, cols) = graph.map_size
+        cells = rows * cols
+        offsets = graph.offsets
+        neighbors = graph.neighbors
+
+        self.map_size = graph.map_size
+        self.cluster_size = cluster_size
+        self.exit_flags = graph.exit_flags
+        self.node_of = array('i', [-1]) * cells
+        self.edge_of = array('i', [-1]) * cells
+        self.offset_of = array('i', bytes(4 * cells))
+        self.node_cells = array('i')
+        self.edge_nodes = array('i')
+        self.edge_lengths = array('i')
+
+        for cell in range(cells):
+            if not graph.walls[cell] and (offsets[cell + 1] - offsets[cell] != 2 or graph.exit_flags[cell]):
+                self.add_node(cell)
+
+        # collapse the corridors starting at every node
+        for node in range(len(self.node_cells)):
+            self.add_corridors(graph, node)
+
+        # the cycles without any junction are collapsed into a loop on one of their cells
+        for cell in range(cells):
+            if not graph.walls[cell] and self.node_of[cell] == -1 and self.edge_of[cell] == -1:
+                self.add_corridors(graph, self.add_node(cell))
+
+        self.node_offsets = array('i', bytes(4 * (len(self.node_cells) + 1)))
+        self.node_edges = array('i')
+        node_edge_lists = [[] for _ in range(len(self.node_cells))]
+        for edge in range(len(self.edge_lengths)):
+            (first, second) = self.edge_nodes[2 * edge:2 * edge + 2]
+            node_edge_lists[first].append(edge)
+            if second != first:
+                node_edge_lists[second].append(edge)
+        for node, edges in enumerate(node_edge_lists):
+            self.node_edges.extend(edges)
+            self.node_offsets[node + 1] = len(self.node_edges)
+
+        self.exit_distances = array('i', [-1]) * len(self.node_cells)
+        for (node, distance) in self.get_node_distances([(self.node_of[cell], 0) for cell in graph.exits]).items():
+            self.exit_distances[node] = distance
+
+        self.components = self.get_components()
+        self.cluster_entrances = {}
+        self.entrances = self.get_abstract_graph()
+
+    def add_node(self, cell):
+        self.node_of[cell] = len(self.node_cells)
+        self.node_cells.append(cell)
+        return self.node_of[cell]
+
+    def add_corridors(self, graph, node):
+        """
+        Collapse the corridors leaving a node into edges (the corridors already collapsed from their other end
+        are skipped)
+        :param graph: MapGraph
+        :param node: node id
+        """
+        offsets = graph.offsets
+        neighbors = graph.neighbors
+        cell = self.node_cells[node]
+
+        for index in range(offsets[cell], offsets[cell + 1]):
+            next_cell = neighbors[index]
+            edge = len(self.edge_lengths)
+
+            if self.node_of[next_cell] != -1:
+                # two adjacent nodes, added once
+                if next_cell > cell:
+                    self.add_edge(node, self.node_of[next_cell], 1)
+                continue
+            if self.edge_of[next_cell] != -1:
+                continue
+
+            (previous_cell, current_cell, length) = (cell, next_cell, 1)
+            while self.node_of[current_cell] == -1:
+                self.edge_of[current_cell] = edge
+                self.offset_of[current_cell] = length
+                (first, second) = (neighbors[offsets[current_cell]], neighbors[offsets[current_cell] + 1])
+                (previous_cell, current_cell) = (current_cell, second if first == previous_cell else first)
+                length += 1
+
+            self.add_edge(node, self.node_of[current_cell], length)
+
+    def add_edge(self, first, second, length):
+        self.edge_nodes.extend((first, second))
+        self.edge_lengths.append(length)
+
+    def get_other_node(self, edge, node):
+        first = self.edge_nodes[2 * edge]
+        return self.edge_nodes[2 * edge + 1] if first == node else first
+
+    def get_anchors(self, cell):
+        """
+        Returns the nodes a cell is attached to: the cell's own node, or the two ends of its corridor
+        :param cell: cell id
+        :return: list of (node id, distance) tuples
+        """
+        node = self.node_of[cell]
+        if node != -1:
+            return [(node, 0)]
+
+        edge = self.edge_of[cell]
+        if edge == -1:
+            return []
+
+        offset = self.offset_of[cell]
+        return [(self.edge_nodes[2 * edge], offset), (self.edge_nodes[2 * edge + 1], self.edge_lengths[edge] - offset)]
+
+    def get_node_distances(self, sources, allowed=None):
+        """
+        Dijkstra over the nodes
+        :param sources: list of (node id, initial distance) tuples
+        :param allowed: function telling if a node can be visited, None to visit all the nodes
+        :return: dict (node id -> distance to the closest source, for the reachable nodes only)
+        """
+        distances = {}
+        heap = [(distance, node) for (node, distance) in sources]
+        heapq.heapify(heap)
+
+        while len(heap) > 0:
+            (distance, node) = heapq.heappop(heap)
+            if node in distances:
+                continue
+            distances[node] = distance
+
+            for index in range(self.node_offsets[node], self.node_offsets[node + 1]):
+                edge = self.node_edges[index]
+                next_node = self.get_other_node(edge, node)
+                if next_node not in distances and (allowed is None or allowed(next_node)):
+                    heapq.heappush(heap, (distance + self.edge_lengths[edge], next_node))
+
+        return distances
+
+    def get_components(self):
+        components = array('i', [-1]) * len(self.node_cells)
+
+        for start in range(len(self.node_cells)):
+            if components[start] != -1:
+                continue
+
+            components[start] = start
+            stack = [start]
+            while len(stack) > 0:
+                node = stack.pop()
+                for index in range(self.node_offsets[node], self.node_offsets[node + 1]):
+                    next_node = self.get_other_node(self.node_edges[index], node)
+                    if components[next_node] == -1:
+                        components[next_node] = start
+                        stack.append(next_node)
+
+        return components
+
+    def get_cluster(self, node):
+        (row, col) = divmod(self.node_cells[node], self.map_size[1])
+        clusters_per_row = -(-self.map_size[1] // self.cluster_size)
+        return (row // self.cluster_size) * clusters_per_row + col // self.cluster_size
+
+    def get_abstract_graph(self):
+        """
+        Build the abstract graph of the cluster entrances: the edges between clusters,
+        and the shortest distances between the entrances of every cluster (within the cluster)
+        :return: dict (node id -> list of (node id, distance) tuples)
+        """
+        entrances = {}
+        for edge in range(len(self.edge_lengths)):
+            (first, second) = self.edge_nodes[2 * edge:2 * edge + 2]
+            if self.get_cluster(first) != self.get_cluster(second):
+                entrances.setdefault(first, []).append((second, self.edge_lengths[edge]))
+                entrances.setdefault(second, []).append((first, self.edge_lengths[edge]))
+
+        for node in entrances:
+            self.cluster_entrances.setdefault(self.get_cluster(node), []).append(node)
+
+        for nodes in self.cluster_entrances.values():
+            for node in nodes:
+                distances = self.get_cluster_distances([(node, 0)])
+                entrances[node].extend(
+                    (other, distances[other]) for other in nodes if other != node and other in distances
+                )
+
+        return entrances
+
+    def get_cluster_distances(self, sources):
+        """
+        Dijkstra from nodes of one cluster, within the cluster
+        :param sources: list of (node id, initial distance) tuples (of the same cluster)
+        :return: dict (node id -> distance to the closest source, for the reachable nodes of the cluster only)
+        """
+        cluster = self.get_cluster(sources[0][0])
+        return self.get_node_distances(sources, allowed=lambda node: self.get_cluster(node) == cluster)
+
+    def get_exit_distance(self, cell):
+        """
+        Returns the distance of a cell to the closest exit
+        :param cell: cell id
+        :return: int, -1 if no exit is reachable
+        """
+        distances = [
+            self.exit_distances[node] + distance for (node, distance) in self.get_anchors(cell)
+            if self.exit_distances[node] != -1
+        ]
+        return min(distances, default=-1)
+
+    def is_exit_reachable(self, start, blocked=-1):
+        """
+        Best-first search from a cell to an exit over the nodes, guided by the distances to the exits
+        (without obstacles the search goes straight to the closest exit)
+        :param start: cell id
+        :param blocked: cell id treated as a wall (e.g. the monster), -1 for none
+        :return: bool
+        """
+        if self.exit_flags[start]:
+            return True
+
+        anchors = self.get_anchors(start)
+        if len(anchors) == 0 or self.exit_distances[anchors[0][0]] == -1:
+            return False
+
+        blocked_node = self.node_of[blocked] if blocked != -1 else -1
+        blocked_edge = self.edge_of[blocked] if blocked != -1 else -1
+
+        if blocked_edge != -1 and blocked_edge == self.edge_of[start]:
+            # the corridor of the start is cut, only its end on the start's side is reachable
+            anchors = [anchors[0] if self.offset_of[start] < self.offset_of[blocked] else anchors[1]]
+
+        visited = set()
+        heap = [(self.exit_distances[node], node) for (node, _) in anchors if node != blocked_node]
+        heapq.heapify(heap)
+
+        while len(heap) > 0:
+            (_, node) = heapq.heappop(heap)
+            if node in visited:
+                continue
+            if self.exit_flags[self.node_cells[node]]:
+                return True
+            visited.add(node)
+
+            for index in range(self.node_offsets[node], self.node_offsets[node + 1]):
+                edge = self.node_edges[index]
+                next_node = self.get_other_node(edge, node)
+                if edge != blocked_edge and next_node != blocked_node and next_node not in visited:
+                    heapq.heappush(heap, (self.exit_distances[next_node], next_node))
+
+        return False
+
+    def get_distance(self, start, target):
+        """
+        Returns the length of the shortest path between two cells: the clusters of the two ends are searched,
+        then the abstract graph of the entrances with A* (the Manhattan distance to the target as heuristic)
+        :param start: cell id
+        :param target: cell id
+        :return: int, -1 if the target is not reachable
+        """
+        start_anchors = self.get_anchors(start)
+        target_anchors = self.get_anchors(target)
+        if len(start_anchors) == 0 or len(target_anchors) == 0 \
+                or self.components[start_anchors[0][0]] != self.components[target_anchors[0][0]]:
+            return -1
+        if start == target:
+            return 0
+
+        best = None
+        edge = self.edge_of[start]
+        if edge != -1 and edge == self.edge_of[target]:
+            # both ends on the same corridor
+            best = abs(self.offset_of[start] - self.offset_of[target])
+            if self.edge_nodes[2 * edge] == self.edge_nodes[2 * edge + 1]:
+                best = min(best, self.edge_lengths[edge] - best)
+
+        # both anchors of a cell on a loop are the same node, the shorter way round counts
+        target_costs = {}
+        for (node, distance) in target_anchors:
+            target_costs[node] = min(target_costs.get(node, distance), distance)
+
+        # search the clusters of the start (to their entrances and to the target if it is in the same cluster)
+        heap = []
+        for (node, distance) in start_anchors:
+            distances = self.get_cluster_distances([(node, distance)])
+            for (target_node, target_distance) in target_costs.items():
+                if target_node in distances:
+                    candidate = distances[target_node] + target_distance
+                    best = candidate if best is None else min(best, candidate)
+            for entrance in self.cluster_entrances.get(self.get_cluster(node), []):
+                if entrance in distances:
+                    estimate = distances[entrance] + self.get_heuristic(entrance, target)
+                    heapq.heappush(heap, (estimate, distances[entrance], entrance))
+
+        # search the clusters of the target (from their entrances to the target)
+        goal_costs = {}
+        for (node, distance) in target_anchors:
+            distances = self.get_cluster_distances([(node, distance)])
+            for entrance in self.cluster_entrances.get(self.get_cluster(node), []):
+                if entrance in distances:
+                    goal_costs[entrance] = min(goal_costs.get(entrance, distances[entrance]), distances[entrance])
+
+        # A* over the entrances, stopped once no path can beat the best one found
+        visited = set()
+        while len(heap) > 0:
+            (estimate, distance, node) = heapq.heappop(heap)
+            if best is not None and estimate >= best:
+                break
+            if node in visited:
+                continue
+            visited.add(node)
+
+            if node in goal_costs:
+                candidate = distance + goal_costs[node]
+                best = candidate if best is None else min(best, candidate)
+
+            for (next_node, length) in self.entrances[node]:
+                if next_node not in visited:
+                    next_distance = distance + length
+                    estimate = next_distance + self.get_heuristic(next_node, target)
+                    heapq.heappush(heap, (estimate, next_distance, next_node))
+
+        return -1 if best is None else best
+
+    def get_heuristic(self, node, target):
+        (row, col) = divmod(self.node_cells[node], self.map_size[1])
+        (target_row, target_col) = divmod(target, self.map_size[1])
+        return abs(row - target_row) + abs(col - target_col)
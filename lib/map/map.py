@@ -1,7 +1,22 @@
+import sys
 import threading
 
-from termcolor import colored
+from lib.colors import colored
 from lib.map.map_entity import MapEntity, to_map_entity
+from lib.map.map_graph import MapGraph
+
+
+# monster spawn offsets (Manhattan distance of 3 from the player), in row-major order
+MONSTER_OFFSETS = [(dx, dy) for dx in range(-3, 4) for dy in range(-3, 4) if abs(dx) + abs(dy) == 3]
+
+
+def get_grid_size(grid):
+    """
+    Returns the size of a list of rows in bytes, without their cells (MapEntity members and small ints are shared)
+    :param grid: list of lists
+    :return: int
+    """
+    return sys.getsizeof(grid) + sum(sys.getsizeof(row) for row in grid)
 
 
 def get_manhattan_distance(position1, position2):
@@ -27,22 +42,44 @@ class Map:
     bfs_map : list (the BFS map used for marking the player's valid positions)
     player_position : tuple (the player's position)
     monster_position : tuple (the monster's position)
+    player_moved_listener : callable (called with the new player position after every move, e.g. by the monster simulation)
+    template : MapTemplate (the parsed map file this map was copied from, None if the map read the file itself)
+    version : int (the modification time of the map file of the template, in ns; None if the map read the file itself)
+    seed : int (the seed the map and its spawn positions were generated from, None for a map not generated randomly)
+    graph : MapGraph (the compiled walls and adjacency of the map, shared with the template)
+    spectator_stream : SpectatorStream (receives the position changes while the game is spectated, None otherwise)
+    entity_map_size : int (the size of the entity map in bytes, None until it is first measured)
     """
 
-    def __init__(self, map_file_path):
+    # whether the map is loaded chunk by chunk (see ChunkedMap)
+    chunked = False
+
+    def __init__(self, map_file_path, template=None):
         self.map_file_path = map_file_path
         self.map_size = (0, 0)
         self.entity_map = []
         self.bfs_map = []
-
-        self.read_map()
-        self.mark_exit_positions()
+        self.template = template
+        self.version = template.version if template is not None else None
+        self.graph = None
+        self.entity_map_size = None
+
+        if template is not None:
+            # copy the already parsed grid instead of reading the file again
+            self.map_size = template.map_size
+            self.entity_map = template.copy_entity_map()
+        else:
+            self.read_map()
+            self.mark_exit_positions()
 
         self.player_position = None
         self.monster_position = None
+        self.player_moved_listener = None
+        self.spectator_stream = None
+        self.seed = None
 
     def get_player_details(self):
-        return self.player_position, self.map_size
+        return self.player_position, self.map_size, self.seed
 
     def read_map(self):
         mutex = threading.Lock()
@@ -68,33 +105,60 @@ class Map:
         :return: list of tuples
         """
 
-        # mark all exits as 0 using python's map function
-        bfs_map = list(map(lambda _row: list(map(lambda _cell: 0 if _cell == MapEntity.EXIT else -1, _row)), self.entity_map))
+        # the template already knows the valid positions of its map
+        if self.template is not None:
+            self.bfs_map = self.template.bfs_map
+            return self.template.player_valid_positions
 
-        # get the list of all exit positions using python's filter function
-        exit_list = list(filter(lambda position: self.get_value_at(position) == MapEntity.EXIT, self.get_all_positions()))
+        # BFS from all the exits over the compiled graph
+        graph = self.get_graph()
+        distances = graph.get_distances(graph.exits)
 
-        # add the exit positions into a bfs queue
-        bfs_queue = exit_list.copy()
+        # store the BFS map to be used later in marking the monster's valid positions
+        self.bfs_map = graph.to_rows(distances)
 
-        # bfs
-        while len(bfs_queue) > 0:
-            current_position = bfs_queue.pop(0)
-            (row, col) = current_position
-            current_value = bfs_map[row][col]
+        # collect all values greater than 2 (i.e. reachable from an exit via at least 3 moves)
+        return [graph.get_position(cell) for cell in range(len(distances)) if distances[cell] > 2]
 
-            for next_position in self.get_next_positions(current_position):
-                (next_row, next_col) = next_position
+    def get_memory_size(self):
+        """
+        Returns the estimated size of the data owned by this game in bytes; the grids and the graph shared
+        with the template are not counted (the entity map never grows, so it is only measured once)
+        :return: int
+        """
+        if self.entity_map_size is None:
+            self.entity_map_size = get_grid_size(self.entity_map)
 
-                if bfs_map[next_row][next_col] == -1:
-                    bfs_map[next_row][next_col] = current_value + 1
-                    bfs_queue.append(next_position)
+        size = self.entity_map_size
+        if self.template is None or self.bfs_map is not self.template.bfs_map:
+            # the distances above 256 are separate int objects
+            large_distances = sum(1 for row in self.bfs_map for distance in row if distance > 256)
+            size += get_grid_size(self.bfs_map) + large_distances * sys.getsizeof(257)
+        if self.template is None and self.graph is not None:
+            size += self.graph.get_memory_size()
 
-        # store the BFS map to be used later in marking the monster's valid positions
-        self.bfs_map = bfs_map
+        return size
 
-        # collect all values greater than 2 (i.e. reachable from an exit via at least 3 moves)
-        return list(filter(lambda position: bfs_map[position[0]][position[1]] > 2, self.get_all_positions()))
+    def release_spawn_data(self):
+        """
+        Drops the BFS map once the spawn positions are chosen (a map without a template would otherwise
+        keep its own full grid of distances alive for the whole game)
+        """
+        self.bfs_map = []
+
+    def get_graph(self):
+        """
+        Returns the compiled graph of the map, compiling it on its first use if the map has no template
+        (the graph only depends on the walls and exits, which never change during a game)
+        :return: MapGraph
+        """
+        if self.graph is None:
+            if self.template is not None:
+                self.graph = self.template.get_graph()
+            else:
+                self.graph = MapGraph.from_entity_map(self.entity_map, self.map_size)
+
+        return self.graph
 
     def get_monster_valid_positions(self):
         """
@@ -103,19 +167,18 @@ class Map:
         :return: list of tuples
         """
 
-        valid_positions = list(
-            filter(
-                lambda _position:
-                self.bfs_map[_position[0]][_position[1]] > 0
-                and get_manhattan_distance(self.player_position, _position) == 3
-                and self.entity_map[_position[0]][_position[1]] != MapEntity.WALL
-                and self.entity_map[_position[0]][_position[1]] != MapEntity.EXIT,
-                self.get_all_positions()
-            )
-        )
+        (row, col) = self.player_position
+        graph = self.get_graph()
+        junction_graph = graph.get_junction_graph()
+        # the distances to the exits are read from the junction graph, not from a BFS over the whole map
+        valid_positions = [
+            (row + dx, col + dy) for (dx, dy) in MONSTER_OFFSETS
+            if self.is_in_matrix(row + dx, col + dy)
+            and junction_graph.get_exit_distance(graph.get_cell((row + dx, col + dy))) > 0
+        ]
 
         # filter out monster positions that obstruct the player's path to an exit
-        return list(filter(lambda _position: self.is_exit_reachable_with_monster(_position), valid_positions))
+        return [position for position in valid_positions if self.is_exit_reachable_with_monster(position)]
 
     def is_exit_reachable_with_monster(self, monster_position):
         """
@@ -124,41 +187,24 @@ class Map:
         :return: bool
         """
 
-        # mark the monster position as a wall in the entity map
-        self.set_entity_position(monster_position, MapEntity.WALL)
-
-        # mark player position as 0
-        bfs_map = list(map(lambda _row: list(map(lambda _cell: 0 if _cell == MapEntity.PLAYER else -1, _row)), self.entity_map))
-
-        # add the player position into a bfs queue
-        bfs_queue = [self.player_position]
-
-        # bfs
-        while len(bfs_queue) > 0:
-            current_position = bfs_queue.pop(0)
-            (row, col) = current_position
-            current_value = bfs_map[row][col]
-
-            for next_position in self.get_next_positions(current_position):
-                (next_row, next_col) = next_position
-
-                if bfs_map[next_row][next_col] == -1:
-                    bfs_map[next_row][next_col] = current_value + 1
-                    bfs_queue.append(next_position)
-                    if self.entity_map[next_row][next_col] == MapEntity.EXIT:
-                        # if an exit is reachable, return True (don't forget to unmark the monster position)
-                        self.set_entity_position(monster_position, MapEntity.EMPTY_CELL)
-                        return True
-
-        # if no exit is reachable, return False (don't forget to unmark the monster position)
-        self.set_entity_position(monster_position, MapEntity.EMPTY_CELL)
-        return False
+        graph = self.get_graph()
+        # the search only visits the junctions of the map, the corridors are collapsed
+        return graph.get_junction_graph().is_exit_reachable(
+            graph.get_cell(self.player_position),
+            blocked=graph.get_cell(monster_position)
+        )
 
     def set_player_position(self, position):
         self.player_position = position
+        if self.player_moved_listener is not None:
+            self.player_moved_listener(position)
+        if self.spectator_stream is not None:
+            self.spectator_stream.publish('P', position)
 
     def set_monster_position(self, position):
         self.monster_position = position
+        if self.spectator_stream is not None:
+            self.spectator_stream.publish('M', position)
 
     def set_entity_position(self, position, value=MapEntity.EMPTY_CELL):
         (row, col) = position
@@ -227,12 +273,10 @@ class Map:
         :return: bool
         """
 
-        (row, col) = self.player_position
-        return self.is_in_matrix(row + dx, col + dy) \
-            and (
-                    self.entity_map[row + dx][col + dy] == MapEntity.EMPTY_CELL
-                    or self.entity_map[row + dx][col + dy] == MapEntity.PLAYER
-            )
+        graph = self.get_graph()
+        # walls, exits and the map edges are compiled in the graph, the monster is the only moving obstacle
+        target = graph.get_move_target(graph.get_cell(self.player_position), dx, dy)
+        return target != -1 and (self.monster_position is None or target != graph.get_cell(self.monster_position))
 
     def is_in_matrix(self, row, col):
         return 0 <= row < self.map_size[0] and 0 <= col < self.map_size[1]
\ No newline at end of file
@@ -0,0 +1,214 @@
+import bisect
+import os
+import threading
+import time
+
+from lib.colors import colored
+from lib.map.chunked_map import ChunkedMap
+from lib.map.map_repository import map_repository
+from lib.map.map_template import MapTemplate
+
+# optional file of the maps directory giving the maps their weights, one 'file_name weight' line per map
+WEIGHTS_FILE_NAME = 'catalog.cfg'
+
+
+def read_weights(weights_file_path):
+    """
+    Reads the weights of the maps (the maps which are not listed have a weight of 1)
+    :param weights_file_path: str
+    :return: dict of map file name -> weight
+    """
+    weights = {}
+    if not os.path.exists(weights_file_path):
+        return weights
+
+    with open(weights_file_path, 'r') as file:
+        for line in file:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                (file_name, weight) = line.split()
+                weights[file_name] = float(weight)
+
+    return weights
+
+
+class CatalogSnapshot:
+    """
+    Class for representing the maps of the catalog at one point in time (never modified, a reload builds a new one)
+
+    Attributes
+    ----------
+    version : int (the number of the reload which built the snapshot)
+    map_paths : list (the map file paths which can be chosen, weight > 0)
+    weights : dict (map file path -> weight)
+    cumulative_weights : list (the running sum of the weights of map_paths)
+    versions : dict (map file path -> modification time of the loaded file, in ns)
+    templates : dict (map file path -> MapTemplate or SharedMapTemplate, chunked maps have none)
+    """
+
+    def __init__(self, version, weights, versions, templates):
+        self.version = version
+        self.map_paths = [map_file_path for map_file_path in sorted(versions) if weights[map_file_path] > 0]
+        self.weights = weights
+        self.cumulative_weights = []
+        self.versions = versions
+        self.templates = templates
+
+        total = 0.0
+        for map_file_path in self.map_paths:
+            total += weights[map_file_path]
+            self.cumulative_weights.append(total)
+
+    def choose(self, rng):
+        """
+        Chooses a map according to the weights, with exactly one draw of the RNG
+        :param rng: random.Random
+        :return: str (map file path)
+        """
+        if len(self.map_paths) == 0:
+            raise ValueError('The map catalog is empty')
+
+        index = bisect.bisect_right(self.cumulative_weights, rng.random() * self.cumulative_weights[-1])
+        return self.map_paths[min(index, len(self.map_paths) - 1)]
+
+    def create_map(self, map_file_path):
+        """
+        Returns a new game map of a map of the snapshot
+        :param map_file_path: str
+        :return: Map object
+        """
+        template = self.templates.get(map_file_path)
+        if template is None:
+            return ChunkedMap(map_file_path)
+
+        return template.create_map()
+
+
+class MapCatalog:
+    """
+    Class for discovering the map files and reloading the changed ones while the server is running
+
+    A watcher thread compares the modification times of the map files with the loaded versions,
+    parses and indexes the new and changed maps in the background, then swaps the catalog snapshot
+    (and the templates of the map repository) at once. The games in progress keep their map and template.
+
+    Attributes
+    ----------
+    repository : MapRepository (the repository loading the templates)
+    snapshot : CatalogSnapshot (the current maps)
+    watch_interval : float (seconds between two checks of the maps directory)
+    """
+
+    def __init__(self, repository=map_repository):
+        self.repository = repository
+        self.snapshot = None
+        self.watch_interval = 0.0
+        self.mutex = threading.Lock()
+
+    def get_snapshot(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self.snapshot
+
+        return snapshot
+
+    def scan(self):
+        """
+        Returns the modification times of the map files
+        :return: dict of map file path -> modification time in ns
+        """
+        versions = {}
+        for map_file_path in self.repository.get_map_paths():
+            try:
+                versions[map_file_path] = os.stat(map_file_path).st_mtime_ns
+            except FileNotFoundError:
+                # removed since the directory was listed
+                pass
+
+        return versions
+
+    def refresh(self):
+        """
+        Loads the new and changed map files and swaps in a new snapshot if anything changed
+        :return: list of the loaded or removed map file paths (and of the weights file if the weights changed)
+        """
+        with self.mutex:
+            previous = self.snapshot
+            versions = self.scan()
+            weights_file_path = os.path.join(self.repository.maps_directory, WEIGHTS_FILE_NAME)
+            weights = read_weights(weights_file_path)
+            weights = {
+                map_file_path: weights.get(os.path.basename(map_file_path), 1.0) for map_file_path in versions
+            }
+
+            templates = {}
+            changed = []
+            for (map_file_path, version) in versions.items():
+                template = self.repository.templates.get(map_file_path)
+                if template is not None and template.version == version:
+                    templates[map_file_path] = template
+                    continue
+                if previous is not None and previous.versions.get(map_file_path) == version:
+                    # unchanged chunked map
+                    continue
+
+                changed.append(map_file_path)
+                if not self.repository.is_chunked(map_file_path):
+                    templates[map_file_path] = MapTemplate(map_file_path)
+                    # the file may have changed again while it was parsed, its next check reloads it
+                    versions[map_file_path] = templates[map_file_path].version
+
+            if previous is not None:
+                changed.extend(sorted(set(previous.versions) - set(versions)))
+                if any(
+                    previous.weights.get(map_file_path, weight) != weight for (map_file_path, weight) in weights.items()
+                ):
+                    changed.append(weights_file_path)
+                if len(changed) == 0:
+                    return changed
+
+            # swap the whole dictionaries, so the readers see either the old or the new maps
+            self.repository.templates = templates
+            self.snapshot = CatalogSnapshot(
+                previous.version + 1 if previous is not None else 0,
+                weights,
+                versions,
+                templates
+            )
+
+            return changed
+
+    def watch(self):
+        """
+        Check the maps directory every watch_interval seconds
+        """
+        while True:
+            time.sleep(self.watch_interval)
+
+            try:
+                started = time.perf_counter()
+                changed = self.refresh()
+                if len(changed) > 0:
+                    print(colored(
+                        f'Map catalog reloaded (version {self.snapshot.version}, {len(self.snapshot.map_paths)} maps) '
+                        f'in {(time.perf_counter() - started) * 1000:.1f} ms: '
+                        f'{", ".join(os.path.basename(map_file_path) for map_file_path in changed)}',
+                        'green'
+                    ))
+            except Exception as e:
+                print(colored(f'Map catalog reload failed: {e}', 'red'))
+
+    def start(self, watch_interval):
+        """
+        Start watching the maps directory (nothing is watched if the interval is not positive)
+        :param watch_interval: float (seconds)
+        """
+        self.watch_interval = watch_interval
+        if watch_interval > 0:
+            threading.Thread(target=self.watch, daemon=True).start()
+            print(colored(f'Watching the map catalog every {watch_interval:g} s', 'green'))
+
+
+# catalog shared by all the game sessions of the process
+map_catalog = MapCatalog()
@@ -0,0 +1,186 @@
+import sys
+import threading
+from array import array
+
+from lib.map.junction_graph import JunctionGraph
+from lib.map.map_entity import MapEntity
+
+# moves: UP, DOWN, LEFT, RIGHT
+MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class MapGraph:
+    """
+    Class for representing the static structure of a map as a graph of integer cell ids (row * cols + col),
+    compiled once per map template
+
+    The adjacency is stored in compressed sparse row form: the neighbors of the cell i are
+    neighbors[offsets[i]:offsets[i + 1]]. The searches run on these integer arrays only,
+    without allocating positions or neighbor lists. Any indexable sequence of ints can hold them, so a graph
+    published in shared memory is used through read-only views without being compiled again.
+
+    Attributes
+    ----------
+    map_size : tuple (the map size)
+    walls : bytearray (1 for every wall cell)
+    exit_flags : bytearray (1 for every exit cell)
+    exits : array (the ids of the exit cells)
+    offsets : array (cells + 1 offsets into neighbors)
+    neighbors : array (the ids of the non-wall neighbors of every cell, UP, DOWN, LEFT, RIGHT order)
+    move_targets : array (cells x 4 ids of the cells a player can move to in every direction, -1 for walls and exits)
+    junction_graph : JunctionGraph (the graph with its corridors collapsed, built on its first use)
+    """
+
+    def __init__(self, map_size, walls, exit_flags, tables=None):
+        (rows, cols) = map_size
+        cells = rows * cols
+
+        self.map_size = map_size
+        self.walls = walls
+        self.exit_flags = exit_flags
+        self.junction_graph = None
+        self.junction_mutex = threading.Lock()
+
+        if tables is not None:
+            # already compiled arrays (exits, offsets, neighbors, move_targets), e.g. views over shared memory
+            self.exits = tables['exits']
+            self.offsets = tables['offsets']
+            self.neighbors = tables['neighbors']
+            self.move_targets = tables['move_targets']
+            return
+
+        self.exits = array('i', (cell for cell in range(cells) if exit_flags[cell]))
+        self.offsets = array('i', bytes(4 * (cells + 1)))
+        self.neighbors = array('i')
+        self.move_targets = array('i', [-1]) * (4 * cells)
+
+        for cell in range(cells):
+            (row, col) = divmod(cell, cols)
+
+            for direction, (dx, dy) in enumerate(MOVES):
+                next_row = row + dx
+                next_col = col + dy
+                if 0 <= next_row < rows and 0 <= next_col < cols:
+                    next_cell = next_row * cols + next_col
+                    if not walls[next_cell]:
+                        self.neighbors.append(next_cell)
+                        if not exit_flags[next_cell]:
+                            self.move_targets[4 * cell + direction] = next_cell
+
+            self.offsets[cell + 1] = len(self.neighbors)
+
+    @staticmethod
+    def from_entity_map(entity_map, map_size):
+        """
+        Compile the graph of an entity map (with the exits marked)
+        :param entity_map: list of rows of MapEntity
+        :param map_size: tuple
+        :return: MapGraph
+        """
+        walls = bytearray(cell == MapEntity.WALL for row in entity_map for cell in row)
+        exit_flags = bytearray(cell == MapEntity.EXIT for row in entity_map for cell in row)
+        return MapGraph(map_size, walls, exit_flags)
+
+    def get_memory_size(self):
+        """
+        Returns the size of the arrays of the graph in bytes (without its junction graph)
+        :return: int
+        """
+        return sum(
+            sys.getsizeof(values)
+            for values in (self.walls, self.exit_flags, self.exits, self.offsets, self.neighbors, self.move_targets)
+        )
+
+    def get_junction_graph(self):
+        """
+        Returns the graph of the junctions of the map, building it on its first use
+        :return: JunctionGraph
+        """
+        with self.junction_mutex:
+            if self.junction_graph is None:
+                self.junction_graph = JunctionGraph(self)
+
+            return self.junction_graph
+
+    def get_cell(self, position):
+        return position[0] * self.map_size[1] + position[1]
+
+    def get_position(self, cell):
+        return divmod(cell, self.map_size[1])
+
+    def get_distances(self, sources, blocked=-1):
+        """
+        BFS from the sources over the non-wall cells
+        :param sources: iterable of cell ids
+        :param blocked: cell id treated as a wall (e.g. the monster), -1 for none
+        :return: array of the distance of every cell to the closest source, -1 for unreachable cells
+        """
+        offsets = self.offsets
+        neighbors = self.neighbors
+        distances = array('i', [-1]) * (len(offsets) - 1)
+        bfs_queue = array('i', sources)
+
+        for cell in bfs_queue:
+            distances[cell] = 0
+
+        head = 0
+        while head < len(bfs_queue):
+            cell = bfs_queue[head]
+            head += 1
+            next_distance = distances[cell] + 1
+
+            for index in range(offsets[cell], offsets[cell + 1]):
+                next_cell = neighbors[index]
+                if distances[next_cell] == -1 and next_cell != blocked:
+                    distances[next_cell] = next_distance
+                    bfs_queue.append(next_cell)
+
+        return distances
+
+    def is_exit_reachable(self, start, blocked=-1):
+        """
+        BFS from a cell, stopping at the first exit
+        :param start: cell id
+        :param blocked: cell id treated as a wall (e.g. the monster), -1 for none
+        :return: bool
+        """
+        offsets = self.offsets
+        neighbors = self.neighbors
+        exit_flags = self.exit_flags
+        visited = bytearray(len(offsets) - 1)
+        bfs_queue = array('i', [start])
+        visited[start] = 1
+
+        head = 0
+        while head < len(bfs_queue):
+            cell = bfs_queue[head]
+            head += 1
+
+            for index in range(offsets[cell], offsets[cell + 1]):
+                next_cell = neighbors[index]
+                if not visited[next_cell] and next_cell != blocked:
+                    if exit_flags[next_cell]:
+                        return True
+                    visited[next_cell] = 1
+                    bfs_queue.append(next_cell)
+
+        return False
+
+    def get_move_target(self, cell, dx, dy):
+        """
+        :param cell: cell id of the player
+        :param dx: x direction
+        :param dy: y direction
+        :return: the cell id the player can move to, -1 if the move is blocked by a wall, an exit or the map edge
+        """
+        direction = (0 if dx < 0 else 1) if dx != 0 else (2 if dy < 0 else 3)
+        return self.move_targets[4 * cell + direction]
+
+    def to_rows(self, values):
+        """
+        Split a per-cell array into rows (e.g. to build the BFS map of a Map)
+        :param values: array
+        :return: list of lists
+        """
+        cols = self.map_size[1]
+        return [values[start:start + cols].tolist() for start in range(0, len(values), cols)]
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+from lib.map.chunked_map import ChunkedMap
+from lib.map.map_template import MapTemplate
+
+# the assets folder of the project
+MAPS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'assets',
+    'maps'
+)
+
+
+class MapRepository:
+    """
+    Class for loading every map file once and keeping its template in memory
+
+    Attributes
+    ----------
+    maps_directory : str (the directory of the map files)
+    templates : dict (map file path -> MapTemplate or SharedMapTemplate, swapped as a whole by the MapCatalog)
+    chunked_map_bytes : int (map files larger than this are not parsed but loaded chunk by chunk, see ChunkedMap)
+    """
+
+    def __init__(self, maps_directory=MAPS_DIRECTORY, chunked_map_bytes=64 * 1024 * 1024):
+        self.maps_directory = maps_directory
+        self.templates = {}
+        self.chunked_map_bytes = chunked_map_bytes
+        self.mutex = threading.Lock()
+
+    def get_map_paths(self):
+        """
+        Returns the paths of all the map files of the maps directory
+        :return: list of str
+        """
+        return sorted(
+            os.path.join(self.maps_directory, file_name)
+            for file_name in os.listdir(self.maps_directory)
+            if file_name.endswith('.txt')
+        )
+
+    def is_chunked(self, map_file_path):
+        """
+        Checks if a map file is too large to be parsed into memory
+        :param map_file_path: str
+        :return: bool
+        """
+        return os.path.getsize(map_file_path) > self.chunked_map_bytes
+
+    def preload(self):
+        """
+        Loads and indexes every map file of the maps directory (except the chunked ones)
+        :return: tuple of (number of loaded maps, duration in seconds)
+        """
+        started = time.perf_counter()
+
+        for map_file_path in self.get_map_paths():
+            if not self.is_chunked(map_file_path):
+                self.get_template(map_file_path)
+
+        return len(self.templates), time.perf_counter() - started
+
+    def load_shared(self, store):
+        """
+        Use the templates of a shared map store: attach to the maps published by another process of the host,
+        or parse the map files and publish them if this process is the first one
+        :param store: SharedMapStore
+        :return: tuple of (number of maps, duration in seconds)
+        """
+        started = time.perf_counter()
+
+        templates = store.attach()
+        if templates is None:
+            self.preload()
+            # the private templates are replaced by the published ones, so this process holds no copy either
+            # (None if another process published its maps first)
+            templates = store.publish(self.templates) or store.attach()
+
+        with self.mutex:
+            self.templates.update(templates)
+
+        return len(self.templates), time.perf_counter() - started
+
+    def get_template(self, map_file_path, version=None):
+        """
+        Returns the template of a map file, loading it on its first use
+        :param map_file_path: str
+        :param version: int (the template is reloaded if its file modification time differs, None for any version)
+        :return: MapTemplate object
+        """
+        template = self.templates.get(map_file_path)
+        if template is not None and (version is None or template.version == version):
+            return template
+
+        with self.mutex:
+            template = self.templates.get(map_file_path)
+            if template is None or (version is not None and template.version != version):
+                template = MapTemplate(map_file_path)
+                self.templates[map_file_path] = template
+
+        return template
+
+    def create_map(self, map_file_path, version=None):
+        """
+        Returns a new game map of a map file, copied from its template or loaded chunk by chunk if the file is huge
+        :param map_file_path: str
+        :param version: int (the file modification time the template should have, None for any version)
+        :return: Map object
+        """
+        if map_file_path not in self.templates and self.is_chunked(map_file_path):
+            return ChunkedMap(map_file_path)
+
+        return self.get_template(map_file_path, version).create_map()
+
+
+# repository shared by all the game sessions of the process
+map_repository = MapRepository()
@@ -0,0 +1,50 @@
+import os
+
+from lib.map.map import Map
+
+
+class MapTemplate:
+    """
+    Class for representing a parsed and indexed map file, shared by all the game maps created from it
+
+    Attributes
+    ----------
+    map_file_path : str (the map file path)
+    version : int (the modification time of the parsed map file, in ns)
+    map_size : tuple (the map size)
+    entity_map : list (the map entity representation, with the exits marked; never modified)
+    bfs_map : list (the distance of every cell to the closest exit, -1 for unreachable cells; never modified)
+    player_valid_positions : list (the positions where a player can be spawned)
+    graph : MapGraph (the compiled walls and adjacency of the map)
+    """
+
+    def __init__(self, map_file_path):
+        # taken before the file is read, so a change during the parse is reloaded by the next check
+        version = os.stat(map_file_path).st_mtime_ns
+        game_map = Map(map_file_path)
+
+        self.map_file_path = map_file_path
+        self.version = version
+        self.map_size = game_map.map_size
+        self.player_valid_positions = game_map.get_player_valid_positions()
+        self.entity_map = game_map.entity_map
+        self.bfs_map = game_map.bfs_map
+        self.graph = game_map.get_graph()
+        self.graph.get_junction_graph()
+
+    def get_graph(self):
+        return self.graph
+
+    def copy_entity_map(self):
+        """
+        Returns a private copy of the entity map, for a game map to modify
+        :return: list
+        """
+        return [row.copy() for row in self.entity_map]
+
+    def create_map(self):
+        """
+        Returns a new game map with its own copy of the template's grid
+        :return: Map object
+        """
+        return Map(self.map_file_path, template=self)
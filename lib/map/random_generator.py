@@ -1,48 +1,175 @@
-import os
 import random
-from lib.map.map import Map
+import secrets
+import struct
+import threading
+from collections import OrderedDict
+
+from lib.map.map_catalog import map_catalog
 from lib.map.map_entity import MapEntity
+from lib.map.map_repository import map_repository
+
+# number of player positions tried before giving up on a map without a valid monster position
+MAX_SPAWN_ATTEMPTS = 32
+
+# spawn positions sent back by the spawn pool: player row, player col, monster row, monster col
+SPAWN_RECORD = struct.Struct('<4I')
 
 
-def mark_random_player_position(game_map):
+class SpawnCache:
     """
-    Marks a random player position in the map by choosing a random position from the valid positions
-    :param game_map:
+    Class for caching the spawn positions of the seeded games, so that a known (map, seed) pair
+    does not have to search the monster's valid positions again (a reloaded map file is another map)
+
+    Attributes
+    ----------
+    max_size : int (the maximum number of cached spawns, the least recently used one is evicted first)
+    spawns : OrderedDict (((map file path, version), seed) -> (player position, monster position))
     """
-    player_position = random.choice(game_map.get_player_valid_positions())
-    game_map.set_player_position(player_position)
-    game_map.set_entity_position(player_position, value=MapEntity.PLAYER)
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.spawns = OrderedDict()
+        self.mutex = threading.Lock()
+
+    def get(self, map_key, seed):
+        """
+        Returns the cached spawn positions of a game
+        :param map_key: tuple of (map file path, version)
+        :param seed: int
+        :return: tuple of (player position, monster position), None if the game is not cached
+        """
+        with self.mutex:
+            spawn = self.spawns.get((map_key, seed))
+            if spawn is not None:
+                self.spawns.move_to_end((map_key, seed))
+            return spawn
+
+    def put(self, map_key, seed, spawn):
+        with self.mutex:
+            self.spawns[(map_key, seed)] = spawn
+            self.spawns.move_to_end((map_key, seed))
+            if len(self.spawns) > self.max_size:
+                self.spawns.popitem(last=False)
+
+
+# spawns shared by all the game sessions of the process
+spawn_cache = SpawnCache()
+
+
+def new_seed():
+    """
+    Returns a new random seed for a game which was started without one
+    :return: int
+    """
+    return secrets.randbits(32)
+
+
+def choose_spawn(game_map, player_valid_positions, rng):
+    """
+    Chooses the player and monster positions of a game with the game's RNG,
+    trying other player positions if the monster has no valid position near the first one
+    :param game_map: Map object
+    :param player_valid_positions: list of tuples
+    :param rng: random.Random
+    :return: tuple of (player position, monster position)
+    """
+    if len(player_valid_positions) == 0:
+        raise ValueError(f'No valid player position in {game_map.map_file_path}')
+
+    for _ in range(MAX_SPAWN_ATTEMPTS):
+        game_map.set_player_position(rng.choice(player_valid_positions))
+        monster_valid_positions = game_map.get_monster_valid_positions()
+        if len(monster_valid_positions) > 0:
+            return game_map.player_position, rng.choice(monster_valid_positions)
+
+    raise IndexError(f'No valid monster position found in {game_map.map_file_path}')
 
 
-def mark_random_monster_position(game_map):
+def mark_spawn(game_map, spawn):
     """
-    Marks a random monster position in the map by choosing a random position from the valid positions
-    :param game_map:
+    Marks the player and monster positions in the map
+    :param game_map: Map object
+    :param spawn: tuple of (player position, monster position)
     """
-    monster_position = random.choice(game_map.get_monster_valid_positions())
+    (player_position, monster_position) = spawn
+
+    game_map.set_player_position(player_position)
+    game_map.set_entity_position(player_position, value=MapEntity.PLAYER)
     game_map.set_monster_position(monster_position)
     game_map.set_entity_position(monster_position, value=MapEntity.MONSTER)
 
 
-def get_random_map():
+def generate_spawn(seed, map_file_path, version):
+    """
+    Chooses the spawn positions of the game started with a seed on a map, without building its map
+    (run by the worker processes of the SpawnPool)
+    :param seed: int
+    :param map_file_path: str (the map chosen by the server process)
+    :param version: int (the version of the map in the server process)
+    :return: bytes (SPAWN_RECORD)
+    """
+    rng = random.Random(seed)
+    # the server process chose the map with the first draw of the game's RNG
+    rng.random()
+
+    game_map = map_repository.create_map(map_file_path, version)
+    if game_map.version != version:
+        raise ValueError(f'{map_file_path} changed since version {version}')
+    game_map.seed = seed
+
+    (player_position, monster_position) = choose_spawn(game_map, game_map.get_player_valid_positions(), rng)
+    return SPAWN_RECORD.pack(*player_position, *monster_position)
+
+
+def read_spawn(record):
     """
-    Generates a random map using the assets folder and mark a random player and monster position
+    :param record: bytes (SPAWN_RECORD)
+    :return: tuple of (player position, monster position)
+    """
+    (player_row, player_col, monster_row, monster_col) = SPAWN_RECORD.unpack(record)
+    return (player_row, player_col), (monster_row, monster_col)
+
+
+def get_random_map(seed=None, spawn_pool=None):
+    """
+    Generates a random map from the map catalog (according to the weights of the maps)
+    and mark a random player and monster position.
+    The map and the positions only depend on the seed (and the catalog), so a game can be replayed
+    by starting it with the same seed.
+    :param seed: int (a new random seed if None)
+    :param spawn_pool: SpawnPool (the spawn positions are searched in its worker processes if given)
     :return: Map object
     """
 
-    # get current project folder
-    project_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    # remove the last folder from the path
-    project_folder = os.path.dirname(project_folder)
+    # only the games started with a given seed can be replayed, so only their spawns are cached
+    cached = seed is not None
+    if seed is None:
+        seed = new_seed()
+
+    # every game has its own RNG, so the games neither share nor disturb each other's random state
+    rng = random.Random(seed)
+
+    # copy the map from its (already parsed and indexed) template, or load it chunk by chunk if it is huge;
+    # the snapshot is taken once, so a concurrent reload of the catalog does not mix two versions of the map
+    snapshot = map_catalog.get_snapshot()
+    map_path = snapshot.choose(rng)
+    game_map = snapshot.create_map(map_path)
+    game_map.seed = seed
+    map_key = (map_path, game_map.version)
 
-    base_path = f'{project_folder}/assets/maps/map'
-    base_extension = '.txt'
-    map_number = random.randint(1, 5)
+    spawn = spawn_cache.get(map_key, seed) if cached else None
+    if spawn is None and spawn_pool is not None:
+        # the searches run in another process, the handler thread only waits for the result
+        spawn = spawn_pool.get_spawn(seed, map_path, game_map.version)
+        if cached and spawn is not None:
+            spawn_cache.put(map_key, seed, spawn)
 
-    map_path = base_path + str(map_number) + base_extension
-    game_map = Map(map_path)
+    if spawn is None:
+        spawn = choose_spawn(game_map, game_map.get_player_valid_positions(), rng)
+        if cached:
+            spawn_cache.put(map_key, seed, spawn)
 
-    mark_random_player_position(game_map)
-    mark_random_monster_position(game_map)
+    mark_spawn(game_map, spawn)
+    game_map.release_spawn_data()
 
     return game_map
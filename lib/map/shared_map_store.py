@@ -0,0 +1,396 @@
+import json
+import struct
+import threading
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+from lib.map.map import Map
+from lib.map.map_entity import MapEntity
+from lib.map.map_graph import MapGraph
+
+# one byte per cell in the shared grids
+ENTITY_CODES = {entity: ord(entity.value[0]) for entity in MapEntity}
+ENTITIES_BY_CODE = {code: entity for entity, code in ENTITY_CODES.items()}
+
+# the manifest segment starts with the length of its JSON payload (0 while the payload is being written)
+MANIFEST_HEADER = struct.Struct('<I')
+
+INT_SIZE = 4
+
+
+class SharedGrid:
+    """
+    Class for reading a row-major grid stored in shared memory as grid[row][col]
+
+    Attributes
+    ----------
+    view : memoryview (read-only view over the cells)
+    cols : int (the number of columns)
+    """
+
+    def __init__(self, view, cols):
+        self.view = view
+        self.cols = cols
+
+    def __len__(self):
+        return len(self.view) // self.cols
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        return self.view[row * self.cols:(row + 1) * self.cols]
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class SharedPositions:
+    """
+    Class for reading a list of positions stored in shared memory as (row, col) pairs of ints
+
+    Attributes
+    ----------
+    view : memoryview (read-only view over the flattened pairs)
+    """
+
+    def __init__(self, view):
+        self.view = view
+
+    def __len__(self):
+        return len(self.view) // 2
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('position index out of range')
+        return self.view[2 * index], self.view[2 * index + 1]
+
+    def __iter__(self):
+        view = self.view
+        for index in range(0, len(view), 2):
+            yield view[index], view[index + 1]
+
+
+class SharedMapTemplate:
+    """
+    Class for representing a map template whose grid and precomputed tables live in a shared memory segment,
+    attached read-only by every server process of the host
+
+    Attributes
+    ----------
+    map_file_path : str (the map file path)
+    version : int (the modification time of the parsed map file, in ns)
+    map_size : tuple (the map size)
+    entity_codes : SharedGrid (the map entity representation, one byte per cell, with the exits marked)
+    bfs_map : SharedGrid (the distance of every cell to the closest exit, -1 for unreachable cells)
+    player_valid_positions : SharedPositions (the positions where a player can be spawned)
+    graph : MapGraph (the compiled walls and adjacency of the map, over the arrays published in the segment)
+    """
+
+    def __init__(self, map_file_path, map_size, segment, layout, version=0):
+        (rows, cols) = map_size
+        cells = rows * cols
+        view = segment.buf.toreadonly()
+
+        self.map_file_path = map_file_path
+        self.version = version
+        self.map_size = map_size
+        self.entity_codes = SharedGrid(view[:cells], cols)
+        self.bfs_map = SharedGrid(get_int_view(view, layout['bfs_offset'], cells), cols)
+        self.player_valid_positions = SharedPositions(
+            get_int_view(view, layout['positions_offset'], layout['positions'] * 2)
+        )
+        self.graph_views = {
+            'walls': view[layout['walls_offset']:layout['walls_offset'] + cells],
+            'exit_flags': view[layout['exit_flags_offset']:layout['exit_flags_offset'] + cells],
+            'exits': get_int_view(view, layout['exits_offset'], layout['exits']),
+            'offsets': get_int_view(view, layout['offsets_offset'], cells + 1),
+            'neighbors': get_int_view(view, layout['neighbors_offset'], layout['neighbors']),
+            'move_targets': get_int_view(view, layout['move_targets_offset'], 4 * cells),
+        }
+        self.view = view
+        self.graph = None
+        self.graph_mutex = threading.Lock()
+
+    def get_graph(self):
+        """
+        Returns the graph of the map, built over the compiled arrays of the segment on its first use
+        :return: MapGraph
+        """
+        with self.graph_mutex:
+            if self.graph is None:
+                self.graph = MapGraph(
+                    self.map_size,
+                    self.graph_views['walls'],
+                    self.graph_views['exit_flags'],
+                    tables=self.graph_views
+                )
+
+            return self.graph
+
+    def release(self):
+        """
+        Release the views over the segment, so that it can be closed (the template cannot be used afterwards)
+        """
+        views = [self.entity_codes.view, self.bfs_map.view, self.player_valid_positions.view]
+        for view in views + list(self.graph_views.values()) + [self.view]:
+            view.release()
+
+    def copy_entity_map(self):
+        """
+        Returns a private copy of the entity map, for a game map to modify
+        :return: list
+        """
+        return [[ENTITIES_BY_CODE[code] for code in row] for row in self.entity_codes]
+
+    def create_map(self):
+        """
+        Returns a new game map with its own copy of the template's grid
+        :return: Map object
+        """
+        return Map(self.map_file_path, template=self)
+
+
+def get_int_view(view, offset, count):
+    """
+    :param view: memoryview over a segment
+    :param offset: offset of the ints in bytes
+    :param count: number of ints
+    :return: memoryview of ints
+    """
+    return view[offset:offset + count * INT_SIZE].cast('i')
+
+
+def get_layout(template):
+    """
+    Returns the offsets of the tables of a template in its shared memory segment: the entity grid, the wall
+    and exit flags of the graph (1 byte per cell), then the BFS map, the spawn positions and the compiled
+    arrays of the graph (ints, 4-byte aligned)
+    :param template: MapTemplate
+    :return: dict
+    """
+    (rows, cols) = template.map_size
+    cells = rows * cols
+    graph = template.get_graph()
+    walls_offset = cells
+    exit_flags_offset = walls_offset + cells
+    bfs_offset = (exit_flags_offset + cells + INT_SIZE - 1) // INT_SIZE * INT_SIZE
+    positions_offset = bfs_offset + cells * INT_SIZE
+    positions = len(template.player_valid_positions)
+    exits_offset = positions_offset + positions * 2 * INT_SIZE
+    offsets_offset = exits_offset + len(graph.exits) * INT_SIZE
+    neighbors_offset = offsets_offset + (cells + 1) * INT_SIZE
+    move_targets_offset = neighbors_offset + len(graph.neighbors) * INT_SIZE
+
+    return {
+        'walls_offset': walls_offset,
+        'exit_flags_offset': exit_flags_offset,
+        'bfs_offset': bfs_offset,
+        'positions_offset': positions_offset,
+        'positions': positions,
+        'exits_offset': exits_offset,
+        'exits': len(graph.exits),
+        'offsets_offset': offsets_offset,
+        'neighbors_offset': neighbors_offset,
+        'neighbors': len(graph.neighbors),
+        'move_targets_offset': move_targets_offset,
+        'size': move_targets_offset + 4 * cells * INT_SIZE,
+    }
+
+
+def write_template(segment, template, layout):
+    """
+    Copy the grid and the precomputed tables of a parsed template into its segment
+    :param segment: SharedMemory
+    :param template: MapTemplate
+    :param layout: dict returned by get_layout
+    """
+    buffer = segment.buf
+    cols = template.map_size[1]
+    graph = template.get_graph()
+
+    for row_index, row in enumerate(template.entity_map):
+        buffer[row_index * cols:(row_index + 1) * cols] = bytes(ENTITY_CODES[entity] for entity in row)
+
+    for row_index, row in enumerate(template.bfs_map):
+        struct.pack_into(f'{cols}i', buffer, layout['bfs_offset'] + row_index * cols * INT_SIZE, *row)
+
+    positions = [value for position in template.player_valid_positions for value in position]
+    struct.pack_into(f'{len(positions)}i', buffer, layout['positions_offset'], *positions)
+
+    for (offset_key, values) in (
+        ('walls_offset', graph.walls),
+        ('exit_flags_offset', graph.exit_flags),
+        ('exits_offset', array('i', graph.exits)),
+        ('offsets_offset', array('i', graph.offsets)),
+        ('neighbors_offset', array('i', graph.neighbors)),
+        ('move_targets_offset', array('i', graph.move_targets)),
+    ):
+        data = bytes(values)
+        buffer[layout[offset_key]:layout[offset_key] + len(data)] = data
+
+
+def attach_segment(name):
+    """
+    Attach an existing segment without letting this process's resource tracker unlink it when the process exits
+    (the segment belongs to the process which published the maps)
+    :param name: segment name
+    :return: SharedMemory
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def create_segment(name, size):
+    """
+    Create a segment, replacing the one left behind by a process which did not shut down cleanly
+    :param name: segment name
+    :param size: segment size in bytes
+    :return: SharedMemory
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        attach_segment(name).unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+class SharedMapStore:
+    """
+    Class for sharing the parsed map templates of a host between server processes
+
+    The first process publishes every template into its own shared memory segment and lists them in a
+    manifest segment; the following processes attach to the segments instead of parsing the map files,
+    so the grids and their tables are held once per host. Python maps shared memory read-write, so the
+    templates only expose read-only views of it.
+
+    Attributes
+    ----------
+    name : str (the name of the manifest segment and the prefix of the map segments)
+    segments : list (the segments created or attached by this process)
+    templates : list (the templates created over the segments)
+    owner : bool (whether this process published the maps and unlinks them when it is closed)
+    """
+
+    def __init__(self, name='maze_runner_maps'):
+        self.name = name
+        self.segments = []
+        self.templates = []
+        self.owner = False
+
+    def get_manifest_name(self):
+        return f'{self.name}_manifest'
+
+    def publish(self, templates):
+        """
+        Copy the templates into shared memory segments and publish their manifest
+        :param templates: dict of map file path -> MapTemplate
+        :return: dict of map file path -> SharedMapTemplate, None if another process already published the maps
+        """
+        try:
+            manifest_segment = shared_memory.SharedMemory(
+                name=self.get_manifest_name(),
+                create=True,
+                size=MANIFEST_HEADER.size + 64 * 1024
+            )
+        except FileExistsError:
+            return None
+
+        self.owner = True
+        self.segments.append(manifest_segment)
+        manifest = []
+        shared_templates = {}
+
+        for index, (map_file_path, template) in enumerate(sorted(templates.items())):
+            layout = get_layout(template)
+            segment = create_segment(f'{self.name}_{index}', layout['size'])
+            self.segments.append(segment)
+            write_template(segment, template, layout)
+            shared_templates[map_file_path] = SharedMapTemplate(
+                map_file_path,
+                template.map_size,
+                segment,
+                layout,
+                template.version
+            )
+            self.templates.append(shared_templates[map_file_path])
+
+            manifest.append({
+                'map_file_path': map_file_path,
+                'segment': segment.name,
+                'map_size': template.map_size,
+                'layout': layout,
+                'version': template.version,
+            })
+
+        payload = json.dumps(manifest).encode()
+        if MANIFEST_HEADER.size + len(payload) > manifest_segment.size:
+            self.close()
+            raise ValueError(f'The manifest of {len(manifest)} maps does not fit in its segment')
+
+        manifest_segment.buf[MANIFEST_HEADER.size:MANIFEST_HEADER.size + len(payload)] = payload
+        # the length is written last, so the attaching processes never read a partial manifest
+        MANIFEST_HEADER.pack_into(manifest_segment.buf, 0, len(payload))
+
+        return shared_templates
+
+    def attach(self, timeout=5.0):
+        """
+        Attach to the maps published by another process
+        :param timeout: seconds to wait for a manifest which is still being written
+        :return: dict of map file path -> SharedMapTemplate, None if no process published the maps
+        """
+        try:
+            manifest_segment = attach_segment(self.get_manifest_name())
+        except FileNotFoundError:
+            return None
+
+        self.segments.append(manifest_segment)
+        deadline = time.monotonic() + timeout
+        (length,) = MANIFEST_HEADER.unpack_from(manifest_segment.buf, 0)
+
+        while length == 0:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'The manifest {self.get_manifest_name()} was never completed')
+            time.sleep(0.01)
+            (length,) = MANIFEST_HEADER.unpack_from(manifest_segment.buf, 0)
+
+        manifest = json.loads(bytes(manifest_segment.buf[MANIFEST_HEADER.size:MANIFEST_HEADER.size + length]))
+        templates = {}
+
+        for entry in manifest:
+            segment = attach_segment(entry['segment'])
+            self.segments.append(segment)
+            templates[entry['map_file_path']] = SharedMapTemplate(
+                entry['map_file_path'],
+                tuple(entry['map_size']),
+                segment,
+                entry['layout'],
+                entry['version']
+            )
+            self.templates.append(templates[entry['map_file_path']])
+
+        return templates
+
+    def close(self):
+        """
+        Detach from the segments (and remove them if this process published them)
+        """
+        for template in self.templates:
+            template.release()
+
+        for segment in self.segments:
+            segment.close()
+            if self.owner:
+                try:
+                    segment.unlink()
+                except FileNotFoundError:
+                    pass
+
+        self.templates = []
+        self.segments = []
+        self.owner = False
@@ -0,0 +1,78 @@
+import select
+import socket
+
+
+def encode_datagram(token, sequence, message):
+    """
+    Encode a request datagram: 'token sequence message'
+    :param token: str (session token, None for a response)
+    :param sequence: int
+    :param message: bytes
+    :return: bytes
+    """
+    if token is None:
+        return b'%d %s' % (sequence, message)
+    return b'%s %d %s' % (token.encode(), sequence, message)
+
+
+def parse_datagram(data, with_token=True):
+    """
+    Parse a request datagram ('token sequence message') or a response datagram ('sequence message')
+    :param data: bytes
+    :param with_token: whether the datagram starts with a session token
+    :return: tuple of (token, sequence, message), None if the datagram is malformed
+    """
+    parts = data.split(b' ', 2 if with_token else 1)
+    if len(parts) != (3 if with_token else 2) or not parts[-2].isdigit():
+        return None
+
+    token = parts[0].decode('ascii', 'replace') if with_token else None
+    return token, int(parts[-2]), parts[-1]
+
+
+class DatagramClient:
+    """
+    Client side of the datagram channel: every request gets the next sequence number and is sent again
+    until its response arrives, so a lost datagram only delays its own request by one retry interval
+    (instead of stalling the whole connection until TCP retransmits it)
+
+    Attributes:
+        token (str): session token given by the server over TCP
+        server_address (tuple): (host, port) of the datagram channel
+        retry_interval (float): seconds before sending an unanswered request again
+        max_retries (int): number of retries before giving up
+        sequence (int): sequence number of the last request
+        datagram_socket (socket): UDP socket
+    """
+
+    def __init__(self, host, port, token, retry_interval=0.05, max_retries=40):
+        self.token = token
+        self.server_address = (host, port)
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.sequence = 0
+        self.datagram_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.datagram_socket.connect(self.server_address)
+
+    def request(self, message):
+        """
+        Send a request and wait for its response (the responses of older requests are ignored)
+        :param message: bytes
+        :return: bytes (response message)
+        :raise TimeoutError: if the server did not answer any of the retries
+        """
+        self.sequence += 1
+        datagram = encode_datagram(self.token, self.sequence, message)
+
+        for _ in range(self.max_retries + 1):
+            self.datagram_socket.send(datagram)
+
+            while select.select([self.datagram_socket], [], [], self.retry_interval)[0]:
+                response = parse_datagram(self.datagram_socket.recv(65535), with_token=False)
+                if response is not None and response[1] == self.sequence:
+                    return response[2]
+
+        raise TimeoutError(f'No response to the datagram request {self.sequence}')
+
+    def close(self):
+        self.datagram_socket.close()
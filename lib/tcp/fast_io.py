@@ -0,0 +1,220 @@
+import socket
+
+CARRIAGE_RETURN = 13
+
+
+class ByteTable:
+    """
+    Precomputed wire representation of the members of a message enum (e.g. Request, Response)
+
+    Encoding a member returns a cached bytes object and decoding looks a received message up by its
+    length and first byte, comparing it in place, so neither direction allocates.
+
+    Attributes:
+        plain_bytes (dict): member -> encoded member name
+        framed_bytes (dict): member -> encoded member name followed by a new line
+        candidates (dict): (length, first byte) -> list of (encoded name, member)
+    """
+
+    def __init__(self, enum_class):
+        self.plain_bytes = {member: member.name.encode() for member in enum_class}
+        self.framed_bytes = {member: data + b'\n' for member, data in self.plain_bytes.items()}
+        self.candidates = {}
+
+        for member, data in self.plain_bytes.items():
+            self.candidates.setdefault((len(data), data[0]), []).append((data, member))
+
+    def encode(self, member, framed=False):
+        """
+        :param member: enum member
+        :param framed: whether the message must be terminated by a new line
+        :return: bytes
+        """
+        if framed:
+            return self.framed_bytes[member]
+        return self.plain_bytes[member]
+
+    def lookup(self, message, default=None):
+        """
+        Maps a received message to the enum member with the same name
+        :param message: bytes-like object (e.g. memoryview over a receive buffer)
+        :param default: value returned when there is no such member
+        :return: enum member
+        """
+        length = len(message)
+        if length == 0:
+            return default
+
+        for data, member in self.candidates.get((length, message[0]), ()):
+            if message == data:
+                return member
+
+        return default
+
+
+class ReceiveBuffer:
+    """
+    Preallocated receive buffer of a connection, filled with recv_into and parsed through memoryview slices
+
+    A message ends with a new line. Peers which have never sent a new line are treated as legacy ones:
+    every received chunk is a single message. A framed connection can pipeline several messages in one
+    chunk; they are returned one by one without receiving again.
+
+    Attributes:
+        buffer (bytearray): the preallocated buffer
+        view (memoryview): view over the whole buffer
+        start (int): index of the first unread byte
+        end (int): index after the last received byte
+        framed (bool): whether the peer terminates its messages with new lines
+        closed (bool): whether the peer closed the connection (a receive returned no data)
+    """
+
+    def __init__(self, size=1024):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.framed = False
+        self.closed = False
+
+    def has_message(self):
+        """
+        Checks if a complete message is already buffered
+        :return: bool
+        """
+        if self.start >= self.end:
+            return False
+        if not self.framed or self.buffer.find(b'\n', self.start, self.end) != -1:
+            return True
+
+        # a framed message which does not fit into the buffer is returned as it is (see next_message)
+        return self.start == 0 and self.end == len(self.buffer)
+
+    def next_message(self):
+        """
+        Returns the next buffered message without receiving
+        :return: memoryview over the message (valid until the next receive) or None
+        """
+        if self.start >= self.end:
+            return None
+
+        index = self.buffer.find(b'\n', self.start, self.end)
+        if index == -1:
+            # wait for the rest of a framed message, unless it does not fit into the buffer
+            if self.framed and (self.start > 0 or self.end < len(self.buffer)):
+                return None
+
+            message = self.view[self.start:self.end]
+            self.start = self.end
+            return message
+
+        self.framed = True
+        message_end = index
+        if message_end > self.start and self.buffer[message_end - 1] == CARRIAGE_RETURN:
+            message_end -= 1
+
+        message = self.view[self.start:message_end]
+        self.start = index + 1
+        return message
+
+    def receive(self, sock, flags=0):
+        """
+        Receive data from the socket into the free space of the buffer
+        :param sock: socket
+        :param flags: recv flags (e.g. socket.MSG_DONTWAIT)
+        :return: number of received bytes (0 if the peer closed the connection)
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.start > 0:
+            # move the incomplete message to the beginning of the buffer
+            remaining = self.end - self.start
+            self.buffer[:remaining] = bytes(self.view[self.start:self.end])
+            self.start, self.end = 0, remaining
+
+        received = sock.recv_into(self.view[self.end:], 0, flags)
+        self.end += received
+        return received
+
+    def receive_available(self, sock):
+        """
+        Receive without blocking the data already waiting in the socket
+        :param sock: socket
+        :return: bool (whether a complete message is buffered or the peer closed the connection, see closed)
+        """
+        if self.closed or self.has_message():
+            return True
+
+        try:
+            if self.receive(sock, socket.MSG_DONTWAIT) == 0:
+                self.closed = True
+        except BlockingIOError:
+            pass
+        except OSError:
+            # e.g. the connection was reset by the peer
+            self.closed = True
+
+        return self.closed or self.has_message()
+
+    def read_message(self, sock):
+        """
+        Returns the next message, receiving from the socket as long as no complete message is buffered
+        :param sock: socket
+        :return: memoryview over the message (empty if the peer closed the connection, see closed)
+        """
+        message = self.next_message()
+
+        while message is None:
+            if self.closed or self.receive(sock) == 0:
+                self.closed = True
+                return self.view[0:0]
+            message = self.next_message()
+
+        return message
+
+
+def send_all(sock, payload):
+    """
+    Send the whole payload, retrying partial sends
+    :param sock: socket
+    :param payload: bytes-like object
+    """
+    sock.sendall(payload)
+
+
+def send_coalesced(sock, payloads):
+    """
+    Send several payloads with as few system calls as possible (a single sendmsg in the common case)
+    :param sock: socket
+    :param payloads: list of bytes-like objects
+    """
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(payloads))
+        return
+
+    buffers = [memoryview(payload) for payload in payloads]
+    while len(buffers) > 0:
+        sent = sock.sendmsg(buffers)
+
+        # drop the buffers which were sent completely and trim the partially sent one
+        index = 0
+        while index < len(buffers) and sent >= len(buffers[index]):
+            sent -= len(buffers[index])
+            index += 1
+        buffers = buffers[index:]
+
+        if len(buffers) > 0 and sent > 0:
+            buffers[0] = buffers[0][sent:]
+
+
+def encode_message(message, framed=False):
+    """
+    Encode a message which is either a string or a message enum member with a precomputed encoding
+    :param message: str or enum member (e.g. Request, Response)
+    :param framed: whether the message must be terminated by a new line
+    :return: bytes
+    """
+    if isinstance(message, str):
+        return (message + '\n' if framed else message).encode()
+
+    return message.encode(framed)
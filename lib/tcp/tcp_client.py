@@ -1,5 +1,6 @@
-import socket
-from termcolor import colored
+from lib.colors import colored
+from lib.tcp.fast_io import ReceiveBuffer, encode_message, send_all
+from lib.tcp.transport import create_transport
 
 class TcpClient:
     """
@@ -9,17 +10,20 @@ class TcpClient:
         host (str): host address
         port (int): port number
         buffer_size (int): buffer size
+        transport (TcpTransport | UnixTransport): transport of the connection
         client_socket (socket): client socket (communication channel)
+        receive_buffer (ReceiveBuffer): preallocated receive buffer of the connection
     """
 
-    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, name='TCP'):
+    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, name='TCP', transport=None):
         self.host = host
         self.port = port
         self.buffer_size = buffer_size
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.transport = transport or create_transport(host, port)
+        self.receive_buffer = ReceiveBuffer(buffer_size)
 
         # Connect to server
-        self.client_socket.connect((self.host, self.port))
+        self.client_socket = self.transport.connect()
         print(colored(f'Client {name} is connected to server: {self.client_socket.getpeername()}', 'green'))
 
     def receive_message(self):
@@ -27,7 +31,14 @@ class TcpClient:
         Receive message from server and decode it
         :return: decoded message
         """
-        return self.client_socket.recv(self.buffer_size).decode()
+        return str(self.receive_view(), 'utf-8')
+
+    def receive_view(self):
+        """
+        Receive message from server without copying it
+        :return: memoryview over the message (valid until the next receive)
+        """
+        return self.receive_buffer.read_message(self.client_socket)
 
     def send_message(self, message):
         """
@@ -35,7 +46,7 @@ class TcpClient:
         :param message:
         :return: None
         """
-        self.client_socket.send(message.encode())
+        send_all(self.client_socket, encode_message(message))
 
     def run(self):
         """
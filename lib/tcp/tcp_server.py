@@ -1,5 +1,6 @@
-import socket
-from termcolor import colored
+from lib.colors import colored
+from lib.tcp.fast_io import ReceiveBuffer, encode_message, send_all
+from lib.tcp.transport import create_transport
 
 class TcpServer:
     """
@@ -9,21 +10,24 @@ class TcpServer:
         host (str): host address
         port (int): port number
         buffer_size (int): buffer size
+        transport (TcpTransport | UnixTransport): transport of the connections
         server_socket (socket): server socket (handshaking/welcoming channel)
         client_socket (socket): client socket (communication channel)
+        client_address (tuple): client address
+        receive_buffer (ReceiveBuffer): preallocated receive buffer of the client connection
     """
 
-    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, max_connections=3, name='TCP'):
+    def __init__(self, host='127.0.0.1', port=8889, buffer_size=1024, max_connections=3, name='TCP', transport=None):
         self.host = host
         self.port = port
         self.buffer_size = buffer_size
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.transport = transport or create_transport(host, port)
         self.client_socket = None
+        self.client_address = None
+        self.receive_buffer = None
 
-        # Bind server to address
-        self.server_socket.bind((self.host, self.port))
-        # Listen for incoming connections
-        self.server_socket.listen(max_connections)
+        # Bind server to address and listen for incoming connections
+        self.server_socket = self.transport.listen(max_connections)
         print(colored(f'Server {name} is listening on address: {self.server_socket.getsockname()}', 'green'))
 
     def accept_client(self):
@@ -31,8 +35,9 @@ class TcpServer:
         Accept client connection
         :return: None
         """
-        self.client_socket, address = self.server_socket.accept()
-        print(colored(f'Connection from {address}', 'green'))
+        self.client_socket, self.client_address = self.transport.accept(self.server_socket)
+        self.receive_buffer = ReceiveBuffer(self.buffer_size)
+        print(colored(f'Connection from {self.client_address}', 'green'))
 
     def close_client(self):
         """
@@ -46,7 +51,14 @@ class TcpServer:
         Receive message from client and decode it
         :return: decoded message
         """
-        return self.client_socket.recv(self.buffer_size).decode()
+        return str(self.receive_view(), 'utf-8')
+
+    def receive_view(self):
+        """
+        Receive message from client without copying it
+        :return: memoryview over the message (valid until the next receive)
+        """
+        return self.receive_buffer.read_message(self.client_socket)
 
     def send_message(self, message):
         """
@@ -54,7 +66,7 @@ class TcpServer:
         :param message:
         :return: None
         """
-        self.client_socket.send(message.encode())
+        send_all(self.client_socket, encode_message(message, self.receive_buffer.framed))
 
     def run(self):
         """
@@ -80,4 +92,4 @@ class TcpServer:
         :return: None
         """
         print(colored('Server is closed', 'red'))
-        self.server_socket.close()
+        self.transport.close(self.server_socket)
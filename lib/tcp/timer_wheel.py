@@ -0,0 +1,74 @@
+import math
+import threading
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: the timers are hashed by their deadline tick into a fixed number of slots
+
+    Scheduling and cancelling a timer are O(1) dictionary operations, and every tick only visits the timers
+    of one slot (the timers of a later round stay in the slot until their deadline tick), so a single thread
+    can track the timeouts of a very large number of connections.
+
+    Attributes:
+        tick (float): seconds per tick
+        slots (list): dicts of key -> deadline tick, indexed by deadline tick modulo the number of slots
+        timers (dict): key -> slot index of every scheduled timer
+        current_tick (int): last tick processed by advance
+        started (float): time of the tick 0
+    """
+
+    def __init__(self, tick=0.1, slots=512, now=0.0):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self.timers = {}
+        self.current_tick = 0
+        self.started = now
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.timers)
+
+    def schedule(self, key, delay):
+        """
+        Schedule (or reschedule) the timer of a key
+        :param key: hashable (e.g. a client address)
+        :param delay: seconds from the current tick
+        """
+        with self.mutex:
+            self.remove(key)
+            deadline = self.current_tick + max(1, math.ceil(delay / self.tick))
+            slot = deadline % len(self.slots)
+            self.slots[slot][key] = deadline
+            self.timers[key] = slot
+
+    def cancel(self, key):
+        with self.mutex:
+            self.remove(key)
+
+    def remove(self, key):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def advance(self, now):
+        """
+        Process the ticks up to the given time
+        :param now: time (same clock as the one given to the constructor)
+        :return: list of the keys whose timers expired
+        """
+        expired = []
+        # a time on a tick boundary (e.g. 0.3 s with 0.1 s ticks) must not round down to the previous tick
+        target_tick = int((now - self.started) / self.tick + 1e-9)
+
+        with self.mutex:
+            while self.current_tick < target_tick:
+                self.current_tick += 1
+                slot = self.slots[self.current_tick % len(self.slots)]
+                keys = [key for key, deadline in slot.items() if deadline <= self.current_tick]
+                for key in keys:
+                    del slot[key]
+                    del self.timers[key]
+                expired.extend(keys)
+
+        return expired
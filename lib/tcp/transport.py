@@ -0,0 +1,150 @@
+import itertools
+import os
+import socket
+import stat
+
+
+class TcpTransport:
+    """
+    Stream transport over TCP
+
+    Attributes:
+        host (str): host address
+        port (int): port number
+    """
+
+    def __init__(self, host='127.0.0.1', port=8889):
+        self.host = host
+        self.port = port
+
+    def listen(self, max_connections):
+        """
+        Create the listening socket
+        :param max_connections: backlog of the listening socket
+        :return: socket
+        """
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(max_connections)
+        return server_socket
+
+    def accept(self, server_socket):
+        """
+        Accept a connection
+        :param server_socket: listening socket
+        :return: tuple of (client socket, client address)
+        """
+        return server_socket.accept()
+
+    def connect(self):
+        """
+        Connect to the server
+        :return: socket
+        """
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.connect((self.host, self.port))
+        return client_socket
+
+    def close(self, server_socket):
+        """
+        Dispose the listening socket
+        :param server_socket:
+        """
+        server_socket.close()
+
+
+class UnixTransport:
+    """
+    Stream transport over a Unix domain socket, for clients running on the same host as the server
+
+    Unix domain clients are usually unnamed, so every accepted connection gets a unique ('unix', n) address
+    which is used as its peer id instead of the empty address returned by accept.
+
+    Attributes:
+        socket_path (str): path of the socket file
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.peer_ids = itertools.count(1)
+
+    def listen(self, max_connections):
+        self.remove_stale_socket()
+
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(self.socket_path)
+        server_socket.listen(max_connections)
+        return server_socket
+
+    def remove_stale_socket(self):
+        """
+        Remove the socket file left behind by a server which did not shut down cleanly
+        """
+        try:
+            if not stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                raise OSError(f'{self.socket_path} exists and is not a socket')
+        except FileNotFoundError:
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+
+        raise OSError(f'Another server is listening on {self.socket_path}')
+
+    def accept(self, server_socket):
+        client_socket, _ = server_socket.accept()
+        return client_socket, ('unix', next(self.peer_ids))
+
+    def connect(self):
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.connect(self.socket_path)
+        return client_socket
+
+    def close(self, server_socket):
+        server_socket.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def create_transport(host='127.0.0.1', port=8889, socket_path=None):
+    """
+    Create the transport configured by the HOST/PORT settings or by a socket path
+    :param host: host address
+    :param port: port number
+    :param socket_path: path of a Unix domain socket (used instead of host and port if given)
+    :return: TcpTransport or UnixTransport
+    """
+    if socket_path:
+        return UnixTransport(socket_path)
+
+    return TcpTransport(host, port)
+
+
+def enable_keepalive(client_socket, idle, interval=10, count=5):
+    """
+    Enable TCP keepalive probes on a connection, so that a peer which vanished without closing it
+    (e.g. a crashed host or a dropped network) is detected by the kernel
+    :param client_socket: connected socket
+    :param idle: seconds without traffic before the first probe
+    :param interval: seconds between two probes
+    :param count: number of unanswered probes before the connection is reset
+    :return: False if the socket is not a TCP socket
+    """
+    if client_socket.family not in (socket.AF_INET, socket.AF_INET6):
+        return False
+
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # the probe timings are not configurable on every platform
+    for (option, value) in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+        if hasattr(socket, option):
+            client_socket.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    return True
@@ -1,18 +1,103 @@
+import time
+
+# measure the startup time from the very beginning of the process
+started_at = time.perf_counter()
+
 import os
 from dotenv import load_dotenv
 from lib.game.server.multiplexing_game_server import MultiplexingGameServer
+from lib.game.server.startup import warm_up
+from lib.map.map_catalog import map_catalog
+from lib.tcp.transport import create_transport
 
 load_dotenv()
 
 host = os.environ['HOST']
 port = int(os.environ['PORT'])
 buffer_size = int(os.environ['BUFFER_SIZE'])
+# a Unix domain socket path replaces HOST and PORT for clients running on the same host
+socket_path = os.environ.get('SOCKET_PATH', '')
 max_connections = int(os.environ['MAX_CONNECTIONS'])
+admin_hosts = tuple(os.environ.get('ADMIN_HOSTS', '127.0.0.1,::1,unix').split(','))
+max_clients = int(os.environ.get('MAX_CLIENTS', 64))
+max_pending = int(os.environ.get('MAX_PENDING', 16))
+# seconds a queued client waits for a free slot before it is rejected with BUSY (0 to wait forever)
+max_pending_wait = float(os.environ.get('MAX_PENDING_WAIT', 30))
+rate_limit = float(os.environ.get('RATE_LIMIT', 20))
+rate_burst = float(os.environ.get('RATE_BURST', 40))
+dispatch_mode = os.environ.get('DISPATCH_MODE', 'thread')
+pool_size = int(os.environ.get('POOL_SIZE', 8))
+queue_depth = int(os.environ.get('QUEUE_DEPTH', 256))
+fairness = int(os.environ.get('FAIRNESS', 1))
+coalesce_responses = os.environ.get('COALESCE_RESPONSES', '0') == '1'
+room_tick = float(os.environ.get('ROOM_TICK', 0.1))
+simulation_tick = float(os.environ.get('SIMULATION_TICK', 0))
+leaderboard_path = os.environ.get('LEADERBOARD_PATH') or None
+snapshot_interval = float(os.environ.get('LEADERBOARD_SNAPSHOT_INTERVAL', 60))
+# worker processes searching the spawn positions of new games (0 to search them on the handler threads)
+spawn_workers = int(os.environ.get('SPAWN_WORKERS', 0))
+# seconds a new client has to send its first request and a client can stay silent (0 to wait forever)
+handshake_timeout = float(os.environ.get('HANDSHAKE_TIMEOUT', 10))
+idle_timeout = float(os.environ.get('IDLE_TIMEOUT', 300))
+# seconds without traffic before the TCP keepalive probes start (0 to disable them)
+keepalive_idle = int(os.environ.get('KEEPALIVE_IDLE', 0))
+# cap of the estimated memory of the sessions in MiB (0 for no cap): new games are refused with BUSY ('refuse')
+# or the sessions idle for MEMORY_MIN_IDLE seconds are closed first ('evict')
+memory_budget = int(os.environ.get('MEMORY_BUDGET_MB', 0)) * 1024 * 1024
+memory_policy = os.environ.get('MEMORY_POLICY', 'refuse')
+memory_min_idle = float(os.environ.get('MEMORY_MIN_IDLE', 30))
+# seconds between two estimates of the memory of every session (the running total is updated in between
+# as the sessions and the games come and go)
+memory_sample_interval = float(os.environ.get('MEMORY_SAMPLE_INTERVAL', 5))
+# stack reserved for every thread in KiB (0 for the default, usually the RLIMIT_STACK of the process)
+thread_stack_size = int(os.environ.get('THREAD_STACK_KB', 0)) * 1024
+# resident stack charged to the memory budget for every thread in KiB when THREAD_STACK_KB is 0
+# (only the pages a thread touches are allocated, not the whole reserved stack)
+thread_stack_estimate = int(os.environ.get('THREAD_STACK_ESTIMATE_KB', 64)) * 1024
+# UDP port of the channel carrying the moves of the clients which open it (0 to disable the channel)
+datagram_port = int(os.environ.get('DATAGRAM_PORT', 0)) or None
+# maximum number of games multiplexed over one connection with '@tag REQUEST' requests
+max_connection_games = int(os.environ.get('MAX_CONNECTION_GAMES', 1024))
+# seconds between two checks of the maps directory for new or changed maps (0 to never reload them)
+map_watch_interval = float(os.environ.get('MAP_WATCH_INTERVAL', 2))
+
+# load every map before the server starts listening for connections
+warm_up(started_at)
 
 server = MultiplexingGameServer(
     host=host,
     port=port,
     buffer_size=buffer_size,
     max_connections=max_connections,
-    name='Maze Runner Multi Client Server')
+    name='Maze Runner Multi Client Server',
+    max_clients=max_clients,
+    max_pending=max_pending,
+    max_pending_wait=max_pending_wait,
+    rate_limit=rate_limit,
+    rate_burst=rate_burst,
+    dispatch_mode=dispatch_mode,
+    pool_size=pool_size,
+    queue_depth=queue_depth,
+    fairness=fairness,
+    coalesce_responses=coalesce_responses,
+    room_tick=room_tick,
+    simulation_tick=simulation_tick,
+    admin_hosts=admin_hosts,
+    transport=create_transport(host, port, socket_path),
+    leaderboard_path=leaderboard_path,
+    snapshot_interval=snapshot_interval,
+    spawn_workers=spawn_workers,
+    handshake_timeout=handshake_timeout,
+    idle_timeout=idle_timeout,
+    keepalive_idle=keepalive_idle,
+    memory_budget=memory_budget,
+    memory_policy=memory_policy,
+    memory_min_idle=memory_min_idle,
+    thread_stack_size=thread_stack_size,
+    datagram_port=datagram_port,
+    max_connection_games=max_connection_games,
+    memory_sample_interval=memory_sample_interval,
+    thread_stack_estimate=thread_stack_estimate)
+# the maps are watched once the server (and its spawn pool) is created
+map_catalog.start(map_watch_interval)
 server.run()
@@ -1,19 +1,39 @@
+import time
+
+# measure the startup time from the very beginning of the process
+started_at = time.perf_counter()
+
 import os
 from dotenv import load_dotenv
 from lib.game.server.game_server import GameServer
+from lib.game.server.startup import warm_up
+from lib.map.map_catalog import map_catalog
+from lib.tcp.transport import create_transport
 
 load_dotenv()
 
 host = os.environ['HOST']
 port = int(os.environ['PORT'])
 buffer_size = int(os.environ['BUFFER_SIZE'])
+# a Unix domain socket path replaces HOST and PORT for clients running on the same host
+socket_path = os.environ.get('SOCKET_PATH', '')
 max_connections = int(os.environ['MAX_CONNECTIONS'])
+admin_hosts = tuple(os.environ.get('ADMIN_HOSTS', '127.0.0.1,::1,unix').split(','))
+# seconds between two checks of the maps directory for new or changed maps (0 to never reload them)
+map_watch_interval = float(os.environ.get('MAP_WATCH_INTERVAL', 2))
+
+# load every map before the server starts listening for connections
+warm_up(started_at)
 
 server = GameServer(
     host=host,
     port=port,
     buffer_size=buffer_size,
     max_connections=max_connections,
-    name='Maze Runner Server'
+    name='Maze Runner Server',
+    admin_hosts=admin_hosts,
+    transport=create_transport(host, port, socket_path)
 )
+# the maps are watched once the server is created
+map_catalog.start(map_watch_interval)
 server.run()
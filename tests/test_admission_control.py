@@ -0,0 +1,84 @@
+import time
+
+from lib.game.server.admission_control import AdmissionController, TokenBucket
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(rate=1000.0, capacity=3)
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+
+    bucket.last_refill -= 0.002
+    assert bucket.consume()
+    # the refill never exceeds the capacity
+    bucket.last_refill -= 60
+    bucket.refill()
+    assert bucket.tokens == 3
+
+
+def test_token_bucket_resize():
+    bucket = TokenBucket(rate=0.001, capacity=2)
+    bucket.consume(2)
+
+    # a client joining the bucket brings its burst along
+    bucket.resize(0.001, 2)
+    assert (bucket.capacity, int(bucket.tokens)) == (4, 2)
+    assert bucket.consume(2)
+    assert not bucket.consume()
+
+
+    full_bucket = TokenBucket(rate=0.001, capacity=2)
+    full_bucket.resize(0.001, 2)
+    assert int(full_bucket.tokens) == 4
+    # the tokens are capped by the shrunk capacity
+    full_bucket.resize(-0.001, -2)
+    assert (full_bucket.capacity, full_bucket.tokens) == (2, 2)
+
+
+def test_admission_queues_then_rejects():
+    admission_control = AdmissionController(max_clients=2, max_pending=1)
+
+    assert admission_control.try_admit()
+    assert admission_control.try_admit()
+    assert not admission_control.try_admit()
+    assert admission_control.enqueue('c')
+    assert not admission_control.enqueue('d')
+    assert admission_control.get_stats() == (2, 1)
+
+    # the released slot goes to the pending client
+    assert admission_control.release() == 'c'
+    assert admission_control.get_stats() == (2, 0)
+    assert admission_control.release() is None
+    assert admission_control.get_stats() == (1, 0)
+
+
+def test_pending_clients_have_priority():
+    admission_control = AdmissionController(max_clients=1, max_pending=2)
+    admission_control.try_admit()
+    admission_control.enqueue('b')
+
+    assert admission_control.release() == 'b'
+    # a new client does not overtake the queue
+    admission_control.enqueue('c')
+    assert admission_control.release() == 'c'
+    assert admission_control.try_admit() is False
+    assert admission_control.release() is None
+    assert admission_control.try_admit()
+
+
+def test_pending_clients_expire():
+    admission_control = AdmissionController(max_clients=1, max_pending=2, max_pending_wait=10)
+    admission_control.try_admit()
+    admission_control.enqueue('b')
+    admission_control.enqueue('c')
+
+    now = time.monotonic()
+    assert admission_control.expire(now) == []
+    assert admission_control.expire(now + 10) == ['b', 'c']
+    assert admission_control.get_stats() == (1, 0)
+
+    # 0 waits forever
+    admission_control = AdmissionController(max_clients=1, max_pending=1, max_pending_wait=0)
+    admission_control.try_admit()
+    admission_control.enqueue('b')
+    assert admission_control.expire(time.monotonic() + 1e6) == []
+    assert admission_control.release() == 'b'
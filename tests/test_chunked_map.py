@@ -0,0 +1,81 @@
+import gc
+import random
+
+import pytest
+
+from lib.map.chunked_map import ChunkCache, ChunkedMap
+from lib.map.map_entity import MapEntity
+from lib.map.random_generator import choose_spawn
+
+
+def write_map(tmp_path, rows):
+    path = tmp_path / 'map.txt'
+    path.write_text('\n'.join(rows))
+    return str(path)
+
+
+def corridor_map(size=41, length=4):
+    """
+    Map of walls with one corridor going down from an exit on the top edge
+    """
+    rows = [['#'] * size for _ in range(size)]
+    for row in range(length):
+        rows[row][size // 2] = '.'
+    return [''.join(row) for row in rows]
+
+
+def test_cells_and_exits(tmp_path):
+    game_map = ChunkedMap(write_map(tmp_path, ['#.#', '...', '#.#']), ChunkCache(chunk_size=2, max_chunks=16))
+
+    assert game_map.map_size == (3, 3)
+    assert game_map.get_value_at((0, 0)) == MapEntity.WALL
+    assert game_map.get_value_at((1, 1)) == MapEntity.EMPTY_CELL
+    # the empty cells on the edges are exits
+    assert [game_map.get_value_at(position) for position in ((0, 1), (1, 0), (1, 2), (2, 1))] == [MapEntity.EXIT] * 4
+
+
+def test_chunk_cache_evicts_the_least_recently_used_chunks(tmp_path):
+    cache = ChunkCache(chunk_size=4, max_chunks=3)
+    game_map = ChunkedMap(write_map(tmp_path, corridor_map(16)), cache)
+
+    for row in range(0, 16, 4):
+        game_map.get_value_at((row, 0))
+    assert cache.get_stats()['chunks'] == 3
+    assert (cache.loads, cache.evictions) == (4, 1)
+
+    # the first chunk was evicted, the last ones are still cached
+    game_map.get_value_at((12, 1))
+    game_map.get_value_at((0, 1))
+    assert (cache.loads, cache.evictions) == (5, 2)
+
+
+def test_maps_of_a_file_share_it(tmp_path):
+    cache = ChunkCache()
+    path = write_map(tmp_path, corridor_map(8))
+    (first, second) = (ChunkedMap(path, cache), ChunkedMap(path, cache))
+
+    assert first.map_file is second.map_file
+    assert cache.get_stats()['files'] == 1
+    # the grid of a map refers back to it, the maps are released by the cycle collector
+    del first, second
+    gc.collect()
+    assert cache.get_stats()['files'] == 0
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_spawn_positions_missed_by_the_sample_are_scanned(tmp_path, seed):
+    # a single valid player position among 1681 cells
+    game_map = ChunkedMap(write_map(tmp_path, corridor_map()), ChunkCache(chunk_size=8))
+    game_map.seed = seed
+
+    assert game_map.get_player_valid_positions() == [(3, 20)]
+
+
+def test_map_without_spawn_positions(tmp_path):
+    # every empty cell is within 2 moves of an exit
+    game_map = ChunkedMap(write_map(tmp_path, ['.' * 5] * 5), ChunkCache(chunk_size=8))
+    game_map.seed = 1
+
+    assert game_map.get_player_valid_positions() == []
+    with pytest.raises(ValueError):
+        choose_spawn(game_map, game_map.get_player_valid_positions(), random.Random(1))
@@ -0,0 +1,116 @@
+import socket
+
+import pytest
+
+from lib.game.server.datagram_channel import DatagramChannel
+from lib.tcp.datagram import encode_datagram, parse_datagram
+
+SESSION_ADDRESS = ('127.0.0.1', 50000)
+
+
+class Response:
+    """
+    Response of the recording handler (the channel only needs its encoding)
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def encode(self):
+        return self.message
+
+
+@pytest.fixture
+def channel():
+    applied = []
+
+    def handle_request(address, message):
+        applied.append((address, message))
+        return Response(b'OK ' + message)
+
+    channel = DatagramChannel(handle_request, window=4, history=8)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(('127.0.0.1', 0))
+    client.settimeout(1.0)
+    token = channel.register(SESSION_ADDRESS)
+
+    def send(sequence, message, with_token=token):
+        channel.receive(encode_datagram(with_token, sequence, message), client.getsockname())
+
+    yield channel, client, send, applied
+    client.close()
+    channel.close()
+
+
+def receive_responses(client, count):
+    return [parse_datagram(client.recv(65535), with_token=False)[1:] for _ in range(count)]
+
+
+def get_messages(applied):
+    return [message for (_, message) in applied]
+
+
+def test_requests_are_applied_in_order(channel):
+    (_, client, send, applied) = channel
+    send(1, b'MOVE 0 1')
+    send(2, b'MOVE 1 0')
+
+    assert applied == [(SESSION_ADDRESS, b'MOVE 0 1'), (SESSION_ADDRESS, b'MOVE 1 0')]
+    assert receive_responses(client, 2) == [(1, b'OK MOVE 0 1'), (2, b'OK MOVE 1 0')]
+
+
+def test_request_ahead_of_a_missing_one_waits(channel):
+    (_, client, send, applied) = channel
+    send(2, b'second')
+    send(3, b'third')
+    assert applied == []
+
+    # the retry of the lost request unblocks the buffered ones
+    send(1, b'first')
+    assert get_messages(applied) == [b'first', b'second', b'third']
+    assert receive_responses(client, 3) == [(1, b'OK first'), (2, b'OK second'), (3, b'OK third')]
+
+
+def test_retry_is_answered_without_applying_again(channel):
+    (_, client, send, applied) = channel
+    send(1, b'first')
+    send(1, b'first')
+
+    assert get_messages(applied) == [b'first']
+    assert receive_responses(client, 2) == [(1, b'OK first'), (1, b'OK first')]
+
+
+def test_old_responses_are_forgotten(channel):
+    (channel, client, send, applied) = channel
+    for sequence in range(1, channel.history + 2):
+        send(sequence, b'%d' % sequence)
+    receive_responses(client, channel.history + 1)
+
+    # the response of the first request left the history: its retry is dropped
+    send(1, b'1')
+    send(2, b'2')
+    assert receive_responses(client, 1) == [(2, b'OK 2')]
+    assert len(applied) == channel.history + 1
+
+
+def test_request_beyond_the_window_is_dropped(channel):
+    (channel, _, send, applied) = channel
+    send(channel.window + 1, b'too far')
+    send(channel.window, b'buffered')
+    for sequence in range(1, channel.window):
+        send(sequence, b'%d' % sequence)
+
+    assert get_messages(applied)[-1] == b'buffered'
+    assert len(applied) == channel.window
+
+
+def test_unknown_token_and_malformed_datagrams_are_ignored(channel):
+    (channel, client, send, applied) = channel
+    send(1, b'first', with_token='unknown')
+    channel.receive(b'garbage', client.getsockname())
+
+    token = channel.register(SESSION_ADDRESS)
+    channel.unregister(token)
+    send(1, b'first', with_token=token)
+
+    assert applied == []
@@ -0,0 +1,118 @@
+import socket
+
+import pytest
+
+from lib.game.client.game_request import REQUEST_TABLE, Request
+from lib.game.server.game_response import Response
+from lib.tcp.fast_io import ReceiveBuffer, encode_message, send_coalesced
+
+
+@pytest.fixture
+def connection():
+    (client, server) = socket.socketpair()
+    yield client, server
+    client.close()
+    server.close()
+
+
+def test_byte_table_round_trip():
+    for request in Request:
+        assert REQUEST_TABLE.lookup(request.encode()) is request
+        assert request.encode(framed=True) == request.encode() + b'\n'
+
+    assert REQUEST_TABLE.lookup(memoryview(b'UP')) is Request.UP
+    assert REQUEST_TABLE.lookup(b'UPP') is None
+    assert REQUEST_TABLE.lookup(b'') is None
+
+
+def test_legacy_peer_sends_one_message_per_chunk(connection):
+    (client, server) = connection
+    receive_buffer = ReceiveBuffer(64)
+
+    client.send(b'START')
+    assert bytes(receive_buffer.read_message(server)) == b'START'
+    assert not receive_buffer.framed
+
+    client.send(b'UP')
+    assert bytes(receive_buffer.read_message(server)) == b'UP'
+    assert not receive_buffer.framed
+
+
+def test_framed_peer_pipelines_messages(connection):
+    (client, server) = connection
+    receive_buffer = ReceiveBuffer(64)
+
+    client.send(b'START 42\nUP\r\nDOWN\n')
+    assert bytes(receive_buffer.read_message(server)) == b'START 42'
+    assert receive_buffer.framed
+    assert receive_buffer.has_message()
+
+    # the pipelined messages are returned without receiving again (a carriage return is dropped)
+    assert bytes(receive_buffer.read_message(server)) == b'UP'
+    assert bytes(receive_buffer.read_message(server)) == b'DOWN'
+    assert not receive_buffer.has_message()
+
+
+def test_partial_message_is_moved_to_the_beginning(connection):
+    (client, server) = connection
+    receive_buffer = ReceiveBuffer(32)
+
+    client.send(b'LEFT\nSEND_PLAY')
+    assert bytes(receive_buffer.read_message(server)) == b'LEFT'
+
+    client.send(b'ER_DETAILS\nUP\n')
+    assert bytes(receive_buffer.read_message(server)) == b'SEND_PLAYER_DETAILS'
+    assert bytes(receive_buffer.read_message(server)) == b'UP'
+
+
+def test_framed_message_larger_than_the_buffer(connection):
+    (client, server) = connection
+    receive_buffer = ReceiveBuffer(8)
+
+    client.send(b'UP\n')
+    assert bytes(receive_buffer.read_message(server)) == b'UP'
+
+    client.send(b'0123456789\n')
+    assert bytes(receive_buffer.read_message(server)) == b'01234567'
+    assert bytes(receive_buffer.read_message(server)) == b'89'
+
+
+def test_receive_available_waits_for_a_complete_message(connection):
+    (client, server) = connection
+    receive_buffer = ReceiveBuffer(64)
+
+    # nothing to receive: returns without blocking
+    assert not receive_buffer.receive_available(server)
+
+    client.send(b'UP\n')
+    assert receive_buffer.receive_available(server)
+    assert bytes(receive_buffer.read_message(server)) == b'UP'
+
+    client.send(b'DO')
+    assert not receive_buffer.receive_available(server)
+    client.send(b'WN\n')
+    assert receive_buffer.receive_available(server)
+    assert bytes(receive_buffer.read_message(server)) == b'DOWN'
+
+
+def test_closed_connection(connection):
+    (client, server) = connection
+    receive_buffer = ReceiveBuffer(64)
+
+    client.send(b'UP\nSTOP\n')
+    client.close()
+
+    assert receive_buffer.receive_available(server)
+    assert bytes(receive_buffer.read_message(server)) == b'UP'
+    # the messages received before the disconnection are still returned
+    assert bytes(receive_buffer.read_message(server)) == b'STOP'
+    assert receive_buffer.receive_available(server)
+    assert len(receive_buffer.read_message(server)) == 0
+    assert receive_buffer.closed
+
+
+def test_send_coalesced(connection):
+    (client, server) = connection
+
+    send_coalesced(server, [encode_message(Response.OK, True), encode_message('1 2 3 4 5', True), b'END\n'])
+    assert client.recv(64) == b'OK\n1 2 3 4 5\nEND\n'
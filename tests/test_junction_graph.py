@@ -0,0 +1,153 @@
+import glob
+import os
+import random
+
+import pytest
+
+from lib.map.junction_graph import JunctionGraph
+from lib.map.map import MONSTER_OFFSETS, Map
+from lib.map.map_graph import MapGraph
+from lib.map.map_repository import MAPS_DIRECTORY
+
+
+def generate_graph(rng, rows, cols, wall_ratio):
+    """
+    Random map with its empty edge cells marked as exits, like the parsed maps
+    """
+    walls = bytearray(rng.random() < wall_ratio for _ in range(rows * cols))
+    exit_flags = bytearray(
+        not walls[cell] and (cell // cols in (0, rows - 1) or cell % cols in (0, cols - 1))
+        for cell in range(rows * cols)
+    )
+    return MapGraph((rows, cols), walls, exit_flags)
+
+
+def generate_maze(rng, rows, cols, loops):
+    """
+    Random maze (long corridors between few junctions) with some of its walls knocked out to open loops,
+    and exits cut in its border
+    """
+    walls = bytearray([1]) * (rows * cols)
+    stack = [(1, 1)]
+    walls[cols + 1] = 0
+    while len(stack) > 0:
+        (row, col) = stack[-1]
+        candidates = [
+            (row + dx, col + dy) for (dx, dy) in ((-2, 0), (2, 0), (0, -2), (0, 2))
+            if 0 < row + dx < rows - 1 and 0 < col + dy < cols - 1 and walls[(row + dx) * cols + col + dy]
+        ]
+        if len(candidates) == 0:
+            stack.pop()
+            continue
+
+        (next_row, next_col) = rng.choice(candidates)
+        walls[next_row * cols + next_col] = 0
+        walls[(row + next_row) // 2 * cols + (col + next_col) // 2] = 0
+        stack.append((next_row, next_col))
+
+    inner_walls = [cell for cell in range(rows * cols) if walls[cell] and 0 < cell // cols < rows - 1
+                   and 0 < cell % cols < cols - 1]
+    for cell in rng.sample(inner_walls, min(loops, len(inner_walls))):
+        walls[cell] = 0
+
+    exit_flags = bytearray(rows * cols)
+    for cell in (cols + 0, (rows - 2) * cols + cols - 1):
+        (walls[cell], exit_flags[cell]) = (0, 1)
+    return MapGraph((rows, cols), walls, exit_flags)
+
+
+def get_query_cells(rng, graph, junction_graph):
+    """
+    Exits, corridor cells and junctions of a graph, sampled
+    """
+    open_cells = [cell for cell in range(len(graph.walls)) if not graph.walls[cell]]
+    corridor_cells = [cell for cell in open_cells if junction_graph.edge_of[cell] != -1]
+    return list(graph.exits) + rng.sample(corridor_cells, min(10, len(corridor_cells))) \
+        + rng.sample(open_cells, min(10, len(open_cells)))
+
+
+def assert_distances_match_bfs(rng, graph, cluster_size):
+    junction_graph = JunctionGraph(graph, cluster_size)
+    cells = get_query_cells(rng, graph, junction_graph)
+
+    for start in cells:
+        distances = graph.get_distances([start])
+        for target in cells:
+            assert junction_graph.get_distance(start, target) == distances[target], (start, target)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_exit_distances_match_bfs(seed):
+    rng = random.Random(seed)
+    graph = generate_graph(rng, rng.randint(1, 20), rng.randint(1, 20), rng.choice((0.2, 0.35, 0.5)))
+    junction_graph = graph.get_junction_graph()
+    distances = graph.get_distances(graph.exits)
+
+    for cell in range(len(distances)):
+        expected = -1 if graph.walls[cell] else distances[cell]
+        assert junction_graph.get_exit_distance(cell) == expected, graph.get_position(cell)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_exit_reachability_matches_bfs(seed):
+    rng = random.Random(seed)
+    graph = generate_graph(rng, rng.randint(2, 15), rng.randint(2, 15), 0.35)
+    junction_graph = graph.get_junction_graph()
+    open_cells = [cell for cell in range(len(graph.walls)) if not graph.walls[cell]]
+
+    for start in open_cells:
+        for blocked in rng.sample(open_cells, min(5, len(open_cells))) + [-1]:
+            if blocked == start:
+                continue
+            expected = bool(graph.exit_flags[start]) or graph.is_exit_reachable(start, blocked)
+            assert junction_graph.is_exit_reachable(start, blocked) == expected, (start, blocked)
+
+
+def test_monster_positions_match_bfs_map():
+    for map_file_path in sorted(glob.glob(os.path.join(MAPS_DIRECTORY, '*.txt'))):
+        game_map = Map(map_file_path)
+        for player_position in game_map.get_player_valid_positions():
+            game_map.set_player_position(player_position)
+            (row, col) = player_position
+            expected = [
+                (row + dx, col + dy) for (dx, dy) in MONSTER_OFFSETS
+                if game_map.is_in_matrix(row + dx, col + dy)
+                and game_map.bfs_map[row + dx][col + dy] > 0
+                and game_map.is_exit_reachable_with_monster((row + dx, col + dy))
+            ]
+            assert game_map.get_monster_valid_positions() == expected
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_shortest_paths_match_bfs(seed):
+    rng = random.Random(seed)
+    graph = generate_graph(rng, rng.randint(1, 25), rng.randint(1, 25), rng.choice((0.2, 0.35, 0.5)))
+    assert_distances_match_bfs(rng, graph, rng.choice((2, 3, 5, 16)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_maze_shortest_paths_match_bfs(seed):
+    rng = random.Random(seed)
+    graph = generate_maze(rng, rng.randrange(5, 31, 2), rng.randrange(5, 31, 2), rng.randint(0, 12))
+    assert_distances_match_bfs(rng, graph, rng.choice((2, 3, 4, 8)))
+
+
+def test_shortest_path_along_a_loop():
+    # a ring of corridor cells around a wall block, without any junction
+    walls = bytearray(b'\x01' * 5 + b'\x01\x00\x00\x00\x01' + b'\x01\x00\x01\x00\x01'
+                      + b'\x01\x00\x00\x00\x01' + b'\x01' * 5)
+    graph = MapGraph((5, 5), walls, bytearray(25))
+    junction_graph = JunctionGraph(graph, cluster_size=2)
+
+    for start in range(25):
+        distances = graph.get_distances([start]) if not walls[start] else None
+        for target in range(25):
+            expected = -1 if walls[start] or walls[target] else distances[target]
+            assert junction_graph.get_distance(start, target) == expected, (start, target)
+
+
+def test_shortest_paths_on_the_maps():
+    rng = random.Random(40)
+    for map_file_path in sorted(glob.glob(os.path.join(MAPS_DIRECTORY, '*.txt'))):
+        graph = Map(map_file_path).get_graph()
+        assert_distances_match_bfs(rng, graph, 4)
@@ -0,0 +1,81 @@
+import random
+
+from lib.game.server.leaderboard import FenwickTree, Leaderboard
+
+
+def test_fenwick_tree_matches_brute_force():
+    generator = random.Random(36)
+
+    for size in (1, 2, 7, 8, 9, 100):
+        counts = [generator.choice((0, 0, 1, 3)) for _ in range(size)]
+        tree = FenwickTree(size)
+        for index, count in enumerate(counts):
+            tree.add(index, count)
+
+        assert tree.tree == FenwickTree.from_counts(counts).tree
+        assert tree.prefix_sum(-1) == 0
+
+        for index in range(size):
+            assert tree.prefix_sum(index) == sum(counts[:index + 1])
+
+        for k in range(1, sum(counts) + 1):
+            expected = next(index for index in range(size) if sum(counts[:index + 1]) >= k)
+            assert tree.find(k) == expected
+
+
+def test_fenwick_tree_find_after_removal():
+    tree = FenwickTree(16)
+    for index in (3, 3, 10, 15):
+        tree.add(index, 1)
+
+    tree.add(3, -2)
+    assert tree.find(1) == 10
+    assert tree.find(2) == 15
+
+
+def test_leaderboard_ranks_and_top():
+    leaderboard = Leaderboard(max_steps=100)
+
+    assert leaderboard.record('alice', 12)
+    assert leaderboard.record('bob', 7)
+    assert leaderboard.record('carol', 12)
+    # only the best result of a player counts
+    assert not leaderboard.record('bob', 9)
+    assert leaderboard.record('alice', 5)
+    # results above max_steps are recorded as max_steps
+    assert leaderboard.record('dave', 1000)
+
+    assert leaderboard.get_rank('alice') == (1, 5)
+    assert leaderboard.get_rank('bob') == (2, 7)
+    assert leaderboard.get_rank('carol') == (3, 12)
+    assert leaderboard.get_rank('dave') == (4, 100)
+    assert leaderboard.get_rank('eve') is None
+
+    assert leaderboard.get_top(3) == [(1, 'alice', 5), (2, 'bob', 7), (3, 'carol', 12)]
+    assert len(leaderboard.get_top(10)) == 4
+
+
+def test_leaderboard_ties_share_their_rank():
+    leaderboard = Leaderboard(max_steps=100)
+    for name in ('alice', 'bob', 'carol'):
+        leaderboard.record(name, 8)
+    leaderboard.record('dave', 9)
+
+    assert leaderboard.get_top(4) == [(1, 'alice', 8), (1, 'bob', 8), (1, 'carol', 8), (4, 'dave', 9)]
+    assert leaderboard.get_rank('dave') == (4, 9)
+
+
+def test_leaderboard_snapshot(tmp_path):
+    path = str(tmp_path / 'leaderboard.bin')
+    leaderboard = Leaderboard(max_steps=100)
+    assert not leaderboard.load(path)
+
+    for name, steps in (('alice', 12), ('bob', 7), ('carol', 12), ('bob', 9)):
+        leaderboard.record(name, steps)
+    leaderboard.save(path)
+
+    loaded = Leaderboard(max_steps=100)
+    assert loaded.load(path)
+    assert loaded.games == 4
+    assert loaded.get_top(3) == leaderboard.get_top(3)
+    assert loaded.get_rank('carol') == (2, 12)
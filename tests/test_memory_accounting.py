@@ -0,0 +1,90 @@
+import importlib.util
+import socket
+import sys
+import threading
+
+import pytest
+
+from lib.game.server import memory_accounting
+from lib.game.server.memory_accounting import DEFAULT_THREAD_STACK_ESTIMATE, MemoryBudget, get_socket_buffer_size, \
+    get_thread_stack_size
+
+
+class IdleSession:
+    def __init__(self, last_activity):
+        self.last_activity = last_activity
+
+
+def test_thread_stack_is_charged_its_resident_estimate():
+    assert get_thread_stack_size() == DEFAULT_THREAD_STACK_ESTIMATE
+    assert get_thread_stack_size(1024) == 1024
+
+    # a stack size set explicitly is charged as it is
+    previous = threading.stack_size(256 * 1024)
+    try:
+        assert get_thread_stack_size() == 256 * 1024
+    finally:
+        threading.stack_size(previous)
+
+
+@pytest.mark.skipif(memory_accounting.fcntl is None, reason='the socket queues are only counted on POSIX')
+def test_socket_queues_are_counted():
+    (client, server) = socket.socketpair()
+    try:
+        client.sendall(b'x' * 100)
+        assert get_socket_buffer_size(server) == 100
+    finally:
+        client.close()
+        server.close()
+
+
+def test_import_without_posix_modules(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'fcntl', None)
+    monkeypatch.setitem(sys.modules, 'termios', None)
+    spec = importlib.util.spec_from_file_location('memory_accounting_without_posix', memory_accounting.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    (client, server) = socket.socketpair()
+    try:
+        client.sendall(b'x' * 100)
+        assert module.get_socket_buffer_size(server) == 0
+    finally:
+        client.close()
+        server.close()
+
+
+def test_budget_keeps_a_running_total():
+    budget = MemoryBudget(limit=1000)
+    budget.update('a', 300)
+    budget.update('b', 500)
+    budget.update('a', 400)
+    assert budget.usage == 900
+    assert not budget.is_exceeded(budget.usage)
+
+    budget.update('c', 100)
+    assert budget.is_exceeded(budget.usage)
+
+    budget.remove('b')
+    budget.remove('unknown')
+    assert budget.usage == 500
+    assert sorted(budget.get_footprints()) == [('a', 400), ('c', 100)]
+
+
+def test_no_budget_is_never_exceeded():
+    assert not MemoryBudget().is_exceeded(10 ** 12)
+    with pytest.raises(ValueError):
+        MemoryBudget(policy='drop')
+
+
+def test_evictions_close_the_longest_idle_sessions_first():
+    budget = MemoryBudget(limit=1000, policy='evict', min_idle=30)
+    (old, older, busy) = (IdleSession(50), IdleSession(10), IdleSession(95))
+    footprints = [(old, 300), (older, 200), (busy, 700)]
+
+    assert budget.choose_evictions(footprints, 1150, now=100) == [older]
+    # the budget is exceeded when the usage reaches the limit
+    assert budget.choose_evictions(footprints, 1200, now=100) == [older, old]
+    # closing every idle session would not be enough
+    assert budget.choose_evictions(footprints, 1600, now=100) == []
+    assert MemoryBudget(limit=1000).choose_evictions(footprints, 1200, now=100) == []
@@ -0,0 +1,150 @@
+import socket
+import threading
+
+import pytest
+
+from lib.game.server.multiplexing_game_server import MultiplexingGameServer
+from lib.map.map_repository import map_repository
+
+
+class Client:
+    """
+    Client sending framed requests (one per line) and reading the framed responses
+    """
+
+    def __init__(self, port):
+        self.client_socket = socket.create_connection(('127.0.0.1', port), timeout=5)
+        self.reader = self.client_socket.makefile('rb')
+
+    def send(self, *requests):
+        self.client_socket.sendall(b''.join(request.encode() + b'\n' for request in requests))
+
+    def receive(self):
+        return self.reader.readline().decode().strip()
+
+    def ask(self, *requests):
+        self.send(*requests)
+        return [self.receive() for _ in requests]
+
+    def close(self):
+        self.reader.close()
+        self.client_socket.close()
+
+
+@pytest.fixture
+def start_server():
+    map_repository.preload()
+    clients = []
+
+    def start(**options):
+        server = MultiplexingGameServer(port=0, **options)
+        threading.Thread(target=server.run, daemon=True).start()
+        port = server.server_socket.getsockname()[1]
+
+        def connect():
+            clients.append(Client(port))
+            return clients[-1]
+
+        return server, connect
+
+    yield start
+    for client in clients:
+        client.close()
+
+
+def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return True
+        threading.Event().wait(0.01)
+    return False
+
+
+@pytest.mark.parametrize('dispatch_mode', ['thread', 'pool'])
+def test_rate_limit_answers_busy(start_server, dispatch_mode):
+    (_, connect) = start_server(rate_limit=0.001, rate_burst=3, dispatch_mode=dispatch_mode)
+    client = connect()
+
+    responses = client.ask('START 1', 'UP', 'UP', 'UP')
+    assert responses[0] == 'GAME_STARTED'
+    assert responses[3] == 'BUSY'
+    # STOP is always allowed
+    client.send('STOP')
+    assert client.client_socket.recv(16) == b''
+
+
+def test_admission_queues_then_rejects(start_server):
+    (server, connect) = start_server(max_clients=1, max_pending=1)
+    first = connect()
+    assert first.ask('START 1') == ['GAME_STARTED']
+
+    pending = connect()
+    assert wait_for(lambda: server.admission_control.get_stats() == (1, 1))
+    pending.send('START 2')
+
+    # the pending queue is full as well
+    rejected = connect()
+    assert rejected.receive() == 'BUSY'
+    assert rejected.client_socket.recv(16) == b''
+
+    # the slot of the first client goes to the pending one, which gets the answer of its buffered request
+    first.close()
+    assert pending.receive() == 'GAME_STARTED'
+    assert server.admission_control.get_stats() == (1, 0)
+
+
+
+def test_pending_client_waits_a_bounded_time(start_server):
+    (server, connect) = start_server(max_clients=1, max_pending=1, max_pending_wait=0.2)
+    first = connect()
+    assert first.ask('START 1') == ['GAME_STARTED']
+
+    pending = connect()
+    assert pending.receive() == 'BUSY'
+    assert pending.client_socket.recv(16) == b''
+    assert server.admission_control.get_stats() == (1, 0)
+
+
+@pytest.mark.parametrize('dispatch_mode', ['thread', 'pool'])
+def test_tagged_games_lifecycle(start_server, dispatch_mode):
+    (server, connect) = start_server(max_clients=1, max_connection_games=2, dispatch_mode=dispatch_mode)
+    client = connect()
+
+    assert client.ask('@a START 1', '@b START 2') == ['@a GAME_STARTED', '@b GAME_STARTED']
+    # the tagged games do not take admission slots, max_connection_games caps them
+    assert server.admission_control.get_stats() == (1, 0)
+    assert client.ask('@c START 3') == ['@c BUSY']
+    assert len(server.client_sessions) == 3
+
+    # a bare tag does not open a game
+    assert client.ask('@d') == ['@d ERROR']
+    assert len(server.client_sessions) == 3
+
+    # a tagged game is over, the connection and its other games go on
+    # the game is disposed once its STOP is answered
+    assert client.ask('@a STOP') == ['@a OK']
+    assert wait_for(lambda: len(server.client_sessions) == 2)
+    assert client.ask('@b SEND_PLAYER_DETAILS')[0].startswith('@b ')
+    assert client.ask('@c START 3') == ['@c GAME_STARTED']
+    assert client.ask('START 4') == ['GAME_STARTED']
+
+    # closing the connection disposes all its games
+    client.close()
+    assert wait_for(lambda: len(server.client_sessions) == 0)
+    assert server.admission_control.get_stats() == (0, 0)
+
+
+def test_tagged_games_bring_their_own_rate_budget(start_server):
+    (server, connect) = start_server(rate_limit=0.001, rate_burst=2, max_connection_games=100)
+    client = connect()
+
+    responses = client.ask(*[f'@g{index} START {index}' for index in range(50)])
+    assert responses == [f'@g{index} GAME_STARTED' for index in range(50)]
+
+    # each game is still limited by its own bucket
+    assert client.ask('@g0 UP', '@g0 UP')[1] == '@g0 BUSY'
+
+    # the budget of a stopped game leaves the connection
+    connection = server.client_sessions[client.client_socket.getsockname()]
+    assert client.ask('@g1 STOP') == ['@g1 OK']
+    assert wait_for(lambda: connection.rate_limiter.capacity == 2 + 49 * 2)
@@ -0,0 +1,37 @@
+import cProfile
+import pstats
+
+from lib.game.server.profiler import Profiler, to_call_edges
+
+
+def leaf():
+    return sum(range(20000))
+
+
+def caller():
+    return leaf()
+
+
+def test_spans_are_dumped_as_collapsed_stacks(tmp_path):
+    profiler = Profiler(enabled=True, sample_rate=1.0, output_dir=str(tmp_path))
+    with profiler.request():
+        with profiler.span('dispatch'):
+            with profiler.span('move'):
+                pass
+
+    with open(profiler.dump_spans()) as file:
+        stacks = [line.rsplit(' ', 1)[0] for line in file]
+    assert stacks == ['handle_request', 'handle_request;dispatch', 'handle_request;dispatch;move']
+    assert profiler.span_totals == {}
+
+
+def test_capture_is_written_as_call_edges():
+    profile = cProfile.Profile()
+    profile.enable()
+    caller()
+    profile.disable()
+
+    edges = [line.split('\t') for line in to_call_edges(pstats.Stats(profile))]
+    assert all(len(edge) == 3 and int(edge[2]) > 0 for edge in edges)
+    # one caller -> callee pair per line, never a longer stack
+    assert any(caller_name.startswith('leaf (') and 'builtins.sum' in callee for (caller_name, callee, _) in edges)
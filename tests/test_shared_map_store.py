@@ -0,0 +1,100 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lib.map.map_repository import MAPS_DIRECTORY
+from lib.map.map_template import MapTemplate
+from lib.map.shared_map_store import SharedMapStore
+
+MAP_FILE_PATHS = sorted(glob.glob(os.path.join(MAPS_DIRECTORY, '*.txt')))
+
+GRAPH_ARRAYS = ('walls', 'exit_flags', 'exits', 'offsets', 'neighbors', 'move_targets')
+
+
+def describe(template):
+    """
+    JSON copy of the tables of a template, comparable across processes
+    """
+    graph = template.get_graph()
+    return {
+        'map_size': list(template.map_size),
+        'version': template.version,
+        'entity_map': [[entity.name for entity in row] for row in template.copy_entity_map()],
+        'bfs_map': [list(row) for row in template.bfs_map],
+        'positions': [list(position) for position in template.player_valid_positions],
+        'graph': {name: list(getattr(graph, name)) for name in GRAPH_ARRAYS},
+        'exit_distances': list(graph.get_distances(graph.exits)),
+    }
+
+
+def attach_and_describe(name):
+    """
+    Attach the published maps like another server process of the host would
+    """
+    store = SharedMapStore(name)
+    templates = store.attach()
+    try:
+        return None if templates is None else {path: describe(template) for path, template in templates.items()}
+    finally:
+        store.close()
+
+
+def attach_in_other_process(name):
+    """
+    Attach the maps from a separate interpreter: a child of this process would share its resource tracker,
+    which the attached segments are unregistered from
+    """
+    tests_directory = os.path.dirname(os.path.abspath(__file__))
+    code = (
+        f'import json, sys; sys.path[:0] = {[os.path.dirname(tests_directory), tests_directory]!r}; '
+        'from test_shared_map_store import attach_and_describe; '
+        'print(json.dumps(attach_and_describe(sys.argv[1])))'
+    )
+    result = subprocess.run([sys.executable, '-c', code, name], capture_output=True, check=True, text=True)
+    return json.loads(result.stdout)
+
+
+@pytest.fixture
+def publisher():
+    # a name per test process, so that concurrent runs never attach to each other's maps
+    store = SharedMapStore(f'test_maps_{os.getpid()}')
+    yield store
+    store.close()
+
+
+def test_attach_without_published_maps(publisher):
+    assert attach_in_other_process(publisher.name) is None
+
+
+def test_publish_and_attach(publisher):
+    templates = {path: MapTemplate(path) for path in MAP_FILE_PATHS}
+
+    published = publisher.publish(templates)
+    assert set(published) == set(templates)
+    # the maps are published once per host
+    assert SharedMapStore(publisher.name).publish(templates) is None
+
+    attached = attach_in_other_process(publisher.name)
+    assert set(attached) == set(templates)
+
+    for path, template in templates.items():
+        expected = describe(template)
+        assert describe(published[path]) == expected
+        # the attached graph is built over the arrays published in the segment
+        assert attached[path] == expected
+
+        game_map = published[path].create_map()
+        assert game_map.entity_map == template.entity_map
+
+
+def test_shared_templates_are_read_only(publisher):
+    template = publisher.publish({MAP_FILE_PATHS[0]: MapTemplate(MAP_FILE_PATHS[0])})[MAP_FILE_PATHS[0]]
+
+    with pytest.raises(TypeError):
+        template.bfs_map[0][0] = 0
+    with pytest.raises(TypeError):
+        template.get_graph().neighbors[0] = 0
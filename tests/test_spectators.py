@@ -0,0 +1,103 @@
+import os
+import socket
+
+import pytest
+
+from lib.game.server.client_session import ClientSession
+from lib.game.server.spectators import SpectatorStream, encode_grid, encode_runs, encode_snapshot, \
+    encode_template_grid
+from lib.map.chunked_map import ChunkedMap
+from lib.map.map_repository import MAPS_DIRECTORY
+from lib.map.map_template import MapTemplate
+
+MAP_FILE_PATH = os.path.join(MAPS_DIRECTORY, 'map1.txt')
+
+
+class ImmediateHub:
+    """
+    Hub flushing the notified streams right away, instead of on a writer thread
+    """
+
+    def notify(self, stream):
+        stream.flush()
+
+
+@pytest.fixture
+def spectator():
+    (client, server) = socket.socketpair()
+    session = ClientSession(server, ('127.0.0.1', 50000))
+    # the events are only pushed to the clients which frame their messages
+    session.receive_buffer.framed = True
+    yield client, session
+    client.close()
+    server.close()
+
+
+def decode_runs(encoded):
+    characters = []
+    count = ''
+    for character in encoded:
+        if character.isdigit():
+            count += character
+        else:
+            characters.append(character * int(count or 1))
+            count = ''
+    return ''.join(characters)
+
+
+@pytest.mark.parametrize('characters', ['', '#', '###.EE', '.#.#', '#' * 12 + '.E', '.' * 100 + '#'])
+def test_encode_runs(characters):
+    assert decode_runs(encode_runs(characters)) == characters
+
+
+def test_encode_runs_omits_single_counts():
+    assert encode_runs('###.EE') == '3#.2E'
+
+
+def test_template_grid_is_cached_by_version():
+    template = MapTemplate(MAP_FILE_PATH)
+    grid = encode_template_grid(template)
+    assert grid == encode_grid(template.entity_map)
+    assert encode_template_grid(template) is grid
+
+    # a reloaded template is encoded again
+    reloaded = MapTemplate(MAP_FILE_PATH)
+    reloaded.version += 1
+    assert encode_template_grid(reloaded) is not grid
+
+
+def test_encode_snapshot():
+    game_map = MapTemplate(MAP_FILE_PATH).create_map()
+    game_map.seed = 42
+    game_map.set_player_position((1, 2))
+
+    fields = encode_snapshot(game_map).decode().split()
+    (rows, cols) = game_map.map_size
+    assert fields[:8] == ['SPECTATE_SNAPSHOT', str(rows), str(cols), '42', '1', '2', '-1', '-1']
+    assert len(decode_runs(fields[8])) == rows * cols
+
+
+def test_stream_sends_snapshot_events_and_end(spectator):
+    (client, session) = spectator
+    game_map = MapTemplate(MAP_FILE_PATH).create_map()
+    stream = SpectatorStream(ImmediateHub(), ('127.0.0.1', 50001))
+    stream.reset(game_map)
+    stream.subscribe(session)
+
+    game_map.set_player_position((1, 2))
+    stream.close()
+
+    lines = client.recv(4096).decode().splitlines()
+    assert lines[0].startswith('SPECTATE_SNAPSHOT')
+    assert lines[1:] == ['SPECTATE_DELTA P 1 2', 'SPECTATE_DELTA END']
+    assert len(stream.subscribers) == 0
+
+
+def test_chunked_games_are_not_streamed(spectator):
+    (client, session) = spectator
+    stream = SpectatorStream(ImmediateHub(), ('127.0.0.1', 50001))
+    stream.subscribe(session)
+    stream.reset(ChunkedMap(MAP_FILE_PATH))
+
+    assert stream.game_map is None
+    assert client.recv(4096) == b'SPECTATE_DELTA END\n'
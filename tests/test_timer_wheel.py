@@ -0,0 +1,64 @@
+from lib.tcp.timer_wheel import TimerWheel
+
+
+def test_timer_expires_at_its_deadline_tick():
+    wheel = TimerWheel(tick=0.1, slots=8, now=100.0)
+    wheel.schedule('a', 0.25)
+
+    assert wheel.advance(100.25) == []
+    assert wheel.advance(100.3) == ['a']
+    assert len(wheel) == 0
+    # an expired timer only fires once
+    assert wheel.advance(101.0) == []
+
+
+def test_delay_shorter_than_a_tick_waits_for_the_next_tick():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule('a', 0.0)
+
+    assert wheel.advance(0.5) == []
+    assert wheel.advance(1.0) == ['a']
+
+
+def test_reschedule_moves_the_timer():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule('a', 2)
+    wheel.advance(1.0)
+    # e.g. the client sent a request: its idle timeout starts again from the current tick
+    wheel.schedule('a', 3)
+
+    assert len(wheel) == 1
+    assert wheel.advance(3.0) == []
+    assert wheel.advance(4.0) == ['a']
+
+
+def test_timers_of_later_rounds_stay_in_their_slot():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.schedule('soon', 1)
+    # same slot as 'soon', three rounds later
+    wheel.schedule('late', 13)
+
+    assert wheel.advance(1.0) == ['soon']
+    assert wheel.advance(12.0) == []
+    assert wheel.advance(13.0) == ['late']
+
+
+def test_cancel():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule('a', 1)
+    wheel.schedule('b', 1)
+    wheel.cancel('a')
+    # cancelling an unknown key is a no-op
+    wheel.cancel('c')
+
+    assert wheel.advance(5.0) == ['b']
+
+
+def test_advance_over_many_ticks():
+    wheel = TimerWheel(tick=1.0, slots=16)
+    for index in range(100):
+        wheel.schedule(index, index + 1)
+
+    expired = wheel.advance(50.0)
+    assert sorted(expired) == list(range(50))
+    assert sorted(wheel.advance(1000.0)) == list(range(50, 100))